@@ -17,6 +17,7 @@ setup(
     url="https://github.com/stikkireddy/uc-functions",
     packages=find_packages(),
     install_requires=["astor", "databricks-sdk>=0.18.0", "black", "pyflakes"],
+    extras_require={"arrow": ["pyarrow"], "validation": ["hypothesis"]},
     setup_requires=["setuptools_scm"],
     use_scm_version=True,
     classifiers=[
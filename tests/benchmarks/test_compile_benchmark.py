@@ -0,0 +1,74 @@
+from uc_functions.benchmarks.compile import (
+    SCENARIOS,
+    BenchmarkResult,
+    PhaseResult,
+    SyntheticTreeConfig,
+    check_regressions,
+    generate_source_tree,
+    load_entries,
+    main,
+    run_scenario,
+    unload_package,
+)
+
+
+def test_generate_source_tree(tmp_path):
+    config = SyntheticTreeConfig(files=2, functions_per_file=2, shared_ratio=0.0)
+    entries = generate_source_tree(str(tmp_path), config, package="uc_bench_test")
+    try:
+        functions = load_entries(str(tmp_path), entries)
+        assert [f.__name__ for f in functions] == [
+            "fn_0_0",
+            "fn_0_1",
+            "fn_1_0",
+            "fn_1_1",
+        ]
+        # depth 2 with fan out 2 calls 4 leaves truncating to 8 characters each
+        assert functions[0]("abcdefghij") == "abcdefgh" * 4
+    finally:
+        unload_package("uc_bench_test")
+
+
+def test_run_scenario():
+    result = run_scenario(
+        "tiny", SyntheticTreeConfig(files=1, functions_per_file=2), repeat=1
+    )
+    assert result.functions == 2
+    assert set(result.phases) == {"index", "resolve", "inline", "format", "compile"}
+    assert all(phase.seconds > 0 for phase in result.phases.values())
+    assert all(phase.peak_bytes > 0 for phase in result.phases.values())
+
+
+def test_check_regressions():
+    result = BenchmarkResult(
+        scenario="small",
+        config={},
+        functions=1,
+        phases={
+            "index": PhaseResult(seconds=1.0, peak_bytes=100),
+            "inline": PhaseResult(seconds=2.0, peak_bytes=100),
+        },
+    )
+    baseline = {
+        "small": {
+            "phases": {
+                "index": {"seconds": 0.9, "peak_bytes": 100},
+                "inline": {"seconds": 1.0, "peak_bytes": 50},
+            }
+        }
+    }
+    regressions = check_regressions([result], baseline, threshold=0.25)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("small.inline.seconds")
+    assert check_regressions([result], {}, threshold=0.25) == []
+
+
+def test_main_baseline(tmp_path, monkeypatch):
+    monkeypatch.setitem(
+        SCENARIOS, "small", SyntheticTreeConfig(files=1, functions_per_file=1)
+    )
+    baseline = str(tmp_path / "baseline.json")
+    args = ["--scenario", "small", "--repeat", "1", "--baseline", baseline]
+    assert main([*args, "--update-baseline"]) == 0
+    # a generous threshold so that noise does not fail the test
+    assert main([*args, "--threshold", "100"]) == 0
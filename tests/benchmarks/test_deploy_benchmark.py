@@ -0,0 +1,85 @@
+import pytest
+
+from uc_functions.benchmarks.deploy import (
+    StubConfig,
+    latency_distribution,
+    main,
+    run_benchmark,
+)
+from uc_functions.emulator import EmulatedWorkspaceClient
+from uc_functions.functions import run_sql
+
+
+def test_latency_distribution():
+    assert latency_distribution("fixed:0.5")() == 0.5
+    uniform = latency_distribution("uniform:0.1:0.2", seed=1)
+    assert all(0.1 <= uniform() <= 0.2 for _ in range(100))
+    lognormal = latency_distribution("lognormal:0.1:0.5", seed=1)
+    assert all(lognormal() > 0 for _ in range(100))
+    for spec in ("fixed", "uniform:1", "normal:1:2", "fixed:a"):
+        with pytest.raises(ValueError):
+            latency_distribution(spec)
+
+
+def test_emulator_injected_failures_and_rate_limit():
+    statement = "DROP FUNCTION IF EXISTS foo.bar.missing"
+    with EmulatedWorkspaceClient(failure_rate=1.0) as ws_client:
+        with pytest.raises(ValueError):
+            run_sql(ws_client, "local", statement)
+    with EmulatedWorkspaceClient(rate_limit=10) as ws_client:
+        for _ in range(3):
+            run_sql(ws_client, "local", statement)
+        assert ws_client.throttled == 2
+    with pytest.raises(ValueError):
+        EmulatedWorkspaceClient(failure_rate=2)
+
+
+def test_run_benchmark():
+    results = run_benchmark(
+        functions=3,
+        concurrency_levels=[1, 2],
+        stub=StubConfig(latency="fixed:0.01", max_wait=0),
+        calls=4,
+        chunk_size=5,
+    )
+    assert [(r.operation, r.concurrency) for r in results] == [
+        ("deploy", 1),
+        ("run_sql", 1),
+        ("remote", 1),
+        ("remote_map", 1),
+        ("deploy", 2),
+        ("run_sql", 2),
+        ("remote", 2),
+        ("remote_map", 2),
+    ]
+    by_operation = {r.operation: r for r in results if r.concurrency == 1}
+    # a drop and a create statement per function
+    assert by_operation["deploy"].statements == 6
+    assert by_operation["remote"].statements == 4
+    assert by_operation["remote_map"].operations == 20
+    assert by_operation["remote_map"].statements == 4
+    for result in results:
+        assert result.failures == 0
+        # the server never waits so every statement is polled at least once
+        assert result.polls_per_statement >= 1
+        assert result.throughput > 0
+
+
+def test_run_benchmark_counts_failures():
+    results = run_benchmark(
+        functions=2,
+        concurrency_levels=[2],
+        stub=StubConfig(latency="fixed:0", failure_rate=1.0),
+        operations=["run_sql"],
+        calls=3,
+    )
+    assert results[0].statements == 3
+    assert results[0].failures == 3
+    with pytest.raises(ValueError):
+        run_benchmark(operations=["unknown"])
+
+
+def test_main(capsys):
+    args = ["--functions", "2", "--concurrency", "2", "--operation", "run_sql"]
+    assert main(args + ["--latency", "fixed:0", "--rate-limit", "1000"]) == 0
+    assert "run_sql" in capsys.readouterr().out
@@ -0,0 +1,75 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+from uc_functions.benchmarks.runtime import (
+    benchmark_function,
+    main,
+    run_benchmark,
+    sample_inputs,
+)
+from uc_functions.functions import FunctionDeployment
+
+samples_dir = str(Path(__file__).parent.parent / "samples")
+
+
+def deployment():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+    from samples.redact_with_secret import redact_w_secret
+    from samples.split_words import CountChars, split_words
+
+    for function in (redact, redact_w_secret, split_words, CountChars):
+        uc.register(function)
+    return uc
+
+
+def test_run_benchmark():
+    uc = deployment()
+    results = run_benchmark(
+        uc, {"redact": [('{"email": "a"}',), ("not json",)]}, number=10, repeat=1
+    )
+    assert [r.function for r in results] == [
+        "redact",
+        "redact_w_secret",
+        "split_words",
+        "CountChars",
+    ]
+    assert results[0].inputs == 2
+    for result in results:
+        assert result.original_seconds > 0
+        assert result.inlined_seconds > 0
+        assert result.inlined_peak_bytes > 0
+        assert result.overhead_ratio > 0
+    assert sample_inputs(uc, "redact_w_secret") == [("sample",)]
+
+
+def test_benchmark_function_flags_slow_bodies():
+    uc = deployment()
+    inputs = [("a email",)]
+    slow = benchmark_function(uc, "split_words", inputs, number=5, threshold=0)
+    assert slow.flagged
+    fast = benchmark_function(uc, "split_words", inputs, number=5, threshold=1e9)
+    assert not fast.flagged
+    with pytest.raises(ValueError):
+        benchmark_function(uc, "split_words", [])
+
+
+def test_main(tmp_path, monkeypatch, capsys):
+    module = tmp_path / "runtime_entrypoint.py"
+    module.write_text(
+        "from uc_functions import FunctionDeployment\n"
+        "from samples.redact import redact\n"
+        f"uc = FunctionDeployment('foo', 'bar', root_dir={samples_dir!r})\n"
+        "uc.register(redact)\n"
+    )
+    inputs = tmp_path / "inputs.json"
+    inputs.write_text(json.dumps({"redact": [["x"]]}))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    args = ["runtime_entrypoint:uc", "--inputs", str(inputs), "--number", "5"]
+    assert main(args + ["--threshold", "1e9"]) == 0
+    assert "redact" in capsys.readouterr().out
+    assert main(args + ["--threshold", "0"]) == 1
+    sys.modules.pop("runtime_entrypoint")
@@ -1,9 +1,28 @@
+import asyncio
+import json
 import os
+import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
-from uc_functions.functions import FunctionDeployment
+import pytest
+from databricks.sdk.service.sql import (
+    ResultData,
+    StatementParameterListItem,
+    StatementResponse,
+    StatementState,
+    StatementStatus,
+)
+
+from uc_functions.functions import (
+    DeploymentError,
+    FunctionDeployment,
+    SizeBudgetError,
+    Target,
+)
 
 samples_dir = str(Path(__file__).parent.parent / "samples")
 
@@ -164,3 +183,1087 @@ def test_deploy():
         mock_run_sql.call_args_list[1].args[2].startswith(
             f"CREATE OR REPLACE FUNCTION "
         )
+
+
+EXPECTED_PANDAS_UDFS = """
+@pandas_udf("STRING")
+def redact(maybe_json: pd.Series) -> pd.Series:
+    return pd.Series([_redact(_maybe_json) for _maybe_json in maybe_json])
+"""
+
+EXPECTED_PANDAS_UDFS_W_SECRET = """
+def redact_w_secret(secret=None):
+    if secret is None:
+        secret = _secret("my-scope", "my-key")
+"""
+
+
+def test_compile_pandas_udfs(tmp_path):
+    uc = FunctionDeployment(
+        "foo", "bar", root_dir=samples_dir, compile_sql_dir=str(tmp_path)
+    )
+    from samples.redact import redact
+    from samples.redact_with_secret import redact_w_secret
+
+    uc.register(redact)
+    uc.register(redact_w_secret)
+    path = uc.compile_pandas_udfs()
+
+    assert path.name == f"{CATALOG}_{SCHEMA}_pandas_udfs.py"
+    module_code = path.read_text()
+    # the generated module must be valid python even without pyspark installed
+    compile(module_code, str(path), "exec")
+    assert "def _redact(maybe_json):" in module_code
+    assert EXPECTED_PANDAS_UDFS.strip() in module_code
+    assert "def _redact_w_secret(maybe_json, secret):" in module_code
+    assert EXPECTED_PANDAS_UDFS_W_SECRET.strip() in module_code
+
+
+def test_pandas_udfs_skip_functions_without_column_arguments(tmp_path):
+    (tmp_path / "no_args.py").write_text(
+        "def answer() -> int:\n    return 42\n\n\n"
+        "def double(value: int) -> int:\n    return value * 2\n"
+    )
+    sys.path.insert(0, str(tmp_path))
+    try:
+        import no_args
+    finally:
+        sys.path.remove(str(tmp_path))
+    uc = FunctionDeployment("foo", "bar", root_dir=str(tmp_path))
+    uc.register(no_args.answer)
+    uc.register(no_args.double)
+
+    module_code = uc.generate_pandas_udf_module()
+    compile(module_code, "no_args_pandas_udfs.py", "exec")
+    assert "def double(value: pd.Series)" in module_code
+    assert "def answer(" not in module_code
+    with pytest.raises(ValueError, match="no column arguments"):
+        next(uc.get_function("answer").generate_pandas_udf_code())
+
+
+def test_struct_arguments_and_results_are_dicts(tmp_path):
+    (tmp_path / "structs.py").write_text(
+        "from typing import TypedDict\n\n\n"
+        "class Address(TypedDict):\n    street: str\n    zip_code: int\n\n\n"
+        "def move(address: Address, zip_code: int) -> Address:\n"
+        '    return {"street": address["street"].upper(), "zip_code": zip_code}\n'
+    )
+    sys.path.insert(0, str(tmp_path))
+    try:
+        import structs
+    finally:
+        sys.path.remove(str(tmp_path))
+    uc = FunctionDeployment("foo", "bar", root_dir=str(tmp_path))
+    uc.register(structs.move)
+    uc.serialize_fn("move")
+    function = uc.get_function("move")
+    # the warehouse and the pandas udf both pass structs as plain dicts
+    address = {"street": "main", "zip_code": 1}
+    expected = {"street": "MAIN", "zip_code": 2}
+    assert function.load_inlined()(address, 2) == expected
+    namespace = {}
+    exec(next(function.generate_pandas_udf_code()), namespace)
+    assert namespace["_move"](address, 2) == expected
+
+
+def test_pandas_udf_row_function_matches_registered_function():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+
+    uc.register(redact)
+    uc.serialize_fn(redact.__name__)
+    row_function_code = next(uc.get_function("redact").generate_pandas_udf_code())
+    namespace = {}
+    exec(row_function_code, namespace)
+
+    data = '{"email": "foo", "other": "bar"}'
+    assert namespace["_redact"](data) == redact(data)
+
+
+def test_remote_statement_parameters():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+
+    reg = uc.register(redact)
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        mock_response = MagicMock()
+        mock_response.result.as_dict.return_value = {"data_array": [["ok"]]}
+        mock_run_sql.return_value = mock_response
+
+        payload = "it's a \\ 'quoted' " + "x" * 10_000
+        reg.remote(payload, workspace_client=MagicMock(), warehouse_id="abc")
+        reg.remote("other", workspace_client=MagicMock(), warehouse_id="abc")
+        # the statement text is constant, the values are bound as parameters
+        first, second = mock_run_sql.call_args_list
+        assert (
+            first.args[2]
+            == second.args[2]
+            == f"SELECT {CATALOG}.{SCHEMA}.redact(:maybe_json)"
+        )
+        assert first.kwargs["parameters"] == [
+            StatementParameterListItem(name="maybe_json", type="STRING", value=payload)
+        ]
+
+
+def test_register_table_functions():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.split_words import CountChars, split_words
+
+    reg = uc.register(split_words)
+    assert uc.register(CountChars) is CountChars
+    assert [row.word for row in reg("a email")] == ["a", "REDACTED"]
+
+    uc.compile()
+    for name, columns in [
+        ("split_words", "TABLE (position INTEGER, word STRING)"),
+        ("CountChars", "TABLE (char STRING, count INTEGER)"),
+    ]:
+        function = uc.get_function(name)
+        create_stmt = list(function.generate_create_statements())[0]
+        assert f"RETURNS {columns}\nLANGUAGE PYTHON\n" in create_stmt
+        assert f"HANDLER '_{name}_handler'" in create_stmt
+
+        # the udtf handler must yield tuples matching the declared columns
+        namespace = {}
+        exec(function.generate_udtf_handler_code(), namespace)
+        rows = list(namespace[f"_{name}_handler"]().eval("a email a"))
+        if name == "split_words":
+            assert rows == [(0, "a"), (1, "REDACTED"), (2, "a")]
+        else:
+            assert rows[1] == ("a", 3)
+            assert all(isinstance(row, tuple) for row in rows)
+
+
+def test_table_function_requires_row_type():
+    from typing import Iterator
+
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+
+    def numbers(n: int) -> Iterator[int]:
+        yield from range(n)
+
+    with pytest.raises(ValueError) as e:
+        uc.register(numbers)
+    assert "Unknown row type for table function" in str(e.value)
+
+
+def test_remote_table_function():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.split_words import split_words
+
+    reg = uc.register(split_words)
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        mock_response = MagicMock()
+        mock_response.result.as_dict.return_value = {
+            "data_array": [["0", "a"], ["1", "b"]]
+        }
+        mock_run_sql.return_value = mock_response
+
+        rows = reg.remote("a b", workspace_client=MagicMock(), warehouse_id="abc")
+        assert rows == [["0", "a"], ["1", "b"]]
+        assert (
+            mock_run_sql.call_args.args[2]
+            == f"SELECT * FROM {CATALOG}.{SCHEMA}.split_words(:text)"
+        )
+        assert mock_run_sql.call_args.kwargs["parameters"][0].value == "a b"
+
+
+def test_deploy_concurrently():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+    from samples.redact_with_secret import redact_w_secret
+
+    uc.register(redact)
+    uc.register(redact_w_secret)
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        uc.deploy(workspace_client=MagicMock(), warehouse_id="abc", concurrency=2)
+        stmts = [c.args[2] for c in mock_run_sql.call_args_list]
+        assert len(stmts) == 6
+        # the private function must exist before its secret wrapper
+        private_create = [
+            i for i, s in enumerate(stmts) if "FUNCTION foo.bar._redact_w_secret(" in s
+        ]
+        wrapper_create = [
+            i for i, s in enumerate(stmts) if "FUNCTION foo.bar.redact_w_secret(" in s
+        ]
+        assert private_create[0] < wrapper_create[0]
+
+
+def test_deploy_collects_errors():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+    from samples.redact_with_secret import redact_w_secret
+
+    uc.register(redact)
+    uc.register(redact_w_secret)
+
+    def failing_run_sql(ws_client, warehouse_id, stmt, **kwargs):
+        if "redact_w_secret" in stmt:
+            raise ValueError("Statement failed to execute")
+
+    with patch("uc_functions.functions.run_sql", side_effect=failing_run_sql):
+        with pytest.raises(DeploymentError) as e:
+            uc.deploy(workspace_client=MagicMock(), warehouse_id="abc", concurrency=2)
+    assert list(e.value.errors.keys()) == ["redact_w_secret"]
+
+
+def test_deploy_dependencies():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+    from samples.redact_with_secret import redact_w_secret
+
+    uc.register(redact)
+    uc.register(redact_w_secret)
+    uc.compile()
+    assert uc.get_dependencies("redact") == set()
+    # the private _redact_w_secret is not a separate registered function
+    assert uc.get_dependencies("redact_w_secret") == set()
+    assert uc.get_dependencies(
+        "redact_w_secret", ["RETURN SELECT foo.bar.redact(maybe_json);"]
+    ) == {"redact"}
+
+
+def test_aremote_and_adeploy():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+    from samples.redact_with_secret import redact_w_secret
+
+    reg = uc.register(redact)
+    uc.register(redact_w_secret)
+
+    async def fake_arun_sql(ws_client, warehouse_id, stmt, **kwargs):
+        mock_response = MagicMock()
+        mock_response.result.as_dict.return_value = {"data_array": [["ok"]]}
+        return mock_response
+
+    with patch(
+        "uc_functions.functions.arun_sql", side_effect=fake_arun_sql
+    ) as mock_arun_sql:
+        result = asyncio.run(
+            reg.aremote("data", workspace_client=MagicMock(), warehouse_id="abc")
+        )
+        assert result == "ok"
+        assert mock_arun_sql.call_args.args[2] == "SELECT foo.bar.redact(:maybe_json)"
+        assert mock_arun_sql.call_args.kwargs["parameters"][0].value == "data"
+
+    with patch(
+        "uc_functions.functions.arun_sql", side_effect=fake_arun_sql
+    ) as mock_arun_sql:
+        asyncio.run(
+            uc.adeploy(workspace_client=MagicMock(), warehouse_id="abc", concurrency=2)
+        )
+        assert mock_arun_sql.call_count == 6
+
+
+def test_adeploy_incremental():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+    from samples.redact_with_secret import redact_w_secret
+
+    reg = uc.register(redact)
+    uc.register(redact_w_secret)
+    uc.serialize_fn("redact")
+    comment = uc.get_function("redact").get_content_comment()
+
+    async def fake_arun_sql(ws_client, warehouse_id, stmt, **kwargs):
+        return MagicMock()
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql, patch(
+        "uc_functions.functions.arun_sql", side_effect=fake_arun_sql
+    ) as mock_arun_sql:
+        mock_run_sql.return_value = routines_response([["redact", comment]])
+        plan = asyncio.run(
+            uc.adeploy(
+                workspace_client=MagicMock(), warehouse_id="abc", incremental=True
+            )
+        )
+        # the catalog is read once, only the changed function is deployed
+        assert mock_run_sql.call_count == 1
+        assert plan.unchanged == ["redact"]
+        assert plan.created == ["redact_w_secret"]
+        stmts = [c.args[2] for c in mock_arun_sql.call_args_list]
+        assert stmts == plan.statements["redact_w_secret"]
+
+    # aremote resolves its target like remote
+    with pytest.raises(ValueError, match="Keyword arguments are not supported"):
+        asyncio.run(
+            reg.aremote(
+                "data", workspace_client=MagicMock(), warehouse_id="abc", unknown=1
+            )
+        )
+
+
+def routines_response(rows):
+    return StatementResponse(
+        statement_id="stmt-1",
+        status=StatementStatus(state=StatementState.SUCCEEDED),
+        result=ResultData(data_array=rows),
+    )
+
+
+def test_plan_and_apply():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+    from samples.redact_with_secret import redact_w_secret
+    from samples.split_words import split_words
+
+    uc.register(redact)
+    uc.register(redact_w_secret)
+    uc.register(split_words)
+    uc.serialize_fn("redact")
+    uc.serialize_fn("redact_w_secret")
+    redact_comment = uc.get_function("redact").get_content_comment()
+    secret_comment = uc.get_function("redact_w_secret").get_content_comment()
+    assert redact_comment.startswith("uc-functions:sha256=")
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        mock_run_sql.return_value = routines_response(
+            [
+                ["redact", redact_comment],
+                # the private function is missing so the wrapper is redeployed
+                ["redact_w_secret", secret_comment],
+                ["unrelated", None],
+            ]
+        )
+        plan = uc.plan(workspace_client=MagicMock(), warehouse_id="abc")
+        assert mock_run_sql.call_count == 1
+        assert "information_schema.routines" in mock_run_sql.call_args.args[2]
+        assert "routine_schema = 'bar'" in mock_run_sql.call_args.args[2]
+
+    assert plan.unchanged == ["redact"]
+    assert plan.replaced == ["redact_w_secret"]
+    assert plan.created == ["split_words"]
+    for stmts in plan.statements.values():
+        assert all(stmt.strip().startswith("CREATE OR REPLACE") for stmt in stmts)
+    assert f"COMMENT '{secret_comment}'" in plan.statements["redact_w_secret"][0]
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        uc.apply(plan, workspace_client=MagicMock(), warehouse_id="abc")
+        stmts = [c.args[2] for c in mock_run_sql.call_args_list]
+        assert len(stmts) == 3
+        assert not any("DROP FUNCTION" in stmt for stmt in stmts)
+
+
+def test_incremental_deploy_no_changes_is_one_query():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+
+    uc.register(redact)
+    uc.serialize_fn("redact")
+    comment = uc.get_function("redact").get_content_comment()
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        mock_run_sql.return_value = routines_response([["redact", comment]])
+        plan = uc.deploy(
+            workspace_client=MagicMock(), warehouse_id="abc", incremental=True
+        )
+        assert plan.is_empty()
+        assert mock_run_sql.call_count == 1
+
+
+def test_plan_drops_private_function_of_former_secret_wrapper():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+
+    uc.register(redact)
+    uc.serialize_fn("redact")
+    comment = uc.get_function("redact").get_content_comment()
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        # redact used a secret before so its private function is still deployed
+        mock_run_sql.return_value = routines_response(
+            [["redact", "uc-functions:sha256=old"], ["_redact", "old"]]
+        )
+        plan = uc.plan(workspace_client=MagicMock(), warehouse_id="abc")
+    assert plan.replaced == ["redact"]
+    assert plan.dropped == ["_redact"]
+    stmts = plan.statements["redact"]
+    assert stmts[0].strip().startswith("CREATE OR REPLACE FUNCTION foo.bar.redact(")
+    assert stmts[-1] == "DROP FUNCTION IF EXISTS foo.bar._redact;"
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        # an unchanged wrapper still gets its leftover private function dropped
+        mock_run_sql.return_value = routines_response(
+            [["redact", comment], ["_redact", "old"]]
+        )
+        plan = uc.plan(workspace_client=MagicMock(), warehouse_id="abc")
+    assert plan.unchanged == ["redact"]
+    assert plan.statements == {"redact": ["DROP FUNCTION IF EXISTS foo.bar._redact;"]}
+
+
+def test_incremental_deploy_of_one_function():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+    from samples.redact_with_secret import redact_w_secret
+
+    uc.register(redact)
+    uc.register(redact_w_secret)
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        mock_run_sql.return_value = routines_response([])
+        plan = uc.deploy(
+            workspace_client=MagicMock(),
+            warehouse_id="abc",
+            name="redact",
+            incremental=True,
+        )
+        stmts = [c.args[2] for c in mock_run_sql.call_args_list[1:]]
+    assert plan.created == ["redact"]
+    assert list(plan.statements) == ["redact"]
+    assert not any("redact_w_secret" in stmt for stmt in stmts)
+
+
+def test_remote_does_not_list_warehouses_when_warehouse_id_is_passed():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+
+    reg = uc.register(redact)
+    ws_client = MagicMock()
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        mock_response = MagicMock()
+        mock_response.result.as_dict.return_value = {"data_array": [["ok"]]}
+        mock_run_sql.return_value = mock_response
+        reg.remote("data", workspace_client=ws_client, warehouse_id="abc")
+        reg.remote("data", workspace_client=ws_client, warehouse_id="abc")
+    ws_client.warehouses.list.assert_not_called()
+
+
+def test_deploy_uses_pinned_warehouse():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir, warehouse_id="pinned")
+    from samples.redact import redact
+
+    uc.register(redact)
+    ws_client = MagicMock()
+    # warming is best effort, e.g. without permission to manage the warehouse
+    ws_client.warehouses.get.side_effect = PermissionError("no access")
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        uc.deploy(workspace_client=ws_client)
+        assert {c.args[1] for c in mock_run_sql.call_args_list} == {"pinned"}
+    ws_client.warehouses.list.assert_not_called()
+
+
+def test_session_client_is_shared():
+    ws_client = MagicMock()
+    uc = FunctionDeployment(
+        "foo", "bar", root_dir=samples_dir, workspace_client=ws_client
+    )
+    from samples.redact import redact
+
+    reg = uc.register(redact)
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        mock_response = MagicMock()
+        mock_response.result.as_dict.return_value = {"data_array": [["ok"]]}
+        mock_run_sql.return_value = mock_response
+        reg.remote("data", warehouse_id="abc")
+        uc.deploy(warehouse_id="abc")
+        assert all(c.args[0] is ws_client for c in mock_run_sql.call_args_list)
+
+
+def test_remote_map():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+
+    reg = uc.register(redact)
+    rows = [(f'{{"email": "{i}"}}',) for i in range(5)]
+
+    def fake_run_sql(ws_client, warehouse_id, stmt, parameters=None, **kwargs):
+        # answer out of order, remote_map must restore the input order
+        json_rows = json.loads(parameters[0].value)
+        data = [[str(r["_idx"]), r["maybe_json"].upper()] for r in reversed(json_rows)]
+        return StatementResponse(
+            statement_id="id",
+            status=StatementStatus(state=StatementState.SUCCEEDED),
+            result=ResultData(data_array=data),
+        )
+
+    with patch(
+        "uc_functions.functions.run_sql", side_effect=fake_run_sql
+    ) as mock_run_sql:
+        results = reg.remote_map(
+            rows,
+            chunk_size=2,
+            concurrency=2,
+            workspace_client=MagicMock(),
+            warehouse_id="abc",
+        )
+        assert results == [row[0].upper() for row in rows]
+        assert mock_run_sql.call_count == 3
+        # every chunk runs the same statement text
+        stmts = {call.args[2] for call in mock_run_sql.call_args_list}
+        assert stmts == {
+            f"SELECT _idx, {CATALOG}.{SCHEMA}.redact(`maybe_json`) "
+            "FROM (SELECT inline(from_json(:rows, "
+            "'ARRAY<STRUCT<`_idx`: INT, `maybe_json`: STRING>>'))) ORDER BY _idx"
+        }
+
+        assert reg.remote_map([], workspace_client=MagicMock()) == []
+        with pytest.raises(ValueError):
+            reg.remote_map(["not a tuple"], workspace_client=MagicMock())
+
+
+def test_remote_map_stream():
+    pa = pytest.importorskip("pyarrow")
+    from databricks.sdk.service.sql import ExternalLink
+
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+
+    reg = uc.register(redact)
+    rows = [(f"value {i}",) for i in range(5)]
+    chunks = {}
+
+    def fake_run_sql(ws_client, warehouse_id, stmt, parameters=None, **kwargs):
+        assert kwargs["result_format"].value == "ARROW_STREAM"
+        assert kwargs["disposition"].value == "EXTERNAL_LINKS"
+        json_rows = json.loads(parameters[0].value)
+        batch = pa.RecordBatch.from_pylist(
+            [{"_idx": r["_idx"], "value": r["maybe_json"]} for r in json_rows]
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        url = f"https://storage/{json_rows[0]['maybe_json']}"
+        chunks[url] = sink.getvalue().to_pybytes()
+        return StatementResponse(
+            statement_id="id",
+            status=StatementStatus(state=StatementState.SUCCEEDED),
+            result=ResultData(external_links=[ExternalLink(external_link=url)]),
+        )
+
+    with patch("uc_functions.functions.run_sql", side_effect=fake_run_sql), patch(
+        "uc_functions.results.download_link",
+        side_effect=lambda link, session: chunks[link.external_link],
+    ):
+        results = reg.remote_map(
+            rows,
+            chunk_size=2,
+            concurrency=2,
+            stream=True,
+            workspace_client=MagicMock(),
+            warehouse_id="abc",
+        )
+        assert list(results) == [row[0] for row in rows]
+
+    with pytest.raises(ValueError):
+        reg.remote("data", _stream=True, workspace_client=MagicMock())
+
+
+def test_remote_map_stream_closed_early_cancels_statements():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+
+    reg = uc.register(redact)
+    ws_client = MagicMock()
+    submitted = []
+    cancelled = []
+
+    def execute_statement(stmt, **kwargs):
+        statement_id = f"s{len(submitted)}"
+        submitted.append(statement_id)
+        # the first chunk finishes, the others keep running until cancelled
+        state = StatementState.SUCCEEDED if statement_id == "s0" else None
+        return StatementResponse(
+            statement_id=statement_id,
+            status=StatementStatus(state=state or StatementState.RUNNING),
+        )
+
+    def get_statement(statement_id):
+        state = StatementState.CANCELED if statement_id in cancelled else None
+        return StatementResponse(
+            statement_id=statement_id,
+            status=StatementStatus(state=state or StatementState.RUNNING),
+        )
+
+    ws_client.statement_execution.execute_statement.side_effect = execute_statement
+    ws_client.statement_execution.get_statement.side_effect = get_statement
+    ws_client.statement_execution.cancel_execution.side_effect = cancelled.append
+
+    with patch(
+        "uc_functions.functions.iter_arrow_rows",
+        side_effect=lambda ws, resp, prefetch: iter([(0, "a"), (1, "b")]),
+    ):
+        results = reg.remote_map(
+            [(f"value {i}",) for i in range(6)],
+            chunk_size=2,
+            stream=True,
+            workspace_client=ws_client,
+            warehouse_id="abc",
+        )
+        assert next(results) == "a"
+        while len(submitted) < 2:
+            time.sleep(0.01)
+        start = time.monotonic()
+        results.close()
+        assert time.monotonic() - start < 1
+
+    deadline = time.monotonic() + 5
+    while not cancelled and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # the running statement is cancelled, the queued one never starts
+    assert cancelled == ["s1"]
+    assert submitted == ["s0", "s1"]
+
+
+def test_remote_over_table():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+
+    reg = uc.register(redact)
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        mock_run_sql.return_value = StatementResponse(
+            statement_id="id",
+            status=StatementStatus(state=StatementState.SUCCEEDED),
+            result=ResultData(
+                data_array=[
+                    [
+                        "1000",
+                        "3",
+                        "2",
+                        '[{"count":990,"value":"a"},{"count":7,"value":"b"}]',
+                        "12",
+                        None,
+                    ]
+                ]
+            ),
+        )
+        evaluation = reg.remote_over_table(
+            "main.raw.events",
+            ["payload"],
+            sample=0.1,
+            reference_column="expected",
+            top_k=2,
+            workspace_client=MagicMock(),
+            warehouse_id="abc",
+        )
+
+    assert evaluation.row_count == 1000
+    assert evaluation.null_count == 3
+    assert evaluation.distinct_count == 2
+    assert evaluation.top_values == [("a", 990), ("b", 7)]
+    assert evaluation.reference_diff_count == 12
+    assert evaluation.compare_diff_count is None
+    # a single aggregate statement, the table is bound as a parameter
+    assert mock_run_sql.call_count == 1
+    stmt = mock_run_sql.call_args.args[2]
+    assert f"{CATALOG}.{SCHEMA}.redact(CAST(`payload` AS STRING)) AS output" in stmt
+    assert "`expected` AS reference" in stmt
+    assert "FROM IDENTIFIER(:table) TABLESAMPLE (10.0 PERCENT)" in stmt
+    assert "GROUP BY output" in stmt
+    assert mock_run_sql.call_args.kwargs["parameters"][0].value == "main.raw.events"
+
+    with pytest.raises(ValueError):
+        reg.remote_over_table("t", ["a", "b"], workspace_client=MagicMock())
+
+
+def test_remote_over_table_compare_to_is_quoted():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+
+    reg = uc.register(redact)
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        mock_run_sql.return_value = StatementResponse(
+            statement_id="id",
+            status=StatementStatus(state=StatementState.SUCCEEDED),
+            result=ResultData(data_array=[["1", "0", "1", "[]", None, "0"]]),
+        )
+        for compare_to, expected in [
+            ("redact_v1", f"{CATALOG}.{SCHEMA}.`redact_v1`("),
+            ("main.prev.redact", "`main`.`prev`.`redact`("),
+        ]:
+            reg.remote_over_table(
+                "t",
+                ["payload"],
+                compare_to=compare_to,
+                workspace_client=MagicMock(),
+                warehouse_id="abc",
+            )
+            assert expected in mock_run_sql.call_args.args[2]
+
+        for compare_to in [
+            "redact(payload)) AS compare FROM secrets --",
+            "main.prev.redact.extra",
+            "`redact`",
+        ]:
+            with pytest.raises(ValueError, match="Invalid function name"):
+                reg.remote_over_table(
+                    "t",
+                    ["payload"],
+                    compare_to=compare_to,
+                    workspace_client=MagicMock(),
+                    warehouse_id="abc",
+                )
+        assert mock_run_sql.call_count == 2
+
+
+def test_remote_cache():
+    from uc_functions.cache import RemoteResultCache
+
+    uc = FunctionDeployment(
+        "foo", "bar", root_dir=samples_dir, remote_cache=RemoteResultCache()
+    )
+    from samples.redact import redact
+
+    reg = uc.register(redact)
+
+    with patch("uc_functions.functions.run_sql") as mock_run_sql:
+        mock_response = MagicMock()
+        mock_response.result.as_dict.return_value = {"data_array": [["ok"]]}
+        mock_run_sql.return_value = mock_response
+
+        for _ in range(3):
+            assert reg.remote("a", workspace_client=MagicMock(), warehouse_id="abc")
+        reg.remote("b", workspace_client=MagicMock(), warehouse_id="abc")
+        assert mock_run_sql.call_count == 2
+
+        # redeploying drops the cached results of the function
+        uc.deploy(workspace_client=MagicMock(), warehouse_id="abc")
+        calls = mock_run_sql.call_count
+        reg.remote("a", workspace_client=MagicMock(), warehouse_id="abc")
+        assert mock_run_sql.call_count == calls + 1
+
+        # results are cached per workspace and warehouse
+        other_workspace = MagicMock()
+        other_workspace.config.host = "https://other.cloud.databricks.com"
+        reg.remote("a", workspace_client=MagicMock(), warehouse_id="def")
+        reg.remote("a", workspace_client=other_workspace, warehouse_id="abc")
+        assert mock_run_sql.call_count == calls + 3
+
+
+def test_statement_stats_are_bounded():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir, statement_stats_limit=2)
+    from samples.redact import redact
+
+    reg = uc.register(redact)
+    ws_client = MagicMock()
+    ws_client.statement_execution.execute_statement.return_value = StatementResponse(
+        statement_id="stmt-1",
+        status=StatementStatus(state=StatementState.SUCCEEDED),
+        result=ResultData(data_array=[["ok"]]),
+    )
+    for i in range(5):
+        reg.remote(f"value-{i}", workspace_client=ws_client, warehouse_id="abc")
+    # only the most recent statements are kept
+    assert len(uc.statement_stats) == 2
+    assert all(s.state == "SUCCEEDED" for s in uc.statement_stats)
+    uc.clear_statement_stats()
+    assert len(uc.statement_stats) == 0
+
+
+def test_load_inlined(tmp_path):
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact_with_secret import redact_w_secret
+    from samples.split_words import CountChars, split_words
+
+    for function in (redact_w_secret, split_words, CountChars):
+        uc.register(function)
+        uc.serialize_fn(function.__name__)
+    data = '{"email": "a", "other": "b"}'
+    inlined = uc.get_function("redact_w_secret").load_inlined()
+    assert inlined(data, secret="s") == redact_w_secret(data)
+    # table functions return the rows as tuples like the deployed handler
+    assert uc.get_function("split_words").load_inlined()("a email") == [
+        (0, "a"),
+        (1, "REDACTED"),
+    ]
+    assert uc.get_function("CountChars").load_inlined()("aab") == [("a", 2), ("b", 1)]
+
+
+def test_compile_bundle(tmp_path):
+    uc = FunctionDeployment(
+        "foo", "bar", root_dir=samples_dir, compile_sql_dir=str(tmp_path)
+    )
+    from samples.redact import redact
+    from samples.redact_with_secret import redact_w_secret
+    from samples.split_words import split_words
+
+    for function in (redact, redact_w_secret, split_words):
+        uc.register(function)
+    # pretend redact calls split_words so that it has to come after it
+    dependencies = {"redact": {"split_words"}}
+    with patch.object(
+        uc,
+        "get_dependencies",
+        side_effect=lambda name, stmts=None: dependencies.get(name, set()),
+    ):
+        with patch.object(
+            uc, "ensure_and_get_compile_dir", wraps=uc.ensure_and_get_compile_dir
+        ) as compile_dir:
+            uc.compile(bundle=True)
+        assert compile_dir.call_count == 1
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "foo.bar.bundle.sql",
+        "foo.bar.manifest.json",
+    ]
+    bundle = (tmp_path / "foo.bar.bundle.sql").read_text()
+    positions = [
+        bundle.index(f"-- function: {name}\n")
+        for name in ("redact_w_secret", "split_words", "redact")
+    ]
+    assert positions == sorted(positions)
+    # the private function of the secret wrapper is created first
+    assert bundle.index("FUNCTION foo.bar._redact_w_secret(") < bundle.index(
+        "FUNCTION foo.bar.redact_w_secret("
+    )
+
+    manifest = json.loads((tmp_path / "foo.bar.manifest.json").read_text())
+    assert [f["name"] for f in manifest["functions"]] == [
+        "redact_w_secret",
+        "split_words",
+        "redact",
+    ]
+    redact_manifest = manifest["functions"][2]
+    assert redact_manifest["signature"] == "redact(maybe_json STRING) RETURNS STRING"
+    assert redact_manifest["content_hash"] == uc.get_function("redact").content_hash()
+    assert redact_manifest["dependencies"] == ["split_words"]
+    assert redact_manifest["imports"] == ["json"]
+    assert redact_manifest["pure"] is True
+    assert redact_manifest["size_bytes"] > redact_manifest["inlined_size_bytes"] > 0
+    secret_manifest = manifest["functions"][0]
+    assert secret_manifest["secrets"] is True
+    assert secret_manifest["pure"] is False
+    assert [a["secret"] for a in secret_manifest["args"]] == [False, True]
+    assert manifest["functions"][1]["table_function"] is True
+
+    with pytest.raises(ValueError):
+        uc.compile(name="redact", bundle=True)
+
+
+def test_compile_creates_the_compile_dir_once(tmp_path):
+    uc = FunctionDeployment(
+        "foo", "bar", root_dir=samples_dir, compile_sql_dir=str(tmp_path / "out")
+    )
+    from samples.redact import redact
+    from samples.split_words import split_words
+
+    uc.register(redact)
+    uc.register(split_words)
+    with patch.object(
+        uc, "ensure_and_get_compile_dir", wraps=uc.ensure_and_get_compile_dir
+    ) as compile_dir:
+        uc.compile()
+    assert compile_dir.call_count == 1
+    assert len(list((tmp_path / "out").iterdir())) == 2
+
+
+def test_deploy_targets():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+    from samples.redact_with_secret import redact_w_secret
+
+    uc.register(redact)
+    uc.register(redact_w_secret)
+    dev, prod, broken = MagicMock(), MagicMock(), MagicMock()
+    executed = []
+
+    def run_sql(ws_client, warehouse_id, stmt, **kwargs):
+        if ws_client is broken:
+            raise ValueError("Statement failed to execute")
+        executed.append((ws_client, warehouse_id, stmt))
+
+    targets = [
+        Target("dev", "dev_catalog", "functions", dev, warehouse_id="w1"),
+        Target("prod", "prod_catalog", "functions", prod, warehouse_id="w2"),
+        Target("broken", "foo", "bar", broken, warehouse_id="w3"),
+    ]
+    with patch("uc_functions.functions.run_sql", side_effect=run_sql):
+        results = uc.deploy_targets(targets, concurrency=2)
+
+    assert list(results) == ["dev", "prod", "broken"]
+    assert results["dev"].succeeded and results["prod"].succeeded
+    assert results["dev"].deployed == ["redact", "redact_w_secret"]
+    # the broken target fails on its own
+    assert not results["broken"].succeeded
+    assert set(results["broken"].errors) == {"redact", "redact_w_secret"}
+    assert results["broken"].deployed == []
+
+    dev_stmts = [s for c, w, s in executed if c is dev and w == "w1"]
+    prod_stmts = [s for c, w, s in executed if c is prod and w == "w2"]
+    assert len(dev_stmts) == len(prod_stmts) == 6
+    assert all("foo.bar" not in s for s in dev_stmts + prod_stmts)
+    assert "CREATE OR REPLACE FUNCTION dev_catalog.functions.redact(" in "".join(
+        dev_stmts
+    )
+    # the secret wrapper calls the private function of its own target
+    assert "prod_catalog.functions._redact_w_secret(" in "".join(prod_stmts)
+    # compiled once for the deployment's own schema
+    assert uc.get_function("redact").catalog == "foo"
+
+
+def test_deploy_targets_isolates_target_failures():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+
+    uc.register(redact)
+    good, unreachable = MagicMock(), MagicMock()
+    unreachable.warehouses.list.side_effect = ConnectionError("unreachable")
+    targets = [
+        Target("good", "a", "b", good, warehouse_id="w1"),
+        Target("unreachable", "a", "b", unreachable),
+    ]
+    with patch("uc_functions.functions.run_sql"):
+        results = uc.deploy_targets(targets)
+    assert results["good"].deployed == ["redact"]
+    assert isinstance(results["unreachable"].error, ConnectionError)
+    assert results["unreachable"].deployed == []
+
+    with pytest.raises(ValueError):
+        uc.deploy_targets([targets[0], targets[0]])
+
+
+def test_minify(tmp_path):
+    from samples.split_words import split_words
+
+    full = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    minified = FunctionDeployment(
+        "foo", "bar", root_dir=samples_dir, minify=True, strip_asserts=True
+    )
+    for uc in (full, minified):
+        uc.register(split_words)
+        uc.serialize_fn("split_words")
+    full_code = full.get_function("split_words").function_inlined
+    minified_code = minified.get_function("split_words").function_inlined
+    assert len(minified_code) < len(full_code)
+    assert "\n\n" not in minified_code
+    assert minified.get_function("split_words").load_inlined()("a email") == [
+        (0, "a"),
+        (1, "REDACTED"),
+    ]
+    with pytest.raises(ValueError):
+        FunctionDeployment("foo", "bar", root_dir=samples_dir, strip_asserts=True)
+
+
+def test_size_budget(tmp_path):
+    from samples.split_words import split_words
+
+    uc = FunctionDeployment(
+        "foo",
+        "bar",
+        root_dir=samples_dir,
+        compile_sql_dir=str(tmp_path),
+        size_budget=50,
+    )
+    uc.register(split_words)
+    with pytest.raises(SizeBudgetError) as e:
+        uc.compile(name="split_words")
+    assert e.value.budget == 50 and e.value.size > 50
+    assert {"WordRow", "KEYS_TO_REDACT", "split_words"} <= set(e.value.breakdown)
+    assert "WordRow" in str(e.value)
+    # a failed function is checked again on the next compile
+    uc.size_budget = 10_000
+    uc.compile(name="split_words")
+
+
+def test_concurrent_register_compile_and_deploy(tmp_path):
+    count = 40
+    source = "import json\n\n\ndef shared(value: str) -> str:\n    return json.dumps(value)\n"
+    for i in range(count):
+        source += (
+            f"\n\ndef fn_{i}(value: str) -> str:\n    return shared(value + '{i}')\n"
+        )
+    (tmp_path / "stress_functions.py").write_text(source)
+    sys.path.insert(0, str(tmp_path))
+    try:
+        import stress_functions
+    finally:
+        sys.path.remove(str(tmp_path))
+    functions = [getattr(stress_functions, f"fn_{i}") for i in range(count)]
+    uc = FunctionDeployment(
+        "foo", "bar", root_dir=str(tmp_path), compile_sql_dir=str(tmp_path / "out")
+    )
+
+    from uc_functions.functions import inline_function
+
+    inlined = []
+
+    def counting_inline_function(function, *args, **kwargs):
+        inlined.append(function.__name__)
+        return inline_function(function, *args, **kwargs)
+
+    executed = []
+    with patch(
+        "uc_functions.functions.inline_function", side_effect=counting_inline_function
+    ), patch(
+        "uc_functions.functions.run_sql",
+        side_effect=lambda ws, wh, stmt, **kwargs: executed.append(stmt),
+    ), ThreadPoolExecutor(
+        max_workers=16
+    ) as pool:
+        # every thread registers, the same function is registered twice
+        registered = [pool.submit(uc.register, f) for f in functions + functions]
+        for future in registered:
+            future.result()
+        inlined.clear()
+        tasks = []
+        for function in functions:
+            name = function.__name__
+            tasks.append(pool.submit(uc.serialize_fn, name))
+            tasks.append(pool.submit(uc.compile, name=name))
+            tasks.append(
+                pool.submit(
+                    uc.deploy,
+                    workspace_client=MagicMock(),
+                    warehouse_id="abc",
+                    name=name,
+                )
+            )
+            tasks.append(pool.submit(uc.function_names))
+        tasks.extend(pool.submit(uc.compile) for _ in range(4))
+        for future in tasks:
+            future.result()
+
+    # serialized once each although many threads asked for it at the same time
+    assert sorted(inlined) == sorted(f.__name__ for f in functions)
+    assert uc.function_names() == [f.__name__ for f in functions]
+    for i in range(count):
+        creates = [s for s in executed if f"FUNCTION foo.bar.fn_{i}(" in s]
+        assert len(creates) == 1
+        assert f'"{i}"' in creates[0]
+        assert (tmp_path / "out" / f"foo.bar.fn_{i}.sql").exists()
+
+
+def test_content_hash_is_stable_across_processes():
+    # the inliner must not depend on set iteration order, which changes with
+    # the hash seed of the process
+    script = (
+        "from uc_functions.functions import FunctionDeployment\n"
+        "from split_words import split_words\n"
+        f"uc = FunctionDeployment('foo', 'bar', root_dir={samples_dir!r})\n"
+        "uc.register(split_words)\n"
+        "print(uc.serialize_fn('split_words').content_hash())\n"
+    )
+    hashes = set()
+    for seed in ("1", "2", "3", "4"):
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            env={**os.environ, "PYTHONHASHSEED": seed},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        hashes.add(result.stdout.strip().splitlines()[-1])
+    assert len(hashes) == 1
+
+
+def test_repeated_deploys_list_warehouses_once():
+    from databricks.sdk.service.sql import EndpointInfo, State
+
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+
+    uc.register(redact)
+    ws_client = MagicMock()
+    ws_client.warehouses.list.side_effect = lambda: iter(
+        [EndpointInfo(id="w", enable_serverless_compute=True, state=State.RUNNING)]
+    )
+    with patch("uc_functions.functions.run_sql"):
+        for _ in range(3):
+            uc.deploy(workspace_client=ws_client)
+    assert ws_client.warehouses.list.call_count == 1
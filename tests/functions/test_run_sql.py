@@ -0,0 +1,219 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pytest
+from databricks.sdk.service.sql import (
+    ResultData,
+    StatementParameterListItem,
+    StatementResponse,
+    StatementState,
+    StatementStatus,
+)
+
+from uc_functions.functions import (
+    PollingPolicy,
+    arun_sql,
+    fetch_result_rows,
+    get_server_wait_timeout,
+    run_sql,
+)
+
+
+def statement(state: StatementState, statement_id="stmt-1"):
+    return StatementResponse(
+        statement_id=statement_id, status=StatementStatus(state=state)
+    )
+
+
+def test_run_sql_succeeded():
+    ws_client = MagicMock()
+    ws_client.statement_execution.execute_statement.return_value = statement(
+        StatementState.SUCCEEDED
+    )
+    resp = run_sql(ws_client, "abc", "SELECT 1")
+    assert resp.status.state == StatementState.SUCCEEDED
+    ws_client.statement_execution.get_statement.assert_not_called()
+
+
+def test_run_sql_parameters():
+    ws_client = MagicMock()
+    ws_client.statement_execution.execute_statement.return_value = statement(
+        StatementState.SUCCEEDED
+    )
+    parameters = [StatementParameterListItem(name="a", type="INTEGER", value="1")]
+    run_sql(ws_client, "abc", "SELECT :a", parameters=parameters)
+    assert (
+        ws_client.statement_execution.execute_statement.call_args.kwargs["parameters"]
+        == parameters
+    )
+
+
+def test_run_sql_failed():
+    ws_client = MagicMock()
+    ws_client.statement_execution.execute_statement.return_value = statement(
+        StatementState.FAILED
+    )
+    with pytest.raises(ValueError) as e:
+        run_sql(ws_client, "abc", "SELECT 1")
+    assert "Statement failed to execute" in str(e.value)
+
+
+def test_arun_sql_succeeded():
+    ws_client = MagicMock()
+    ws_client.statement_execution.execute_statement.return_value = statement(
+        StatementState.SUCCEEDED
+    )
+    resp = asyncio.run(arun_sql(ws_client, "abc", "SELECT 1"))
+    assert resp.status.state == StatementState.SUCCEEDED
+
+
+def test_arun_sql_timeout_cancels_statement():
+    ws_client = MagicMock()
+    ws_client.statement_execution.execute_statement.return_value = statement(
+        StatementState.RUNNING
+    )
+    ws_client.statement_execution.get_statement.return_value = statement(
+        StatementState.RUNNING
+    )
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(arun_sql(ws_client, "abc", "SELECT 1", timeout=0.05))
+    ws_client.statement_execution.cancel_execution.assert_called_once_with("stmt-1")
+
+
+def test_arun_sql_cancelled_cancels_statement():
+    ws_client = MagicMock()
+    ws_client.statement_execution.execute_statement.return_value = statement(
+        StatementState.PENDING
+    )
+    ws_client.statement_execution.get_statement.return_value = statement(
+        StatementState.PENDING
+    )
+
+    async def cancel_after_submit():
+        task = asyncio.ensure_future(arun_sql(ws_client, "abc", "SELECT 1"))
+        while not ws_client.statement_execution.get_statement.called:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_after_submit())
+    ws_client.statement_execution.cancel_execution.assert_called_once_with("stmt-1")
+
+
+def test_arun_sql_does_not_hold_executor_threads():
+    # a submit waiting on the server would hold a thread for the whole wait,
+    # with 4 threads 100 statements of 0.2s would then take at least 5s
+    submitted = {}
+    wait_timeouts = []
+
+    def execute_statement(stmt, wait_timeout=None, **kwargs):
+        wait_timeouts.append(wait_timeout)
+        if wait_timeout != "0s":
+            time.sleep(0.2)
+            return statement(StatementState.SUCCEEDED, stmt)
+        submitted[stmt] = time.monotonic()
+        return statement(StatementState.PENDING, stmt)
+
+    def get_statement(statement_id):
+        if time.monotonic() - submitted[statement_id] < 0.2:
+            return statement(StatementState.RUNNING, statement_id)
+        return statement(StatementState.SUCCEEDED, statement_id)
+
+    ws_client = MagicMock()
+    ws_client.statement_execution.execute_statement.side_effect = execute_statement
+    ws_client.statement_execution.get_statement.side_effect = get_statement
+
+    async def run_many():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=4))
+        return await asyncio.gather(
+            *[arun_sql(ws_client, "abc", f"s{i}") for i in range(100)]
+        )
+
+    start = time.monotonic()
+    responses = asyncio.run(run_many())
+    assert time.monotonic() - start < 2.5
+    assert all(r.status.state == StatementState.SUCCEEDED for r in responses)
+    assert set(wait_timeouts) == {"0s"}
+
+
+def test_polling_policy_backs_off():
+    intervals = PollingPolicy(
+        initial_interval=0.1, max_interval=0.5, multiplier=2
+    ).intervals()
+    assert [next(intervals) for _ in range(5)] == [0.1, 0.2, 0.4, 0.5, 0.5]
+
+
+def test_server_wait_timeout():
+    assert get_server_wait_timeout(None) == "50s"
+    assert get_server_wait_timeout(120) == "50s"
+    assert get_server_wait_timeout(20.5) == "20s"
+    assert get_server_wait_timeout(1) == "0s"
+
+
+def test_run_sql_polls_with_backoff_and_records_stats():
+    ws_client = MagicMock()
+    ws_client.statement_execution.execute_statement.return_value = statement(
+        StatementState.PENDING
+    )
+    ws_client.statement_execution.get_statement.side_effect = [
+        statement(StatementState.RUNNING),
+        statement(StatementState.RUNNING),
+        statement(StatementState.SUCCEEDED),
+    ]
+    stats = []
+    with patch("uc_functions.functions.time.sleep") as mock_sleep:
+        run_sql(
+            ws_client,
+            "abc",
+            "SELECT 1",
+            polling=PollingPolicy(initial_interval=0.01, multiplier=3),
+            stats=stats,
+        )
+    assert [c.args[0] for c in mock_sleep.call_args_list] == pytest.approx(
+        [0.01, 0.03, 0.09]
+    )
+    assert (
+        ws_client.statement_execution.execute_statement.call_args.kwargs["wait_timeout"]
+        == "50s"
+    )
+    assert len(stats) == 1
+    assert stats[0].polls == 3
+    assert stats[0].state == "SUCCEEDED"
+    assert stats[0].statement_id == "stmt-1"
+    assert stats[0].elapsed >= 0
+
+
+def test_run_sql_deadline_cancels_statement():
+    ws_client = MagicMock()
+    ws_client.statement_execution.execute_statement.return_value = statement(
+        StatementState.RUNNING
+    )
+    ws_client.statement_execution.get_statement.return_value = statement(
+        StatementState.RUNNING
+    )
+    stats = []
+    with pytest.raises(TimeoutError):
+        run_sql(ws_client, "abc", "SELECT 1", timeout=0.05, stats=stats)
+    ws_client.statement_execution.cancel_execution.assert_called_once_with("stmt-1")
+    assert stats[0].elapsed >= 0.05
+    assert stats[0].polls > 0
+
+
+def test_fetch_result_rows_follows_chunks():
+    ws_client = MagicMock()
+    ws_client.statement_execution.get_statement_result_chunk_n.return_value = (
+        ResultData(data_array=[["c"]], next_chunk_index=None)
+    )
+    resp = StatementResponse(
+        statement_id="stmt-1",
+        status=StatementStatus(state=StatementState.SUCCEEDED),
+        result=ResultData(data_array=[["a"], ["b"]], next_chunk_index=1),
+    )
+    assert fetch_result_rows(ws_client, resp) == [["a"], ["b"], ["c"]]
+    ws_client.statement_execution.get_statement_result_chunk_n.assert_called_once_with(
+        "stmt-1", 1
+    )
@@ -1,9 +1,17 @@
+import datetime
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import NamedTuple, Optional, TypedDict
+
 import pytest
 
 from uc_functions.functions import (
     FunctionArg,
+    get_parameter_expression,
     get_response_sql_type,
     get_sql_type_mapping,
+    to_sql_literal,
+    to_statement_parameter,
 )
 from uc_functions.special_kwargs import DatabricksSecret
 
@@ -111,3 +119,163 @@ def test_get_sql_type_mapping_unsupported_type():
 
     with pytest.raises(ValueError):
         get_sql_type_mapping(func)
+
+
+@dataclass
+class Address:
+    street: str
+    zip_code: int
+
+
+class Contact(TypedDict):
+    email: str
+    tags: list[str]
+
+
+class Location(TypedDict):
+    street: str
+    zip_code: int
+
+
+class Point(NamedTuple):
+    x: float
+    y: float
+
+
+def test_get_sql_type_mapping_complex_types():
+    def func(
+        a: list[int],
+        b: dict[str, float],
+        c: Location,
+        d: Contact,
+        e: bytes,
+        f: Decimal,
+        g: datetime.date,
+        h: datetime.datetime,
+        i: list[dict[str, Location]],
+        j: Optional[str],
+    ):
+        pass
+
+    mapping = get_sql_type_mapping(func)
+    assert mapping["a"].type == "ARRAY<INTEGER>"
+    assert mapping["b"].type == "MAP<STRING, FLOAT>"
+    assert mapping["c"].type == "STRUCT<street: STRING, zip_code: INTEGER>"
+    assert mapping["d"].type == "STRUCT<email: STRING, tags: ARRAY<STRING>>"
+    assert mapping["e"].type == "BINARY"
+    assert mapping["f"].type == "DECIMAL(38, 18)"
+    assert mapping["g"].type == "DATE"
+    assert mapping["h"].type == "TIMESTAMP"
+    assert (
+        mapping["i"].type
+        == "ARRAY<MAP<STRING, STRUCT<street: STRING, zip_code: INTEGER>>>"
+    )
+    assert mapping["j"].type == "STRING"
+
+
+def test_get_response_sql_type_complex_types():
+    def func() -> list[Location]:
+        return []
+
+    assert (
+        get_response_sql_type(func)
+        == "ARRAY<STRUCT<street: STRING, zip_code: INTEGER>>"
+    )
+
+
+def test_dataclass_and_named_tuple_structs_are_rejected():
+    # python udfs receive and return structs as dicts
+    def takes_dataclass(a: Address):
+        pass
+
+    def takes_nested_named_tuple(a: list[Point]):
+        pass
+
+    def returns_dataclass() -> Optional[Address]:
+        pass
+
+    for func in (takes_dataclass, takes_nested_named_tuple):
+        with pytest.raises(ValueError, match="use a TypedDict"):
+            get_sql_type_mapping(func)
+    with pytest.raises(ValueError, match="use a TypedDict"):
+        get_response_sql_type(returns_dataclass)
+
+
+def test_get_sql_type_mapping_unsupported_nested_type():
+    class CustomType:
+        pass
+
+    def func(a: list[CustomType]):
+        pass
+
+    with pytest.raises(ValueError):
+        get_sql_type_mapping(func)
+
+
+def test_to_sql_literal():
+    assert to_sql_literal("it's") == "'it\\'s'"
+    assert to_sql_literal(1) == "1"
+    assert to_sql_literal(True) == "TRUE"
+    assert to_sql_literal(None, "STRING") == "CAST(NULL AS STRING)"
+    assert to_sql_literal(b"ab") == "X'6162'"
+    assert to_sql_literal(Decimal("1.50")) == "1.50BD"
+    assert to_sql_literal(datetime.date(2024, 1, 2)) == "DATE'2024-01-02'"
+    assert (
+        to_sql_literal(datetime.datetime(2024, 1, 2, 3, 4, 5))
+        == "TIMESTAMP'2024-01-02 03:04:05'"
+    )
+    assert (
+        to_sql_literal([1, 2], "ARRAY<INTEGER>")
+        == "CAST(array(1, 2) AS ARRAY<INTEGER>)"
+    )
+    assert to_sql_literal({"a": 1}) == "map('a', 1)"
+    assert (
+        to_sql_literal(Address("main", 1))
+        == "named_struct('street', 'main', 'zip_code', 1)"
+    )
+
+
+def test_to_sql_literal_dict_as_struct():
+    struct_type = "STRUCT<street: STRING, zip_code: INTEGER>"
+    # typed dicts are structs, spark can not cast a map to a struct
+    assert to_sql_literal({"street": "main", "zip_code": 1}, struct_type) == (
+        f"CAST(named_struct('street', 'main', 'zip_code', 1) AS {struct_type})"
+    )
+    nested = to_sql_literal(
+        [{"street": "main", "zip_code": 1}], f"ARRAY<{struct_type}>"
+    )
+    assert "named_struct('street', 'main', 'zip_code', 1)" in nested
+    assert "map(" not in nested
+    assert to_sql_literal({"a": 1}, "MAP<STRING, INTEGER>") == (
+        "CAST(map('a', 1) AS MAP<STRING, INTEGER>)"
+    )
+
+
+def test_to_statement_parameter():
+    parameter = to_statement_parameter("a", "it's", "STRING")
+    assert (parameter.type, parameter.value) == ("STRING", "it's")
+    assert to_statement_parameter("a", True, "BOOLEAN").value == "true"
+    assert to_statement_parameter("a", None, "INTEGER").value is None
+    assert to_statement_parameter("a", Decimal("1.50"), "DECIMAL(38, 18)").value == (
+        "1.50"
+    )
+    assert (
+        to_statement_parameter(
+            "a", datetime.datetime(2024, 1, 2, 3, 4), "TIMESTAMP"
+        ).value
+        == "2024-01-02 03:04:00"
+    )
+    # complex and binary values are sent as strings and converted back in sql
+    parameter = to_statement_parameter(
+        "a", [Address("main", 1)], "ARRAY<STRUCT<street: STRING, zip_code: INTEGER>>"
+    )
+    assert (parameter.type, parameter.value) == (
+        "STRING",
+        '[{"street": "main", "zip_code": 1}]',
+    )
+    assert to_statement_parameter("a", b"ab", "BINARY").value == "YWI="
+    assert get_parameter_expression("a", "BINARY") == "unbase64(:a)"
+    assert get_parameter_expression("a", "MAP<STRING, INTEGER>") == (
+        "from_json(:a, 'MAP<STRING, INTEGER>')"
+    )
+    assert get_parameter_expression("a", "STRING") == ":a"
@@ -4,7 +4,7 @@ from pathlib import Path
 
 import pytest
 
-from uc_functions.inline import inline_function
+from uc_functions.inline import generate_ast_dict, inline_function
 
 samples_dir = str(Path(__file__).parent.parent / "samples")
 
@@ -63,3 +63,10 @@ print(foobar)
     undefined_names = r.lint_code_for_undefined_names(code)
     assert len(undefined_names) == 1, "Expected 1 undefined name"
     assert "foobar" in undefined_names[0], "Expected undefined name not found"
+
+
+def test_generate_ast_dict_is_read_only():
+    name_ast_dict = generate_ast_dict(samples_dir)
+    assert "redact" in name_ast_dict
+    with pytest.raises(TypeError):
+        name_ast_dict["redact"] = None
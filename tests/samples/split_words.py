@@ -0,0 +1,28 @@
+from dataclasses import dataclass
+from typing import Iterator, NamedTuple
+
+from shared_utils.shared_keys import KEYS_TO_REDACT
+
+
+@dataclass
+class WordRow:
+    position: int
+    word: str
+
+
+def split_words(text: str) -> Iterator[WordRow]:
+    for position, word in enumerate(text.split()):
+        if word in KEYS_TO_REDACT:
+            word = "REDACTED"
+        yield WordRow(position=position, word=word)
+
+
+class CharRow(NamedTuple):
+    char: str
+    count: int
+
+
+class CountChars:
+    def eval(self, text: str) -> Iterator[CharRow]:
+        for char in sorted(set(text)):
+            yield CharRow(char, text.count(char))
@@ -0,0 +1,65 @@
+import time
+
+from uc_functions.cache import RemoteResultCache
+
+
+def test_cache_hit_and_miss():
+    cache = RemoteResultCache()
+    key = RemoteResultCache.make_key("redact", "hash", ["a"])
+    assert cache.get(key) == (False, None)
+    cache.set(key, None, "redact")
+    # None is a valid result
+    assert cache.get(key) == (True, None)
+    assert RemoteResultCache.make_key("redact", "other hash", ["a"]) != key
+    assert RemoteResultCache.make_key("redact", "hash", ["a"], host="h") != key
+    assert RemoteResultCache.make_key("redact", "hash", ["a"], warehouse_id="w") != key
+
+
+def test_cache_evicts_least_recently_used():
+    cache = RemoteResultCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert len(cache) == 2
+
+
+def test_cache_ttl():
+    cache = RemoteResultCache(ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") == (False, None)
+
+
+def test_cache_on_disk(tmp_path):
+    RemoteResultCache(path=str(tmp_path)).set("a", ["x", 1], "redact")
+    cache = RemoteResultCache(path=str(tmp_path))
+    assert cache.get("a") == (True, ["x", 1])
+
+    cache.set("b", 2, "other")
+    cache.invalidate("redact")
+    assert RemoteResultCache(path=str(tmp_path)).get("a") == (False, None)
+    assert RemoteResultCache(path=str(tmp_path)).get("b") == (True, 2)
+
+
+def test_cache_on_disk_is_size_bounded(tmp_path):
+    cache = RemoteResultCache(max_entries=2, path=str(tmp_path))
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.set(key, i)
+        time.sleep(0.01)
+    assert sorted(p.stem for p in tmp_path.glob("*.json")) == ["b", "c"]
+
+
+def test_cache_on_disk_bounds_files_of_previous_processes(tmp_path):
+    cache = RemoteResultCache(max_entries=3, path=str(tmp_path))
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.set(key, i)
+        time.sleep(0.01)
+    # a new cache knows the existing files and evicts the oldest first
+    cache = RemoteResultCache(max_entries=3, path=str(tmp_path))
+    cache.set("d", 3)
+    cache.set("b", 4)
+    cache.set("e", 5)
+    assert sorted(p.stem for p in tmp_path.glob("*.json")) == ["b", "d", "e"]
@@ -0,0 +1,115 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from uc_functions.emulator import (
+    EmulatedWorkspaceClient,
+    evaluate_python_udf,
+    split_top_level,
+)
+from uc_functions.functions import FunctionDeployment, PollingPolicy, run_sql
+
+samples_dir = str(Path(__file__).parent / "samples")
+
+
+def deployment(ws_client, tmp_path):
+    uc = FunctionDeployment(
+        "foo",
+        "bar",
+        root_dir=samples_dir,
+        compile_sql_dir=str(tmp_path),
+        workspace_client=ws_client,
+    )
+    from samples.redact import redact
+    from samples.redact_with_secret import redact_w_secret
+    from samples.split_words import CountChars, split_words
+
+    return uc, [uc.register(f) for f in (redact, redact_w_secret, split_words)] + [
+        uc.register(CountChars)
+    ]
+
+
+def test_deploy_and_remote(tmp_path):
+    with EmulatedWorkspaceClient(secrets={("my-scope", "my-key"): "s"}) as ws_client:
+        uc, (redact, redact_w_secret, split_words, count_chars) = deployment(
+            ws_client, tmp_path
+        )
+        uc.deploy(concurrency=4)
+        assert set(ws_client.functions) == {
+            "foo.bar.redact",
+            "foo.bar._redact_w_secret",
+            "foo.bar.redact_w_secret",
+            "foo.bar.split_words",
+            "foo.bar.countchars",
+        }
+
+        data = '{"email": "it\'s", "other": "bar"}'
+        assert redact.remote(data) == redact(data)
+        assert redact_w_secret.remote(data) == redact(data)
+        assert split_words.remote("a email") == [["0", "a"], ["1", "REDACTED"]]
+        assert count_chars.remote("aab") == [["a", "2"], ["b", "1"]]
+        rows = [(data,), ("not json",), ('{"phone": 1}',)]
+        assert redact.remote_map(rows, chunk_size=2, concurrency=2) == [
+            redact(*row) for row in rows
+        ]
+
+
+def test_incremental_deploy_is_a_no_op_when_unchanged(tmp_path):
+    with EmulatedWorkspaceClient() as ws_client:
+        uc, _ = deployment(ws_client, tmp_path)
+        first = uc.deploy(incremental=True)
+        assert len(first.created) == 4
+        assert uc.deploy(incremental=True).is_empty()
+
+
+def test_latency_is_polled(tmp_path):
+    with EmulatedWorkspaceClient(latency=0.05) as ws_client:
+        resp = run_sql(
+            ws_client,
+            "local",
+            "DROP FUNCTION IF EXISTS foo.bar.redact;",
+            wait_timeout="0s",
+            polling=PollingPolicy(initial_interval=0.01),
+        )
+        assert resp.status.state.value == "SUCCEEDED"
+        assert ws_client.polls > 0
+
+
+def test_failures_fail_the_statement(tmp_path):
+    with EmulatedWorkspaceClient() as ws_client:
+        uc, (redact, redact_w_secret, *_) = deployment(ws_client, tmp_path)
+        with pytest.raises(ValueError) as e:
+            redact.remote("data")
+        assert "Function not found" in str(e.value)
+
+        uc.deploy()
+        # the secret is not configured in the emulator
+        with pytest.raises(ValueError) as e:
+            redact_w_secret.remote("data")
+        assert "Secret not found" in str(e.value)
+
+
+def test_worker_processes(tmp_path):
+    with EmulatedWorkspaceClient(processes=1) as ws_client:
+        uc, (redact, *_) = deployment(ws_client, tmp_path)
+        uc.deploy(name="redact")
+        assert redact.remote_map([("a",), ("b",)]) == ["a", "b"]
+
+
+def test_split_top_level():
+    assert split_top_level("a MAP<STRING, INT>, b DECIMAL(38, 18), 'x, y'") == [
+        "a MAP<STRING, INT>",
+        "b DECIMAL(38, 18)",
+        "'x, y'",
+    ]
+
+
+def test_wheel_dependencies_are_removed_from_sys_path():
+    wheel = "/volumes/deps/shared-1.0-py3-none-any.whl"
+    body = "import sys\nreturn sys.path[0] == path"
+    assert evaluate_python_udf(body, ["path"], [[wheel]], [wheel]) == [True]
+    assert wheel not in sys.path
+    with pytest.raises(ZeroDivisionError):
+        evaluate_python_udf("return 1 / 0", [], [[]], [wheel])
+    assert wheel not in sys.path
@@ -0,0 +1,82 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from uc_functions.emulator import EmulatedWorkspaceClient
+from uc_functions.functions import FunctionDeployment
+from uc_functions.inline import generate_ast_dict
+from uc_functions.instrumentation import (
+    Instrumentation,
+    get_instrumentation,
+    instrument,
+    span,
+)
+
+samples_dir = str(Path(__file__).parent / "samples")
+
+
+def test_span_is_a_no_op_when_inactive():
+    assert get_instrumentation() is None
+    with span("compile", "foo") as attributes:
+        attributes["key"] = "value"
+
+
+def test_spans_hooks_and_errors():
+    seen = []
+    instrumentation = Instrumentation(hooks=[seen.append])
+    with instrument(instrumentation):
+        assert get_instrumentation() is instrumentation
+        with span("submit") as attributes:
+            attributes["statement_id"] = "stmt-1"
+        with pytest.raises(ValueError):
+            with span("poll", "stmt-1"):
+                raise ValueError("boom")
+    assert get_instrumentation() is None
+    assert [s.phase for s in seen] == ["submit", "poll"]
+    assert seen[0].attributes == {"statement_id": "stmt-1"}
+    assert seen[1].error == "ValueError: boom"
+    summary = instrumentation.summary()
+    assert summary["poll"]["count"] == 1
+    assert summary["poll"]["errors"] == 1
+
+
+def test_report_and_chrome_trace(tmp_path):
+    report_path = tmp_path / "report.json"
+    trace_path = tmp_path / "trace.json"
+    with instrument(report_path=str(report_path), trace_path=str(trace_path)):
+        with span("compile", "foo"):
+            with span("format"):
+                pass
+    report = json.loads(report_path.read_text())
+    assert set(report["phases"]) == {"compile", "format"}
+    assert [s["name"] for s in report["spans"]] == ["", "foo"]
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    assert [e["name"] for e in events] == ["format", "compile foo"]
+    assert all(e["ph"] == "X" for e in events)
+    # the inner span lies within the outer one
+    assert events[1]["ts"] <= events[0]["ts"]
+    assert events[0]["ts"] + events[0]["dur"] <= events[1]["ts"] + events[1]["dur"]
+
+
+def test_compile_and_deploy_phases(tmp_path):
+    from samples.redact import redact
+
+    generate_ast_dict.cache_clear()
+    with EmulatedWorkspaceClient(latency=0.05, max_wait=0) as ws_client:
+        uc = FunctionDeployment(
+            "foo",
+            "bar",
+            root_dir=samples_dir,
+            compile_sql_dir=str(tmp_path),
+            workspace_client=ws_client,
+        )
+        uc.register(redact)
+        with instrument() as instrumentation:
+            uc.deploy()
+    phases = instrumentation.summary()
+    for phase in ("index", "resolve", "inline", "format", "compile", "write"):
+        assert phases[phase]["count"] >= 1, phase
+    assert phases["deploy"]["count"] == 1
+    assert phases["submit"]["count"] == 2
+    assert phases["poll"]["count"] >= 2
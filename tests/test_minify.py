@@ -0,0 +1,69 @@
+import ast
+
+from uc_functions.minify import IMPORTS, minify, size_breakdown
+
+CODE = '''
+"""Module docstring."""
+import json
+from dataclasses import dataclass
+from typing import List, Optional
+
+if TYPE_CHECKING:
+    import os
+
+
+@dataclass
+class Row:
+    """Fields keep their annotations."""
+
+    position: int
+    word: Optional[str] = None
+
+
+def helper(value: str, *args: str, **kwargs: int) -> List[str]:
+    """Docstring."""
+    assert value, "empty"
+    # a comment
+    parsed: list = json.loads(value)
+    if False:
+        return []
+    return parsed
+
+
+try:
+    pass
+except ValueError:
+    """Only a docstring."""
+'''
+
+
+def test_minify():
+    minified = minify(CODE)
+    assert "Docstring" not in minified and "comment" not in minified
+    assert "def helper(value, *args, **kwargs):" in minified
+    assert "parsed = json.loads(value)" in minified
+    # dataclass fields and the imports they need are kept
+    assert "position: int" in minified
+    assert "from typing import Optional" in minified
+    assert "List" not in minified
+    assert "import os" not in minified and "if False" not in minified
+    assert "assert value" in minified
+    assert "except ValueError:\n    pass" in minified
+    assert len(minified) < len(CODE)
+    ast.parse(minified)
+
+
+def test_minify_strip_asserts():
+    assert "assert" not in minify(CODE, strip_asserts=True)
+
+
+def test_minify_keeps_decorated_function_annotations():
+    code = "import functools\n\n@functools.singledispatch\ndef f(x: int) -> int:\n    return x\n"
+    assert "def f(x: int) -> int:" in minify(code)
+
+
+def test_size_breakdown():
+    breakdown = size_breakdown(CODE, ["helper", "Row"], "fn")
+    assert list(breakdown)[0] == "helper"
+    assert set(breakdown) == {"helper", "Row", IMPORTS, "fn"}
+    assert sum(breakdown.values()) <= len(CODE)
@@ -0,0 +1,156 @@
+import importlib.metadata
+import sys
+import zipfile
+from pathlib import Path
+
+from uc_functions.functions import FunctionDeployment
+from uc_functions.packaging import (
+    build_wheel,
+    find_shared_helpers,
+    get_third_party_requirements,
+    strip_shared_helpers,
+)
+
+samples_dir = str(Path(__file__).parent / "samples")
+
+HELPERS = """
+import json
+
+PREFIX = "x"
+
+
+def helper(value):
+    return PREFIX + json.dumps(value)
+"""
+
+
+def test_find_shared_helpers():
+    codes = {
+        "a": HELPERS + "\nreturn helper(1)\n",
+        "b": HELPERS + "\nreturn helper(2)\n",
+        # a different PREFIX, so helper is not self contained for c
+        "c": HELPERS.replace('"x"', '"y"') + "\nreturn helper(3)\n",
+    }
+    helper_names = {name: {"PREFIX", "helper"} for name in codes}
+    shared = find_shared_helpers(codes, helper_names)
+    assert list(shared) == ["PREFIX", "helper"]
+    assert shared["PREFIX"] == "PREFIX = 'x'\n"
+    assert find_shared_helpers(codes, helper_names, min_functions=3) == {}
+
+    # helper is only shared if the PREFIX it references is shared as well
+    del codes["a"]
+    assert find_shared_helpers(codes, helper_names) == {}
+
+
+def test_strip_shared_helpers():
+    code = HELPERS + "\nreturn helper(1)\n"
+    shared = find_shared_helpers(
+        {"a": code, "b": code}, {"a": {"PREFIX", "helper"}, "b": {"PREFIX", "helper"}}
+    )
+    stripped = strip_shared_helpers(code, shared, "pkg")
+    assert stripped.startswith("from pkg import PREFIX, helper\n")
+    assert "def helper" not in stripped
+    assert stripped.rstrip().endswith("return helper(1)")
+    assert strip_shared_helpers("return 1\n", shared, "pkg") == "return 1\n"
+
+
+def test_get_third_party_requirements():
+    code = "import json\nimport astor\nfrom black import format_str\n"
+    assert get_third_party_requirements(code) == [
+        f"astor=={importlib.metadata.version('astor')}",
+        f"black=={importlib.metadata.version('black')}",
+    ]
+
+
+def test_build_wheel(tmp_path):
+    path = build_wheel(str(tmp_path / "vol"), "pkg", "0.0.1", "VALUE = 1\n")
+    assert path.name == "pkg-0.0.1-py3-none-any.whl"
+    with zipfile.ZipFile(path) as wheel:
+        assert sorted(wheel.namelist()) == [
+            "pkg-0.0.1.dist-info/METADATA",
+            "pkg-0.0.1.dist-info/RECORD",
+            "pkg-0.0.1.dist-info/WHEEL",
+            "pkg/__init__.py",
+        ]
+    # the same helpers build the same wheel
+    first = path.read_bytes()
+    build_wheel(str(tmp_path / "vol"), "pkg", "0.0.1", "VALUE = 1\n")
+    assert path.read_bytes() == first
+    sys.path.insert(0, str(path))
+    try:
+        assert __import__("pkg").VALUE == 1
+    finally:
+        sys.path.remove(str(path))
+        sys.modules.pop("pkg", None)
+
+
+def test_package_shared_helpers(tmp_path):
+    uc = FunctionDeployment(
+        "foo", "bar", root_dir=samples_dir, compile_sql_dir=str(tmp_path / "out")
+    )
+    from samples.redact import redact
+    from samples.redact_with_secret import redact_w_secret
+    from samples.split_words import CountChars, split_words
+
+    for function in (redact, redact_w_secret, split_words, CountChars):
+        uc.register(function)
+    uc.compile(name="redact")
+    before = uc.get_function("redact").content_hash()
+    shared = uc.package_shared_helpers(str(tmp_path))
+    assert shared.package == "uc_helpers_foo_bar"
+    assert list(shared.helpers) == ["KEYS_TO_REDACT"]
+    assert shared.functions == {
+        "redact": ["KEYS_TO_REDACT"],
+        "redact_w_secret": ["KEYS_TO_REDACT"],
+        "split_words": ["KEYS_TO_REDACT"],
+    }
+    assert shared.wheel_path.exists()
+
+    redact_sql = "\n".join(uc.generate_deployment_sql("redact"))
+    assert (
+        f"ENVIRONMENT (dependencies = '[\"{shared.wheel_path}\"]', "
+        "environment_version = 'None')"
+    ) in redact_sql
+    assert "from uc_helpers_foo_bar import KEYS_TO_REDACT" in redact_sql
+    assert 'KEYS_TO_REDACT = ["email", "phone"]' not in redact_sql
+    assert uc.get_function("redact").content_hash() != before
+    split_words_sql = "\n".join(uc.generate_deployment_sql("split_words"))
+    assert "HANDLER '_split_words_handler'\nENVIRONMENT" in split_words_sql
+    # nothing shared and no third party imports, no environment
+    assert "ENVIRONMENT" not in "\n".join(uc.generate_deployment_sql("CountChars"))
+    # the local body is still the self contained one
+    assert uc.get_function("redact").load_inlined()('{"email": 1}') == redact(
+        '{"email": 1}'
+    )
+
+    assert uc.package_shared_helpers(str(tmp_path), min_functions=4) is None
+    assert uc.get_function("redact").content_hash() == before
+
+
+def test_packaged_functions_run_in_the_emulator(tmp_path):
+    from uc_functions.emulator import EmulatedWorkspaceClient
+
+    with EmulatedWorkspaceClient() as ws_client:
+        uc = FunctionDeployment(
+            "foo",
+            "bar",
+            root_dir=samples_dir,
+            compile_sql_dir=str(tmp_path / "out"),
+            workspace_client=ws_client,
+        )
+        from samples.redact import redact
+        from samples.split_words import split_words
+
+        redact = uc.register(redact)
+        split_words = uc.register(split_words)
+        shared = uc.package_shared_helpers(str(tmp_path / "volume"))
+        uc.deploy()
+        assert ws_client.functions["foo.bar.redact"].dependencies == [
+            str(shared.wheel_path)
+        ]
+        data = '{"phone": 1}'
+        assert redact.remote(data) == redact(data)
+        assert split_words.remote("a phone") == [["0", "a"], ["1", "REDACTED"]]
+    # the wheel is only on sys.path while a function runs
+    assert str(shared.wheel_path) not in sys.path
+    sys.modules.pop(shared.package, None)
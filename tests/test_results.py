@@ -0,0 +1,96 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from databricks.sdk.service.sql import (
+    ExternalLink,
+    ResultData,
+    StatementResponse,
+    StatementState,
+    StatementStatus,
+)
+
+from uc_functions.results import iter_arrow_batches, iter_arrow_rows
+
+pa = pytest.importorskip("pyarrow")
+
+
+def arrow_chunk(rows) -> bytes:
+    batch = pa.RecordBatch.from_pylist(rows)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def link(index, last):
+    return ExternalLink(
+        external_link=f"https://storage/{index}",
+        chunk_index=index,
+        next_chunk_index=None if index == last else index + 1,
+    )
+
+
+def arrow_response(chunk_count):
+    # the first link comes with the response, the others are fetched by index
+    ws_client = MagicMock()
+    ws_client.statement_execution.get_statement_result_chunk_n.side_effect = (
+        lambda statement_id, index: ResultData(
+            external_links=[link(index, chunk_count - 1)]
+        )
+    )
+    resp = StatementResponse(
+        statement_id="stmt-1",
+        status=StatementStatus(state=StatementState.SUCCEEDED),
+        result=ResultData(external_links=[link(0, chunk_count - 1)]),
+    )
+    return ws_client, resp
+
+
+def test_iter_arrow_rows_follows_every_chunk_in_order():
+    ws_client, resp = arrow_response(3)
+    chunks = {
+        f"https://storage/{i}": arrow_chunk([{"idx": i, "value": f"v{i}"}])
+        for i in range(3)
+    }
+
+    def download(link, session):
+        # the first chunk is the slowest, rows must still come back in order
+        if link.chunk_index == 0:
+            time.sleep(0.05)
+        return chunks[link.external_link]
+
+    with patch("uc_functions.results.download_link", side_effect=download):
+        rows = list(iter_arrow_rows(ws_client, resp, prefetch=3))
+    assert rows == [(0, "v0"), (1, "v1"), (2, "v2")]
+    assert ws_client.statement_execution.get_statement_result_chunk_n.call_count == 2
+
+
+def test_iter_arrow_batches_bounds_prefetch():
+    ws_client, resp = arrow_response(6)
+    in_flight = []
+    lock = threading.Lock()
+    active = 0
+
+    def download(link, session):
+        nonlocal active
+        with lock:
+            active += 1
+            in_flight.append(active)
+        time.sleep(0.01)
+        with lock:
+            active -= 1
+        return arrow_chunk([{"idx": link.chunk_index}])
+
+    with patch("uc_functions.results.download_link", side_effect=download):
+        batches = list(iter_arrow_batches(ws_client, resp, prefetch=2))
+    assert len(batches) == 6
+    assert max(in_flight) <= 2
+
+
+def test_iter_arrow_rows_without_result():
+    resp = StatementResponse(
+        statement_id="stmt-1", status=StatementStatus(state=StatementState.SUCCEEDED)
+    )
+    assert list(iter_arrow_rows(MagicMock(), resp)) == []
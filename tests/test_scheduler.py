@@ -0,0 +1,103 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from uc_functions.scheduler import arun_dag, run_dag, topological_order
+
+
+def test_topological_order_keeps_insertion_order():
+    assert topological_order({"a": set(), "b": set(), "c": set()}) == ["a", "b", "c"]
+    assert topological_order({"a": {"c"}, "b": set(), "c": {"b"}}) == ["b", "c", "a"]
+
+
+def test_topological_order_cycle():
+    with pytest.raises(ValueError) as e:
+        topological_order({"a": {"b"}, "b": {"a"}})
+    assert "Cyclic dependencies" in str(e.value)
+
+
+def test_run_dag_respects_dependencies():
+    finished = []
+    lock = threading.Lock()
+
+    def task(name):
+        time.sleep(0.01)
+        with lock:
+            finished.append(name)
+
+    errors = run_dag(
+        {"a": set(), "b": {"a"}, "c": {"a"}, "d": {"b", "c"}}, task, concurrency=4
+    )
+    assert errors == {}
+    assert finished[0] == "a"
+    assert finished[-1] == "d"
+
+
+def test_run_dag_bounded_concurrency():
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def task(name):
+        with lock:
+            in_flight.append(name)
+            peak.append(len(in_flight))
+        time.sleep(0.02)
+        with lock:
+            in_flight.remove(name)
+
+    run_dag({str(i): set() for i in range(10)}, task, concurrency=3)
+    assert max(peak) == 3
+
+
+def test_run_dag_collects_errors_and_skips_dependents():
+    ran = []
+
+    def task(name):
+        ran.append(name)
+        if name == "a":
+            raise ValueError("boom")
+
+    errors = run_dag({"a": set(), "b": {"a"}, "c": {"b"}, "d": set()}, task)
+    assert sorted(ran) == ["a", "d"]
+    assert str(errors["a"]) == "boom"
+    assert "dependency a failed" in str(errors["b"])
+    assert "dependency b failed" in str(errors["c"])
+    assert "d" not in errors
+
+
+def test_arun_dag_respects_dependencies_and_errors():
+    finished = []
+
+    async def task(name):
+        await asyncio.sleep(0.01)
+        if name == "c":
+            raise ValueError("boom")
+        finished.append(name)
+
+    errors = asyncio.run(
+        arun_dag(
+            {"a": set(), "b": {"a"}, "c": {"a"}, "d": {"b"}, "e": {"c"}},
+            task,
+            concurrency=2,
+        )
+    )
+    assert finished == ["a", "b", "d"]
+    assert str(errors["c"]) == "boom"
+    assert "dependency c failed" in str(errors["e"])
+
+
+def test_arun_dag_bounded_concurrency():
+    in_flight = []
+    peak = []
+
+    async def task(name):
+        in_flight.append(name)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(name)
+
+    asyncio.run(arun_dag({str(i): set() for i in range(10)}, task, concurrency=3))
+    assert max(peak) == 3
@@ -0,0 +1,38 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+from uc_functions.session import WorkspaceSession
+
+
+def test_client_is_created_once_across_threads():
+    with patch("uc_functions.session.Config") as mock_config, patch(
+        "uc_functions.session.WorkspaceClient"
+    ) as mock_client:
+        session = WorkspaceSession(max_connections=8, host="https://example.com")
+        mock_client.assert_not_called()
+
+        clients = []
+        threads = [
+            threading.Thread(target=lambda: clients.append(session.client))
+            for _ in range(16)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert mock_client.call_count == 1
+    assert all(client is clients[0] for client in clients)
+    mock_config.assert_called_once_with(
+        max_connection_pools=8,
+        max_connections_per_pool=8,
+        host="https://example.com",
+    )
+
+
+def test_explicit_client_wins():
+    shared = MagicMock()
+    explicit = MagicMock()
+    session = WorkspaceSession(shared)
+    assert session.get_client() is shared
+    assert session.get_client(explicit) is explicit
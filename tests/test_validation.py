@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import pytest
+
+from uc_functions.functions import FunctionDeployment
+from uc_functions.validation import generate_inputs, strategy_for_sql_type, validate
+
+samples_dir = str(Path(__file__).parent / "samples")
+
+INPUTS = {
+    "redact": [('{"email": "a"}',), ("not json",), ("[1]",)],
+    "redact_w_secret": [('{"phone": 1}',)],
+    "split_words": [("a email b",), ("",)],
+    "CountChars": [("aab",)],
+}
+
+
+def deployment():
+    uc = FunctionDeployment("foo", "bar", root_dir=samples_dir)
+    from samples.redact import redact
+    from samples.redact_with_secret import redact_w_secret
+    from samples.split_words import CountChars, split_words
+
+    for function in (redact, redact_w_secret, split_words, CountChars):
+        uc.register(function)
+    return uc
+
+
+def test_validate_provided_inputs():
+    results = validate(deployment(), INPUTS, processes=2, timeout=30)
+    assert [r.function for r in results] == list(INPUTS)
+    for result in results:
+        assert result.passed, result
+        assert result.inputs == len(INPUTS[result.function])
+
+
+def test_validate_reports_mismatches_errors_and_timeouts():
+    uc = deployment()
+    for name in ("redact", "split_words", "CountChars"):
+        uc.serialize_fn(name)
+    uc.get_function("redact").function_inlined = "return maybe_json.upper()"
+    uc.get_function("split_words").function_inlined = "return ("
+    uc.get_function("CountChars").function_inlined = (
+        "import time\n\n\nclass CountChars:\n"
+        "    def eval(self, text):\n        time.sleep(30)\n        yield text, 1\n"
+    )
+    results = {
+        r.function: r
+        for r in validate(
+            uc,
+            INPUTS,
+            names=["redact", "split_words", "CountChars"],
+            processes=3,
+            timeout=2,
+        )
+    }
+    redact = results["redact"]
+    assert not redact.passed
+    # upper casing "[1]" changes nothing
+    assert [m.args for m in redact.mismatches] == INPUTS["redact"][:2]
+    assert redact.mismatches[1].original == "returned 'not json'"
+    assert redact.mismatches[1].inlined == "returned 'NOT JSON'"
+    assert "SyntaxError" in results["split_words"].error
+    assert results["CountChars"].timed_out
+    assert not results["CountChars"].passed
+
+
+def test_validate_generated_inputs():
+    pytest.importorskip("hypothesis")
+    uc = deployment()
+    inputs = generate_inputs(uc, "redact", examples=20)
+    assert 0 < len(inputs) <= 20
+    assert all(isinstance(args[0], str) for args in inputs)
+    # derandomized, the same corpus every time
+    assert generate_inputs(uc, "redact", examples=20) == inputs
+    results = validate(uc, names=["redact", "split_words"], examples=20, timeout=30)
+    assert all(result.passed for result in results), results
+
+
+def test_strategy_for_sql_type():
+    hypothesis = pytest.importorskip("hypothesis")
+    assert strategy_for_sql_type("MAP<STRING, ARRAY<INTEGER>>") is not None
+    with pytest.raises(ValueError):
+        strategy_for_sql_type("INTERVAL")
+    # structs are generated as the dicts the warehouse passes, not as python types
+    struct = strategy_for_sql_type("STRUCT<a: INTEGER, b: ARRAY<STRING>>")
+    value = hypothesis.find(struct, lambda _: True)
+    assert isinstance(value, dict) and set(value) == {"a", "b"}
@@ -0,0 +1,125 @@
+from unittest.mock import MagicMock
+
+from databricks.sdk.service.sql import EndpointInfo, State
+
+from uc_functions.warehouses import WarehouseResolver
+
+
+def workspace_client(*warehouses):
+    ws_client = MagicMock()
+    ws_client.warehouses.list.side_effect = lambda: iter(warehouses)
+    return ws_client
+
+
+def test_resolve_prefers_running_serverless_warehouses():
+    ws_client = workspace_client(
+        EndpointInfo(id="stopped", enable_serverless_compute=True, state=State.STOPPED),
+        EndpointInfo(
+            id="classic", enable_serverless_compute=False, state=State.RUNNING
+        ),
+        EndpointInfo(id="running", enable_serverless_compute=True, state=State.RUNNING),
+    )
+    assert WarehouseResolver().resolve(ws_client) == "running"
+
+
+def test_resolve_falls_back_to_first_serverless_warehouse():
+    ws_client = workspace_client(
+        EndpointInfo(
+            id="classic", enable_serverless_compute=False, state=State.RUNNING
+        ),
+        EndpointInfo(id="first", enable_serverless_compute=True, state=State.STOPPED),
+        EndpointInfo(id="second", enable_serverless_compute=True, state=State.STOPPED),
+    )
+    assert WarehouseResolver().resolve(ws_client) == "first"
+
+
+def test_resolve_caches_with_ttl():
+    ws_client = workspace_client(
+        EndpointInfo(id="running", enable_serverless_compute=True, state=State.RUNNING)
+    )
+    resolver = WarehouseResolver(ttl=60)
+    assert resolver.resolve(ws_client) == "running"
+    assert resolver.resolve(ws_client) == "running"
+    assert ws_client.warehouses.list.call_count == 1
+
+    resolver.invalidate()
+    resolver.resolve(ws_client)
+    assert ws_client.warehouses.list.call_count == 2
+
+    expired = WarehouseResolver(ttl=0)
+    expired.resolve(ws_client)
+    expired.resolve(ws_client)
+    assert ws_client.warehouses.list.call_count == 4
+
+
+def test_resolve_pinned_warehouse():
+    ws_client = workspace_client()
+    assert WarehouseResolver(warehouse_id="pinned").resolve(ws_client) == "pinned"
+    ws_client.warehouses.list.assert_not_called()
+
+
+def test_warm_starts_stopped_warehouse():
+    ws_client = workspace_client(
+        EndpointInfo(id="stopped", enable_serverless_compute=True, state=State.STOPPED)
+    )
+    resolver = WarehouseResolver()
+    assert resolver.warm(ws_client).result(timeout=5) == "stopped"
+    ws_client.warehouses.start.assert_called_once_with("stopped")
+    # the warmed warehouse is cached for later lookups
+    assert resolver.resolve(ws_client) == "stopped"
+    assert ws_client.warehouses.list.call_count == 1
+
+
+def test_warm_running_warehouse_is_not_started():
+    ws_client = workspace_client(
+        EndpointInfo(id="running", enable_serverless_compute=True, state=State.RUNNING)
+    )
+    assert WarehouseResolver().warm(ws_client).result(timeout=5) == "running"
+    ws_client.warehouses.start.assert_not_called()
+
+
+def test_warm_pinned_warehouse():
+    ws_client = workspace_client()
+    ws_client.warehouses.get.return_value = EndpointInfo(
+        id="pinned", state=State.STOPPED
+    )
+    resolver = WarehouseResolver(warehouse_id="pinned")
+    assert resolver.warm(ws_client).result(timeout=5) == "pinned"
+    ws_client.warehouses.start.assert_called_once_with("pinned")
+
+
+def test_warm_is_best_effort():
+    ws_client = workspace_client(
+        EndpointInfo(id="stopped", enable_serverless_compute=True, state=State.STOPPED)
+    )
+    ws_client.warehouses.get.side_effect = PermissionError("no access")
+    ws_client.warehouses.start.side_effect = PermissionError("no access")
+    # the known id is returned when the warehouse can not be inspected or started
+    pinned = WarehouseResolver(warehouse_id="pinned")
+    assert pinned.warm(ws_client).result(timeout=5) == "pinned"
+    assert WarehouseResolver().warm(ws_client).result(timeout=5) == "stopped"
+    ws_client.warehouses.start.assert_called_once_with("stopped")
+
+
+def test_warm_uses_the_cached_warehouse():
+    ws_client = workspace_client(
+        EndpointInfo(id="running", enable_serverless_compute=True, state=State.RUNNING)
+    )
+    resolver = WarehouseResolver(ttl=60)
+    for _ in range(3):
+        assert resolver.warm(ws_client).result(timeout=5) == "running"
+    assert ws_client.warehouses.list.call_count == 1
+
+
+def test_cache_is_per_workspace_client():
+    a = workspace_client(
+        EndpointInfo(id="a", enable_serverless_compute=True, state=State.RUNNING)
+    )
+    b = workspace_client(
+        EndpointInfo(id="b", enable_serverless_compute=True, state=State.RUNNING)
+    )
+    resolver = WarehouseResolver(ttl=60)
+    assert resolver.resolve(a) == "a"
+    assert resolver.resolve(b) == "b"
+    assert resolver.warm(a).result(timeout=5) == "a"
+    assert a.warehouses.list.call_count == b.warehouses.list.call_count == 1
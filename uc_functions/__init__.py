@@ -1,2 +1,7 @@
-from uc_functions.functions import FunctionDeployment
+from uc_functions.functions import (
+    DeploymentError,
+    FunctionDeployment,
+    SizeBudgetError,
+    Target,
+)
 from uc_functions.special_kwargs import DatabricksSecret
@@ -0,0 +1,312 @@
+import argparse
+import importlib
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from uc_functions.functions import FunctionDeployment
+from uc_functions.inline import RecursiveResolver, generate_ast_dict
+from uc_functions.special_kwargs import DatabricksSecret
+
+# Benchmarks the compile pipeline (indexing, resolution, inlining, formatting and
+# end to end compile) over synthetic source trees.
+#
+#   python -m uc_functions.benchmarks.compile --baseline compile_baseline.json
+#
+# exits with 1 when a phase is slower or uses more memory than the baseline by
+# more than the threshold, --update-baseline stores the current results instead.
+
+
+@dataclass
+class SyntheticTreeConfig:
+    # entry functions are spread over files, every entry function calls a tree of
+    # helpers depth levels deep with fan_out calls per helper. shared_ratio of the
+    # entry functions call the one shared helper tree instead of a private one.
+    files: int = 5
+    functions_per_file: int = 2
+    depth: int = 2
+    fan_out: int = 2
+    shared_ratio: float = 0.5
+    constant_size: int = 10
+    seed: int = 0
+
+
+SCENARIOS = {
+    "small": SyntheticTreeConfig(),
+    "wide": SyntheticTreeConfig(files=10, functions_per_file=3, depth=1, fan_out=4),
+    "deep": SyntheticTreeConfig(files=4, functions_per_file=2, depth=5, fan_out=1),
+    "shared": SyntheticTreeConfig(files=5, functions_per_file=4, shared_ratio=1.0),
+    "large_constants": SyntheticTreeConfig(constant_size=1000),
+}
+
+
+def _helper_source(name: str, children: List[str], constant: str) -> str:
+    if not children:
+        return (
+            f"def {name}(value):\n"
+            f"    for item in {constant}[:3]:\n"
+            f"        value = value.replace(item, '')\n"
+            f"    return value[:8]\n"
+        )
+    calls = " + ".join([f"{child}(value)" for child in children])
+    return f"def {name}(value):\n    return ({calls})[:64]\n"
+
+
+def _helper_tree(prefix: str, config: SyntheticTreeConfig, constants: int) -> list:
+    # (name, source) of every helper of one tree, the root helper comes first
+    helpers = []
+    level = [f"{prefix}_0_0"]
+    for depth in range(config.depth + 1):
+        next_level = []
+        for index, name in enumerate(level):
+            children = []
+            if depth < config.depth:
+                children = [
+                    f"{prefix}_{depth + 1}_{index * config.fan_out + i}"
+                    for i in range(config.fan_out)
+                ]
+            constant = f"CONSTANT_{(len(helpers) + index) % constants}"
+            helpers.append((name, _helper_source(name, children, constant)))
+            next_level.extend(children)
+        level = next_level
+    return helpers
+
+
+def generate_source_tree(
+    root: str, config: SyntheticTreeConfig, package: str = "uc_bench_synthetic"
+) -> List[str]:
+    # writes the package below root and returns the module paths of the entry
+    # functions as module:function
+    rng = random.Random(config.seed)
+    package_dir = Path(root) / package
+    package_dir.mkdir(parents=True, exist_ok=True)
+    (package_dir / "__init__.py").write_text("")
+
+    constants = max(config.files, 1)
+    (package_dir / "constants.py").write_text(
+        "\n".join(
+            [
+                f"CONSTANT_{i} = {[f'c{i}_{j}' for j in range(config.constant_size)]!r}"
+                for i in range(constants)
+            ]
+        )
+        + "\n"
+    )
+    constant_imports = ", ".join([f"CONSTANT_{i}" for i in range(constants)])
+    shared = _helper_tree("shared", config, constants)
+    (package_dir / "shared.py").write_text(
+        f"from {package}.constants import {constant_imports}\n\n\n"
+        + "\n\n".join([source for _, source in shared])
+    )
+
+    entries = []
+    for file_index in range(config.files):
+        module = f"functions_{file_index}"
+        blocks = [
+            f"from {package}.constants import {constant_imports}\n"
+            f"from {package}.shared import {shared[0][0]}\n"
+        ]
+        for function_index in range(config.functions_per_file):
+            name = f"fn_{file_index}_{function_index}"
+            if rng.random() < config.shared_ratio:
+                root_helper = shared[0][0]
+            else:
+                private = _helper_tree(f"private_{name}", config, constants)
+                blocks.extend([source for _, source in private])
+                root_helper = private[0][0]
+            blocks.append(
+                f"def {name}(value: str) -> str:\n    return {root_helper}(value)\n"
+            )
+            entries.append(f"{package}.{module}:{name}")
+        (package_dir / f"{module}.py").write_text("\n\n".join(blocks))
+    return entries
+
+
+def load_entries(root: str, entries: List[str]) -> List[Callable]:
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    functions = []
+    for entry in entries:
+        module_name, function_name = entry.split(":")
+        functions.append(getattr(importlib.import_module(module_name), function_name))
+    return functions
+
+
+def unload_package(package: str):
+    for module_name in list(sys.modules):
+        if module_name == package or module_name.startswith(f"{package}."):
+            del sys.modules[module_name]
+
+
+@dataclass
+class PhaseResult:
+    seconds: float
+    peak_bytes: int
+
+
+@dataclass
+class BenchmarkResult:
+    scenario: str
+    config: dict
+    functions: int
+    phases: Dict[str, PhaseResult] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def measure(fn: Callable, repeat: int = 3) -> PhaseResult:
+    # best of repeat runs for time, one extra traced run for peak memory as
+    # tracemalloc slows everything down.
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return PhaseResult(seconds=min(seconds), peak_bytes=peak)
+
+
+def run_scenario(
+    scenario: str, config: SyntheticTreeConfig, repeat: int = 3
+) -> BenchmarkResult:
+    package = f"uc_bench_{scenario}"
+    with tempfile.TemporaryDirectory() as root:
+        entries = generate_source_tree(root, config, package=package)
+        functions = load_entries(root, entries)
+        globals_dict = {f.__name__: f for f in functions}
+        result = BenchmarkResult(
+            scenario=scenario, config=asdict(config), functions=len(functions)
+        )
+
+        def index():
+            generate_ast_dict.cache_clear()
+            generate_ast_dict(root)
+
+        def resolvers() -> List[RecursiveResolver]:
+            name_ast_dict = generate_ast_dict(root)
+            resolved = []
+            for function in functions:
+                resolver = RecursiveResolver(
+                    skip_classes=[DatabricksSecret],
+                    name_ast_dict=name_ast_dict,
+                    args_names_predefined=["value"],
+                )
+                resolver.resolve(function, globals_dict, is_root_function=True)
+                resolved.append(resolver)
+            return resolved
+
+        def inline():
+            for resolver in resolvers():
+                resolver.get_inline(globals_dict)
+
+        inlined = [resolver.get_inline(globals_dict) for resolver in resolvers()]
+
+        def format_code():
+            for code in inlined:
+                RecursiveResolver.format(code)
+
+        def compile_all():
+            generate_ast_dict.cache_clear()
+            uc = FunctionDeployment(
+                "bench", "bench", root_dir=root, compile_sql_dir=f"{root}/compile"
+            )
+            for function in functions:
+                uc.register(function)
+            uc.compile()
+
+        try:
+            result.phases["index"] = measure(index, repeat)
+            result.phases["resolve"] = measure(resolvers, repeat)
+            result.phases["inline"] = measure(inline, repeat)
+            result.phases["format"] = measure(format_code, repeat)
+            result.phases["compile"] = measure(compile_all, repeat)
+        finally:
+            generate_ast_dict.cache_clear()
+            sys.path.remove(root)
+            unload_package(package)
+    return result
+
+
+def check_regressions(
+    results: List[BenchmarkResult], baseline: dict, threshold: float = 0.25
+) -> List[str]:
+    # a phase regresses when it is more than threshold slower or bigger than the
+    # baseline, scenarios or phases missing from the baseline are not compared
+    regressions = []
+    for result in results:
+        baseline_phases = baseline.get(result.scenario, {}).get("phases", {})
+        for phase, current in result.phases.items():
+            if phase not in baseline_phases:
+                continue
+            for metric in ("seconds", "peak_bytes"):
+                expected = baseline_phases[phase][metric]
+                actual = getattr(current, metric)
+                if expected > 0 and actual > expected * (1 + threshold):
+                    regressions.append(
+                        f"{result.scenario}.{phase}.{metric}: {actual:.4g} > "
+                        f"{expected:.4g} (+{(actual / expected - 1) * 100:.0f}%)"
+                    )
+    return regressions
+
+
+def load_baseline(path: str) -> dict:
+    if not Path(path).exists():
+        return {}
+    return json.loads(Path(path).read_text())
+
+
+def save_baseline(results: List[BenchmarkResult], path: str):
+    baseline = load_baseline(path)
+    baseline.update({result.scenario: result.to_dict() for result in results})
+    Path(path).write_text(json.dumps(baseline, indent=2, sort_keys=True))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the compile pipeline")
+    parser.add_argument(
+        "--scenario", action="append", choices=sorted(SCENARIOS), default=None
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = []
+    for scenario in args.scenario or list(SCENARIOS):
+        result = run_scenario(scenario, SCENARIOS[scenario], repeat=args.repeat)
+        results.append(result)
+        for phase, phase_result in result.phases.items():
+            print(
+                f"{scenario:<16} {phase:<8} {phase_result.seconds * 1000:10.2f} ms "
+                f"{phase_result.peak_bytes / 1024:10.0f} KiB"
+            )
+
+    if args.baseline is None:
+        return 0
+    if args.update_baseline:
+        save_baseline(results, args.baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    regressions = check_regressions(
+        results, load_baseline(args.baseline), threshold=args.threshold
+    )
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+import argparse
+import contextlib
+import io
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Callable, List, Optional
+
+from uc_functions.benchmarks.compile import (
+    SyntheticTreeConfig,
+    generate_source_tree,
+    load_entries,
+    unload_package,
+)
+from uc_functions.emulator import LOCAL_WAREHOUSE_ID, EmulatedWorkspaceClient
+from uc_functions.functions import FunctionDeployment, run_sql
+from uc_functions.inline import generate_ast_dict
+
+# Benchmarks deploy, run_sql, remote and remote_map against the emulated
+# workspace client with injected latency, failures and rate limits.
+#
+#   python -m uc_functions.benchmarks.deploy --functions 50 --concurrency 1 4 16 \
+#       --latency lognormal:0.2:0.5 --failure-rate 0.01 --rate-limit 20
+#
+# the emulator never waits on the server longer than --max-wait seconds so that
+# slow statements are polled like long running ones on a real warehouse.
+
+OPERATIONS = ("deploy", "run_sql", "remote", "remote_map")
+
+
+def latency_distribution(spec: str, seed: int = 0) -> Callable[[], float]:
+    # fixed:SECONDS, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA
+    kind, *values = spec.split(":")
+    try:
+        values = [float(value) for value in values]
+    except ValueError:
+        raise ValueError(f"Invalid latency distribution: {spec}")
+    rng = random.Random(seed)
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: rng.uniform(*values)
+    if kind == "lognormal" and len(values) == 2:
+        median, sigma = values
+        return lambda: median * rng.lognormvariate(0, sigma)
+    raise ValueError(f"Invalid latency distribution: {spec}")
+
+
+@dataclass
+class StubConfig:
+    latency: str = "fixed:0.01"
+    failure_rate: float = 0.0
+    rate_limit: Optional[float] = None
+    max_wait: Optional[float] = None
+    seed: int = 0
+
+    def make_client(self, concurrency: int) -> EmulatedWorkspaceClient:
+        return EmulatedWorkspaceClient(
+            latency=latency_distribution(self.latency, self.seed),
+            concurrency=max(32, concurrency),
+            failure_rate=self.failure_rate,
+            rate_limit=self.rate_limit,
+            max_wait=self.max_wait,
+            seed=self.seed,
+        )
+
+
+@dataclass
+class HarnessResult:
+    operation: str
+    concurrency: int
+    operations: int
+    wall_seconds: float
+    statements: int
+    polls: int
+    failures: int
+    throttled: int
+    latencies: List[float] = field(default_factory=list, repr=False)
+
+    @property
+    def polls_per_statement(self) -> float:
+        return self.polls / self.statements if self.statements else 0.0
+
+    @property
+    def throughput(self) -> float:
+        # operations per second, functions for deploy and calls or rows otherwise
+        return self.operations / self.wall_seconds if self.wall_seconds else 0.0
+
+    def latency_percentile(self, percentile: int) -> float:
+        if len(self.latencies) < 2:
+            return self.latencies[0] if self.latencies else 0.0
+        return statistics.quantiles(self.latencies, n=100)[percentile - 1]
+
+    def to_dict(self) -> dict:
+        result = asdict(self)
+        del result["latencies"]
+        result["polls_per_statement"] = self.polls_per_statement
+        result["throughput"] = self.throughput
+        result["p50_seconds"] = self.latency_percentile(50)
+        result["p95_seconds"] = self.latency_percentile(95)
+        return result
+
+
+def _measure(
+    operation: str,
+    concurrency: int,
+    operations: int,
+    ws_client: EmulatedWorkspaceClient,
+    uc: FunctionDeployment,
+    fn: Callable,
+) -> HarnessResult:
+    # statement counts come from the stats run_sql records, failures are
+    # statements that did not succeed as failed deploys and calls raise
+    uc.clear_statement_stats()
+    ws_client.throttled = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            fn()
+        except ValueError:
+            pass
+    wall_seconds = time.perf_counter() - start
+    stats = list(uc.statement_stats)
+    return HarnessResult(
+        operation=operation,
+        concurrency=concurrency,
+        operations=operations,
+        wall_seconds=wall_seconds,
+        statements=len(stats),
+        polls=sum(s.polls for s in stats),
+        failures=len([s for s in stats if s.state != "SUCCEEDED"]),
+        throttled=ws_client.throttled,
+        latencies=[s.elapsed for s in stats],
+    )
+
+
+def run_benchmark(
+    functions: int = 20,
+    concurrency_levels: List[int] = (1, 4, 16),
+    stub: StubConfig = None,
+    operations: List[str] = OPERATIONS,
+    calls: int = None,
+    chunk_size: int = 100,
+) -> List[HarnessResult]:
+    # calls defaults to the number of functions, remote_map evaluates calls *
+    # chunk_size rows in chunks of chunk_size
+    stub = stub or StubConfig()
+    calls = calls or functions
+    unknown = set(operations) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Unknown operations: {', '.join(sorted(unknown))}")
+    package = "uc_bench_deploy"
+    config = SyntheticTreeConfig(
+        files=functions, functions_per_file=1, depth=0, fan_out=1, shared_ratio=1.0
+    )
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        entries = generate_source_tree(root, config, package=package)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                # every measured statement is kept, _measure clears them
+                uc = FunctionDeployment(
+                    "bench",
+                    "bench",
+                    root_dir=root,
+                    compile_sql_dir=f"{root}/compile",
+                    statement_stats_limit=None,
+                )
+                registered = [uc.register(f) for f in load_entries(root, entries)]
+                # compiling is measured by the compile benchmark, only the
+                # statements are measured here
+                uc.compile()
+            for concurrency in concurrency_levels:
+                with stub.make_client(concurrency) as ws_client:
+                    results.extend(
+                        _run_operations(
+                            uc,
+                            registered,
+                            ws_client,
+                            concurrency,
+                            operations,
+                            calls,
+                            chunk_size,
+                        )
+                    )
+        finally:
+            generate_ast_dict.cache_clear()
+            sys.path.remove(root)
+            unload_package(package)
+    return results
+
+
+def _run_operations(
+    uc: FunctionDeployment,
+    registered: list,
+    ws_client: EmulatedWorkspaceClient,
+    concurrency: int,
+    operations: List[str],
+    calls: int,
+    chunk_size: int,
+) -> List[HarnessResult]:
+    target = dict(workspace_client=ws_client, warehouse_id=LOCAL_WAREHOUSE_ID)
+    stats = uc.statement_stats
+    results = []
+
+    def call_concurrently(fn):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(fn, i) for i in range(calls)]:
+                try:
+                    future.result()
+                except ValueError:
+                    pass
+
+    def deploy():
+        uc.deploy(concurrency=concurrency, **target)
+
+    def run_statements():
+        # the cheapest statement the emulator understands, measures the
+        # statement round trip alone
+        statement = "DROP FUNCTION IF EXISTS bench.bench.missing"
+        call_concurrently(
+            lambda i: run_sql(ws_client, LOCAL_WAREHOUSE_ID, statement, stats=stats)
+        )
+
+    def remote():
+        call_concurrently(
+            lambda i: registered[i % len(registered)].remote(f"value-{i}", **target)
+        )
+
+    def remote_map():
+        registered[0].remote_map(
+            [(f"value-{i}",) for i in range(calls * chunk_size)],
+            chunk_size=chunk_size,
+            concurrency=concurrency,
+            **target,
+        )
+
+    if "deploy" not in operations and {"remote", "remote_map"} & set(operations):
+        # remote calls need the functions, deploy them without measuring
+        with contextlib.redirect_stdout(io.StringIO()):
+            deploy()
+    measured = {
+        "deploy": (len(registered), deploy),
+        "run_sql": (calls, run_statements),
+        "remote": (calls, remote),
+        "remote_map": (calls * chunk_size, remote_map),
+    }
+    for operation in operations:
+        count, fn = measured[operation]
+        results.append(_measure(operation, concurrency, count, ws_client, uc, fn))
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark deploy and remote against an emulated workspace"
+    )
+    parser.add_argument("--functions", type=int, default=20)
+    parser.add_argument("--calls", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument(
+        "--operation", action="append", choices=OPERATIONS, default=None
+    )
+    parser.add_argument("--latency", default="fixed:0.01")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    parser.add_argument("--max-wait", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    stub = StubConfig(
+        latency=args.latency,
+        failure_rate=args.failure_rate,
+        rate_limit=args.rate_limit,
+        max_wait=args.max_wait,
+        seed=args.seed,
+    )
+    results = run_benchmark(
+        functions=args.functions,
+        concurrency_levels=args.concurrency,
+        stub=stub,
+        operations=args.operation or list(OPERATIONS),
+        calls=args.calls,
+        chunk_size=args.chunk_size,
+    )
+    print(
+        f"{'operation':<12} {'conc':>4} {'wall s':>8} {'stmts':>6} {'polls/st':>8} "
+        f"{'fail':>5} {'thrott':>6} {'p95 s':>7} {'ops/s':>9}"
+    )
+    for result in results:
+        print(
+            f"{result.operation:<12} {result.concurrency:>4} "
+            f"{result.wall_seconds:>8.3f} {result.statements:>6} "
+            f"{result.polls_per_statement:>8.2f} {result.failures:>5} "
+            f"{result.throttled:>6} {result.latency_percentile(95):>7.3f} "
+            f"{result.throughput:>9.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+import argparse
+import contextlib
+import datetime
+import importlib
+import io
+import json
+import logging
+import sys
+import timeit
+import tracemalloc
+from dataclasses import asdict, dataclass
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from uc_functions.functions import FunctionDeployment, load_original
+from uc_functions.special_kwargs import DatabricksSecret
+
+logger = logging.getLogger(__name__)
+
+# Compares the per call cost of the generated bodies with the registered
+# functions, locally and before deploying. Inlined bodies re-run their imports
+# and constant construction on every call which the originals only do once.
+#
+#   python -m uc_functions.benchmarks.runtime entrypoint:uc --import my_functions \
+#       --inputs inputs.json --threshold 1.5
+#
+# inputs.json maps function names to lists of argument lists, functions without
+# inputs get one sample row when all of their argument types are scalar. Exits
+# with 1 when a generated body is slower than threshold times the original.
+
+SAMPLE_VALUES = {
+    "STRING": "sample",
+    "INTEGER": 1,
+    "FLOAT": 1.5,
+    "BOOLEAN": True,
+    "BINARY": b"sample",
+    "DECIMAL(38, 18)": Decimal("1.5"),
+    "DATE": datetime.date(2024, 1, 1),
+    "TIMESTAMP": datetime.datetime(2024, 1, 1, 12, 0),
+}
+
+
+@dataclass
+class RuntimeResult:
+    function: str
+    inputs: int
+    # seconds per call, best of the repeats
+    original_seconds: float
+    inlined_seconds: float
+    # peak traced memory of one pass over the inputs
+    original_peak_bytes: int
+    inlined_peak_bytes: int
+    flagged: bool = False
+
+    @property
+    def overhead_ratio(self) -> float:
+        if self.original_seconds == 0:
+            return 0.0
+        return self.inlined_seconds / self.original_seconds
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "overhead_ratio": self.overhead_ratio}
+
+
+def secret_kwargs(uc: FunctionDeployment, name: str) -> dict:
+    # secrets are resolved by the warehouse, locally both sides get the default
+    return {
+        arg_name: arg.default.default_value
+        for arg_name, arg in uc.get_function(name).args.items()
+        if isinstance(arg.default, DatabricksSecret)
+    }
+
+
+def sample_inputs(uc: FunctionDeployment, name: str) -> Optional[List[tuple]]:
+    args = [arg for arg in uc.get_function(name).args.values() if arg.default is None]
+    if any(arg.type not in SAMPLE_VALUES for arg in args):
+        return None
+    return [tuple(SAMPLE_VALUES[arg.type] for arg in args)]
+
+
+def _time_per_call(
+    fn: Callable, inputs: List[tuple], kwargs: dict, number: int, repeat: int
+) -> float:
+    def run():
+        for args in inputs:
+            fn(*args, **kwargs)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        best = min(timeit.Timer(run).repeat(repeat=repeat, number=number))
+    return best / (number * len(inputs))
+
+
+def _peak_bytes(fn: Callable, inputs: List[tuple], kwargs: dict) -> int:
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        try:
+            for args in inputs:
+                fn(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return peak
+
+
+def benchmark_function(
+    uc: FunctionDeployment,
+    name: str,
+    inputs: List[tuple],
+    number: int = 1000,
+    repeat: int = 3,
+    threshold: float = 1.5,
+) -> RuntimeResult:
+    if not inputs:
+        raise ValueError(f"No inputs to benchmark {name} with")
+    uc.serialize_fn(name)
+    original = load_original(uc.get_original_function(name))
+    inlined = uc.get_function(name).load_inlined()
+    kwargs = secret_kwargs(uc, name)
+    inputs = [tuple(args) for args in inputs]
+    result = RuntimeResult(
+        function=name,
+        inputs=len(inputs),
+        original_seconds=_time_per_call(original, inputs, kwargs, number, repeat),
+        inlined_seconds=_time_per_call(inlined, inputs, kwargs, number, repeat),
+        original_peak_bytes=_peak_bytes(original, inputs, kwargs),
+        inlined_peak_bytes=_peak_bytes(inlined, inputs, kwargs),
+    )
+    result.flagged = result.overhead_ratio > threshold
+    return result
+
+
+def run_benchmark(
+    uc: FunctionDeployment,
+    inputs: Dict[str, List[tuple]] = None,
+    number: int = 1000,
+    repeat: int = 3,
+    threshold: float = 1.5,
+) -> List[RuntimeResult]:
+    inputs = inputs or {}
+    results = []
+    for name in uc.function_names():
+        with contextlib.redirect_stdout(io.StringIO()):
+            uc.serialize_fn(name)
+        function_inputs = inputs.get(name) or sample_inputs(uc, name)
+        if function_inputs is None:
+            logger.info(
+                "Skipping %s: no inputs and no sample values for its arguments", name
+            )
+            continue
+        results.append(
+            benchmark_function(
+                uc,
+                name,
+                function_inputs,
+                number=number,
+                repeat=repeat,
+                threshold=threshold,
+            )
+        )
+    return results
+
+
+def load_deployment(target: str) -> FunctionDeployment:
+    module_name, attribute = target.split(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark generated function bodies against the originals"
+    )
+    parser.add_argument("target", help="module:attribute of the FunctionDeployment")
+    parser.add_argument(
+        "--import",
+        dest="imports",
+        action="append",
+        default=[],
+        help="modules registering the functions",
+    )
+    parser.add_argument("--inputs", default=None)
+    parser.add_argument("--number", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=1.5)
+    args = parser.parse_args(argv)
+    # skipped functions are reported through logging
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if "" not in sys.path:
+        sys.path.insert(0, "")
+    uc = load_deployment(args.target)
+    for module_name in args.imports:
+        importlib.import_module(module_name)
+    inputs = {}
+    if args.inputs is not None:
+        inputs = json.loads(Path(args.inputs).read_text())
+    results = run_benchmark(
+        uc,
+        inputs,
+        number=args.number,
+        repeat=args.repeat,
+        threshold=args.threshold,
+    )
+    for result in results:
+        print(
+            f"{result.function:<32} {result.original_seconds * 1e6:10.2f} us "
+            f"{result.inlined_seconds * 1e6:10.2f} us "
+            f"{result.overhead_ratio:6.2f}x "
+            f"{result.inlined_peak_bytes / 1024:8.1f} KiB"
+            f"{'  SLOW' if result.flagged else ''}"
+        )
+    return 1 if any(result.flagged for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
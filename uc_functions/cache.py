@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+
+class RemoteResultCache:
+
+    def __init__(
+        self, max_entries: int = 1024, ttl: float = None, path: Optional[str] = None
+    ):
+        # least recently used entries are evicted past max_entries, entries older
+        # than ttl seconds are ignored. When path is set entries are also written
+        # there as json files and survive the process.
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = None if path is None else Path(path)
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        # keys of the files on disk, oldest first, so that bounding the
+        # directory does not list it on every write. Files written by other
+        # processes are picked up the next time a cache is created.
+        self._files: OrderedDict[str, None] = OrderedDict()
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            files = sorted(self.path.glob("*.json"), key=lambda p: p.stat().st_mtime)
+            self._files.update((file.stem, None) for file in files)
+
+    @staticmethod
+    def make_key(
+        function_name: str,
+        content_hash: str,
+        args,
+        host: Optional[str] = None,
+        warehouse_id: Optional[str] = None,
+    ) -> str:
+        # the content hash changes whenever the compiled function changes, the
+        # workspace host and warehouse keep results of other targets apart
+        payload = json.dumps(
+            [function_name, content_hash, args, host, warehouse_id],
+            sort_keys=True,
+            default=repr,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _is_expired(self, entry: dict) -> bool:
+        return self.ttl is not None and time.time() - entry["created"] > self.ttl
+
+    def _read_file(self, key: str) -> Optional[dict]:
+        if self.path is None:
+            return None
+        try:
+            return json.loads((self.path / f"{key}.json").read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_file(self, key: str, entry: dict):
+        if self.path is None:
+            return
+        # write then rename so that readers never see a partial file
+        tmp_path = self.path / f"{key}.{threading.get_ident()}.tmp"
+        tmp_path.write_text(json.dumps(entry))
+        os.replace(tmp_path, self.path / f"{key}.json")
+        self._files[key] = None
+        self._files.move_to_end(key)
+        while len(self._files) > self.max_entries:
+            stale, _ = self._files.popitem(last=False)
+            (self.path / f"{stale}.json").unlink(missing_ok=True)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        # returns (hit, value) as None is a valid cached result
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._read_file(key)
+                if entry is not None:
+                    self._entries[key] = entry
+            if entry is None:
+                return False, None
+            if self._is_expired(entry):
+                self._remove(key)
+                return False, None
+            self._entries.move_to_end(key)
+            self._evict()
+            return True, entry["value"]
+
+    def set(self, key: str, value, function_name: str = None):
+        entry = {"function": function_name, "created": time.time(), "value": value}
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+            self._write_file(key, entry)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        if self.path is not None:
+            self._files.pop(key, None)
+            (self.path / f"{key}.json").unlink(missing_ok=True)
+
+    def invalidate(self, function_name: str):
+        # drops every entry of a function, e.g. after it was redeployed
+        with self._lock:
+            keys = [
+                k for k, e in self._entries.items() if e["function"] == function_name
+            ]
+            if self.path is not None:
+                for file in self.path.glob("*.json"):
+                    entry = self._read_file(file.stem)
+                    if entry is not None and entry["function"] == function_name:
+                        keys.append(file.stem)
+            for key in keys:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries.keys()):
+                self._remove(key)
+            if self.path is not None:
+                self._files.clear()
+                for file in self.path.glob("*.json"):
+                    file.unlink(missing_ok=True)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,569 @@
+import base64
+import contextlib
+import dataclasses
+import datetime
+import json
+import random
+import re
+import sys
+import textwrap
+import threading
+import time
+import uuid
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from concurrent.futures import wait as wait_futures
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Union
+
+from databricks.sdk.service.sql import (
+    EndpointInfo,
+    ResultData,
+    ServiceError,
+    State,
+    StatementParameterListItem,
+    StatementResponse,
+    StatementState,
+    StatementStatus,
+)
+
+from uc_functions.functions import (
+    is_complex_sql_type,
+    split_top_level,
+    to_json_compatible,
+)
+
+# Local stand-in for the statement execution and warehouses apis used by run_sql,
+# deploy and remote. It understands the statements this package emits, keeps the
+# created functions in memory and runs their python bodies in process or in
+# worker processes.
+
+LOCAL_WAREHOUSE_ID = "local"
+
+DROP_PATTERN = re.compile(r"^DROP FUNCTION IF EXISTS ([\w.]+);?$")
+CREATE_PATTERN = re.compile(
+    r"^CREATE OR REPLACE FUNCTION ([\w.]+)\((.*?)\)\s*\n"
+    r"RETURNS (.*?)\n"
+    r"LANGUAGE (PYTHON|SQL)(.*?)\n"
+    r"(?:AS \$\$\n(.*)\n\$\$|RETURN (.*?));?$",
+    re.S,
+)
+ROUTINES_PATTERN = re.compile(
+    r"^SELECT routine_name, comment FROM (\w+)\.information_schema\.routines "
+    r"WHERE routine_schema = '(.*)'$"
+)
+MAP_PATTERN = re.compile(
+    r"^SELECT _idx, ([\w.]+)\((.*)\) FROM \(SELECT inline\(from_json\(:(\w+), "
+    r"'ARRAY<STRUCT<(.*)>>'\)\)\) ORDER BY _idx$"
+)
+TABLE_CALL_PATTERN = re.compile(r"^SELECT \* FROM ([\w.]+)\((.*)\)$", re.S)
+CALL_PATTERN = re.compile(r"^SELECT ([\w.]+)\((.*)\)$", re.S)
+HANDLER_PATTERN = re.compile(r"HANDLER '([^']*)'")
+COMMENT_PATTERN = re.compile(r"COMMENT '((?:[^'\\]|\\.)*)'")
+ENVIRONMENT_PATTERN = re.compile(r"ENVIRONMENT \(dependencies = '(.*?)'")
+SECRET_PATTERN = re.compile(r'^secret\("(.*)", "(.*)"\)$')
+FROM_JSON_PATTERN = re.compile(r"^from_json\(:(\w+), '(.*)'\)$")
+UNBASE64_PATTERN = re.compile(r"^unbase64\(:(\w+)\)$")
+
+
+class StatementError(Exception):
+    pass
+
+
+def from_sql_string(value: Optional[str], sql_type: str):
+    # statement parameters and json fields carry scalars as strings
+    if value is None:
+        return None
+    sql_type = sql_type.upper()
+    if sql_type in ("INT", "INTEGER", "BIGINT", "SMALLINT", "TINYINT"):
+        return int(value)
+    if sql_type in ("FLOAT", "DOUBLE"):
+        return float(value)
+    if sql_type == "BOOLEAN":
+        return str(value).lower() == "true"
+    if sql_type.startswith("DECIMAL"):
+        return Decimal(str(value))
+    if sql_type == "DATE":
+        return datetime.date.fromisoformat(value)
+    if sql_type == "TIMESTAMP":
+        return datetime.datetime.fromisoformat(value)
+    if sql_type == "BINARY":
+        return base64.b64decode(value)
+    return value
+
+
+def from_json_value(value, sql_type: str):
+    if value is None or is_complex_sql_type(sql_type.upper()):
+        return value
+    if isinstance(value, str) or sql_type.upper() == "BINARY":
+        return from_sql_string(value, sql_type)
+    return value
+
+
+def to_result_value(value) -> Optional[str]:
+    # the json_array format returns every value as a string
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list, tuple)) or dataclasses.is_dataclass(value):
+        return json.dumps(to_json_compatible(value))
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("utf-8")
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+# wheels put on sys.path by _dependencies_on_path and how many running
+# functions use each of them
+_dependency_users: Dict[str, int] = {}
+_dependency_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _dependencies_on_path(dependencies: List[str]):
+    # local wheels of the environment clause are importable as zip archives
+    # while a function runs and removed from sys.path again afterwards,
+    # requirements are expected to be installed already
+    wheels = list(dict.fromkeys(d for d in dependencies if d.endswith(".whl")))
+    with _dependency_lock:
+        for wheel in wheels:
+            if wheel in _dependency_users:
+                _dependency_users[wheel] += 1
+            elif wheel not in sys.path:
+                sys.path.insert(0, wheel)
+                _dependency_users[wheel] = 1
+    try:
+        yield
+    finally:
+        with _dependency_lock:
+            for wheel in wheels:
+                if wheel not in _dependency_users:
+                    continue
+                _dependency_users[wheel] -= 1
+                if _dependency_users[wheel] == 0:
+                    del _dependency_users[wheel]
+                    if wheel in sys.path:
+                        sys.path.remove(wheel)
+
+
+def evaluate_python_udf(
+    body: str, arg_names: List[str], rows: List[list], dependencies: List[str] = ()
+) -> list:
+    # module level so that it can run in a worker process
+    code = f"def _udf({', '.join(arg_names)}):\n{textwrap.indent(body, '    ')}\n"
+    namespace = {}
+    with _dependencies_on_path(dependencies):
+        exec(compile(code, "<udf>", "exec"), namespace)
+        return [namespace["_udf"](*row) for row in rows]
+
+
+def evaluate_python_udtf(
+    body: str, handler: str, args: list, dependencies: List[str] = ()
+) -> List[tuple]:
+    namespace = {}
+    with _dependencies_on_path(dependencies):
+        exec(compile(body, "<udtf>", "exec"), namespace)
+        return [tuple(row) for row in namespace[handler]().eval(*args)]
+
+
+@dataclass
+class LocalFunction:
+    name: str
+    arg_names: List[str]
+    arg_types: List[str]
+    returns: str
+    language: str
+    body: str = None
+    handler: str = None
+    comment: str = None
+    dependencies: List[str] = dataclasses.field(default_factory=list)
+
+    def is_table_function(self):
+        return self.returns.upper().startswith("TABLE")
+
+
+@dataclass
+class _Execution:
+    statement: str
+    future: Future
+    ready_at: float
+    canceled: bool = False
+
+
+class EmulatedStatementExecution:
+
+    def __init__(self, client: "EmulatedWorkspaceClient"):
+        self._client = client
+        self._lock = threading.Lock()
+        self._executions: Dict[str, _Execution] = {}
+        self._chunks: Dict[str, List[ResultData]] = {}
+
+    def execute_statement(
+        self,
+        statement: str,
+        warehouse_id: str,
+        *,
+        wait_timeout: str = None,
+        parameters: List[StatementParameterListItem] = None,
+        format=None,
+        disposition=None,
+        **kwargs,
+    ) -> StatementResponse:
+        # the statement runs in the background after the injected latency, the
+        # response waits on it for at most wait_timeout like the real api
+        self._client.throttle()
+        statement_id = str(uuid.uuid4())
+        execution = _Execution(
+            statement=statement,
+            future=self._client.submit(
+                self._run, statement_id, statement, parameters or [], format
+            ),
+            ready_at=time.monotonic() + self._client.sample_latency(),
+        )
+        with self._lock:
+            self._executions[statement_id] = execution
+        wait_seconds = int((wait_timeout or "10s").rstrip("s"))
+        if self._client.max_wait is not None:
+            wait_seconds = min(wait_seconds, self._client.max_wait)
+        deadline = time.monotonic() + wait_seconds
+        delay = min(execution.ready_at, deadline) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        wait_futures([execution.future], timeout=max(0, deadline - time.monotonic()))
+        return self._get_response(statement_id)
+
+    def get_statement(self, statement_id: str) -> StatementResponse:
+        with self._lock:
+            self._client.polls += 1
+        return self._get_response(statement_id)
+
+    def _get_response(self, statement_id: str) -> StatementResponse:
+        with self._lock:
+            execution = self._executions[statement_id]
+        if execution.canceled:
+            return StatementResponse(
+                statement_id=statement_id,
+                status=StatementStatus(state=StatementState.CANCELED),
+            )
+        if time.monotonic() < execution.ready_at or not execution.future.done():
+            return StatementResponse(
+                statement_id=statement_id,
+                status=StatementStatus(state=StatementState.RUNNING),
+            )
+        return execution.future.result()
+
+    def cancel_execution(self, statement_id: str):
+        with self._lock:
+            self._executions[statement_id].canceled = True
+
+    def get_statement_result_chunk_n(
+        self, statement_id: str, chunk_index: int
+    ) -> ResultData:
+        with self._lock:
+            return self._chunks[statement_id][chunk_index]
+
+    def _run(self, statement_id, statement, parameters, result_format):
+        try:
+            if result_format is not None and result_format.value != "JSON_ARRAY":
+                raise StatementError("The emulator only returns JSON_ARRAY results")
+            if self._client.should_fail():
+                raise StatementError("Injected failure")
+            rows = self._client.execute(statement, parameters)
+        except Exception as e:
+            return StatementResponse(
+                statement_id=statement_id,
+                status=StatementStatus(
+                    state=StatementState.FAILED,
+                    error=ServiceError(message=f"{type(e).__name__}: {e}"),
+                ),
+            )
+        data = [[to_result_value(value) for value in row] for row in rows]
+        size = self._client.rows_per_chunk
+        chunks = [
+            ResultData(
+                chunk_index=index,
+                row_offset=start,
+                row_count=len(data[start : start + size]),
+                data_array=data[start : start + size],
+                next_chunk_index=index + 1 if start + size < len(data) else None,
+            )
+            for index, start in enumerate(range(0, max(len(data), 1), size))
+        ]
+        with self._lock:
+            self._chunks[statement_id] = chunks
+        return StatementResponse(
+            statement_id=statement_id,
+            status=StatementStatus(state=StatementState.SUCCEEDED),
+            result=chunks[0],
+        )
+
+
+class EmulatedWarehouses:
+
+    def __init__(self):
+        self.warehouse = EndpointInfo(
+            id=LOCAL_WAREHOUSE_ID,
+            name="local",
+            state=State.RUNNING,
+            enable_serverless_compute=True,
+        )
+
+    def list(self):
+        return iter([self.warehouse])
+
+    def get(self, id: str) -> EndpointInfo:
+        return self.warehouse
+
+    def start(self, id: str):
+        self.warehouse.state = State.RUNNING
+
+
+class EmulatedWorkspaceClient:
+
+    def __init__(
+        self,
+        latency: Union[float, Callable[[], float]] = 0.0,
+        secrets: Dict[tuple, str] = None,
+        processes: int = 0,
+        concurrency: int = 32,
+        rows_per_chunk: int = 10_000,
+        failure_rate: float = 0.0,
+        rate_limit: float = None,
+        max_wait: float = None,
+        seed: int = None,
+    ):
+        # latency is seconds per statement or a callable sampling them, secrets
+        # maps (scope, key) to values. processes > 0 runs python bodies in that
+        # many worker processes instead of in process. failure_rate of the
+        # statements fail, at most rate_limit statements per second are accepted
+        # and the server never waits longer than max_wait seconds on a result.
+        if not 0 <= failure_rate <= 1:
+            raise ValueError("failure_rate must be between 0 and 1")
+        if rate_limit is not None and rate_limit <= 0:
+            raise ValueError("rate_limit must be positive")
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rate_limit = rate_limit
+        self.max_wait = max_wait
+        self.throttled = 0
+        self.secrets = secrets or {}
+        self.rows_per_chunk = rows_per_chunk
+        self.functions: Dict[str, LocalFunction] = {}
+        self.statements: List[str] = []
+        self.polls = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._next_slot = 0.0
+        self._threads = ThreadPoolExecutor(max_workers=concurrency)
+        self._processes = ProcessPoolExecutor(processes) if processes > 0 else None
+        self.statement_execution = EmulatedStatementExecution(self)
+        self.warehouses = EmulatedWarehouses()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._threads.shutdown(wait=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=True)
+
+    def sample_latency(self) -> float:
+        return self.latency() if callable(self.latency) else self.latency
+
+    def throttle(self):
+        # statements over the rate limit are delayed like the sdk does when it
+        # retries a 429 response, throttled counts the delayed statements
+        if self.rate_limit is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + 1 / self.rate_limit
+            if delay > 0:
+                self.throttled += 1
+        if delay > 0:
+            time.sleep(delay)
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def submit(self, fn, *args) -> Future:
+        return self._threads.submit(fn, *args)
+
+    def _run_python(self, fn, *args):
+        if self._processes is None:
+            return fn(*args)
+        return self._processes.submit(fn, *args).result()
+
+    def get_function(self, name: str) -> LocalFunction:
+        # unity catalog names are case insensitive
+        with self._lock:
+            function = self.functions.get(name.lower())
+        if function is None:
+            raise StatementError(f"Function not found: {name}")
+        return function
+
+    def execute(self, statement: str, parameters: List[StatementParameterListItem]):
+        statement = statement.strip()
+        with self._lock:
+            self.statements.append(statement)
+        params = {p.name: p for p in parameters}
+        if match := DROP_PATTERN.match(statement):
+            with self._lock:
+                self.functions.pop(match.group(1).lower(), None)
+            return []
+        if match := CREATE_PATTERN.match(statement):
+            self._create_function(*match.groups())
+            return []
+        if match := ROUTINES_PATTERN.match(statement):
+            catalog, schema = match.group(1).lower(), match.group(2).lower()
+            with self._lock:
+                functions = list(self.functions.values())
+            return [
+                [f.name.split(".")[-1], f.comment]
+                for f in functions
+                if f.name.split(".")[:2] == [catalog, schema]
+            ]
+        if match := MAP_PATTERN.match(statement):
+            name, call_args, rows_param, fields = match.groups()
+            field_types = {}
+            for item in split_top_level(fields):
+                field_name, field_type = item.split(":", 1)
+                field_types[field_name.strip("` ")] = field_type.strip()
+            rows = [
+                {k: from_json_value(v, field_types[k]) for k, v in row.items()}
+                for row in json.loads(params[rows_param].value)
+            ]
+            arg_exprs = split_top_level(call_args)
+            calls = [[self._resolve(e, params, row) for e in arg_exprs] for row in rows]
+            values = self.call_many(name, calls)
+            return sorted(
+                [[row["_idx"], value] for row, value in zip(rows, values)],
+                key=lambda r: r[0],
+            )
+        if match := TABLE_CALL_PATTERN.match(statement):
+            name, call_args = match.groups()
+            args = [self._resolve(e, params, {}) for e in split_top_level(call_args)]
+            return self.call_table(name, args)
+        if match := CALL_PATTERN.match(statement):
+            name, call_args = match.groups()
+            args = [self._resolve(e, params, {}) for e in split_top_level(call_args)]
+            return [[self.call_many(name, [args])[0]]]
+        raise StatementError(f"Statement not supported by the emulator: {statement}")
+
+    def _create_function(self, name, args, returns, language, options, body, ret):
+        arg_names, arg_types = [], []
+        for arg in split_top_level(args):
+            arg_name, arg_type = arg.split(" ", 1)
+            arg_names.append(arg_name)
+            arg_types.append(arg_type)
+        handler = HANDLER_PATTERN.search(options)
+        comment = COMMENT_PATTERN.search(options)
+        environment = ENVIRONMENT_PATTERN.search(options)
+        function = LocalFunction(
+            name=name.lower(),
+            arg_names=arg_names,
+            arg_types=arg_types,
+            returns=returns.strip(),
+            language=language,
+            body=body if language == "PYTHON" else ret.strip(),
+            handler=None if handler is None else handler.group(1),
+            comment=None if comment is None else comment.group(1),
+            dependencies=(
+                [] if environment is None else json.loads(environment.group(1))
+            ),
+        )
+        if language == "PYTHON":
+            # fail the create statement like the warehouse does on syntax errors
+            if function.handler is None:
+                code = f"def _udf():\n{textwrap.indent(body, '    ')}\n"
+            else:
+                code = body
+            compile(code, name, "exec")
+        with self._lock:
+            self.functions[function.name] = function
+
+    def _resolve(self, expression: str, params: dict, columns: dict):
+        # the argument expressions emitted for remote calls and wrappers
+        expression = expression.strip()
+        if expression.startswith(":"):
+            param = params[expression[1:]]
+            return from_sql_string(param.value, param.type or "STRING")
+        if match := FROM_JSON_PATTERN.match(expression):
+            value = params[match.group(1)].value
+            return None if value is None else json.loads(value)
+        if match := UNBASE64_PATTERN.match(expression):
+            return from_sql_string(params[match.group(1)].value, "BINARY")
+        if match := SECRET_PATTERN.match(expression):
+            scope, key = match.groups()
+            if (scope, key) not in self.secrets:
+                raise StatementError(f"Secret not found: {scope}/{key}")
+            return self.secrets[(scope, key)]
+        if expression.strip("`") in columns:
+            return columns[expression.strip("`")]
+        if expression.upper() == "NULL":
+            return None
+        if expression.upper() in ("TRUE", "FALSE"):
+            return expression.upper() == "TRUE"
+        if expression.startswith("'") and expression.endswith("'"):
+            return re.sub(r"\\(.)", r"\1", expression[1:-1])
+        if re.fullmatch(r"-?\d+", expression):
+            return int(expression)
+        raise StatementError(f"Unsupported expression in the emulator: {expression}")
+
+    def _wrapped_call(self, function: LocalFunction, rows: List[list]):
+        # sql wrappers forward their arguments and secrets to the private function
+        match = TABLE_CALL_PATTERN.match(function.body) or CALL_PATTERN.match(
+            function.body
+        )
+        if match is None:
+            raise StatementError(f"Unsupported sql function body: {function.body}")
+        name, call_args = match.groups()
+        arg_exprs = split_top_level(call_args)
+        calls = [
+            [
+                self._resolve(e, {}, dict(zip(function.arg_names, row)))
+                for e in arg_exprs
+            ]
+            for row in rows
+        ]
+        return name, calls
+
+    def call_many(self, name: str, rows: List[list]) -> list:
+        function = self.get_function(name)
+        if function.is_table_function():
+            raise StatementError(f"{name} is a table function")
+        if function.language == "SQL":
+            return self.call_many(*self._wrapped_call(function, rows))
+        return self._run_python(
+            evaluate_python_udf,
+            function.body,
+            function.arg_names,
+            rows,
+            function.dependencies,
+        )
+
+    def call_table(self, name: str, args: list) -> List[tuple]:
+        function = self.get_function(name)
+        if not function.is_table_function():
+            raise StatementError(f"{name} is not a table function")
+        if function.language == "SQL":
+            inner_name, calls = self._wrapped_call(function, [args])
+            return self.call_table(inner_name, calls[0])
+        return self._run_python(
+            evaluate_python_udtf,
+            function.body,
+            function.handler,
+            args,
+            function.dependencies,
+        )
@@ -1,38 +1,366 @@
+import ast
+import asyncio
+import base64
+import collections
+import collections.abc
+import dataclasses
+import datetime
 import functools
+import hashlib
 import inspect
+import json
+import logging
+import math
 import os.path
+import re
 import textwrap
+import threading
 import time
-from dataclasses import dataclass
+import types
+import typing
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from decimal import Decimal
 from pathlib import Path
 from typing import Any, Callable, Dict, Iterator, Optional
 
 from databricks.sdk import WorkspaceClient
-from databricks.sdk.service.sql import StatementState
+from databricks.sdk.service.sql import (
+    Disposition,
+    Format,
+    StatementParameterListItem,
+    StatementState,
+)
 
-from uc_functions.inline import inline_function
+from uc_functions.cache import RemoteResultCache
+from uc_functions.inline import (
+    GENERATED_CODE_MARKER,
+    RecursiveResolver,
+    inline_function,
+)
+from uc_functions.instrumentation import span
+from uc_functions.minify import minify, size_breakdown
+from uc_functions.packaging import (
+    SharedHelpers,
+    get_package_name,
+    get_third_party_requirements,
+    package_shared_helpers,
+    strip_shared_helpers,
+)
+from uc_functions.results import iter_arrow_rows
+from uc_functions.scheduler import arun_dag, run_dag, topological_order
+from uc_functions.session import WorkspaceSession
 from uc_functions.special_kwargs import DatabricksSecret
+from uc_functions.warehouses import WarehouseResolver
+
+logger = logging.getLogger(__name__)
 
 python_to_sql_type_mapping = {
     int: "INTEGER",
     float: "FLOAT",
     str: "STRING",
     bool: "BOOLEAN",
+    bytes: "BINARY",
+    Decimal: "DECIMAL(38, 18)",
+    datetime.date: "DATE",
+    datetime.datetime: "TIMESTAMP",
 }
 
+SUPPORTED_TYPES_MESSAGE = (
+    f"only the following types are supported: {python_to_sql_type_mapping}, "
+    f"list[...] (ARRAY), dict[..., ...] (MAP) and TypedDicts (STRUCT)"
+)
+
+
+def get_struct_fields(python_type) -> Optional[Dict[str, Any]]:
+    # dataclasses and TypedDicts both map to a STRUCT of their annotated fields
+    if dataclasses.is_dataclass(python_type) and isinstance(python_type, type):
+        hints = typing.get_type_hints(python_type)
+        return {f.name: hints[f.name] for f in dataclasses.fields(python_type)}
+    if typing.is_typeddict(python_type):
+        return typing.get_type_hints(python_type)
+    if isinstance(python_type, type) and issubclass(python_type, tuple):
+        if hasattr(python_type, "_fields"):
+            hints = typing.get_type_hints(python_type)
+            return {name: hints[name] for name in python_type._fields}
+    return None
+
+
+def python_type_to_sql_type(python_type) -> Optional[str]:
+    if python_type in python_to_sql_type_mapping:
+        return python_to_sql_type_mapping[python_type]
+    origin = typing.get_origin(python_type)
+    type_args = typing.get_args(python_type)
+    if origin in (typing.Union, types.UnionType) and type(None) in type_args:
+        # sql types are always nullable so Optional[X] is just X
+        not_none = [arg for arg in type_args if arg is not type(None)]
+        if len(not_none) == 1:
+            return python_type_to_sql_type(not_none[0])
+        return None
+    if origin is list and len(type_args) == 1:
+        element_type = python_type_to_sql_type(type_args[0])
+        return f"ARRAY<{element_type}>" if element_type else None
+    if origin is dict and len(type_args) == 2:
+        key_type = python_type_to_sql_type(type_args[0])
+        value_type = python_type_to_sql_type(type_args[1])
+        if key_type is None or value_type is None:
+            return None
+        return f"MAP<{key_type}, {value_type}>"
+    struct_fields = get_struct_fields(python_type)
+    if struct_fields and not typing.is_typeddict(python_type):
+        # structs reach python udfs as dicts and are returned as dicts, a
+        # dataclass or named tuple would only work when called locally
+        raise ValueError(
+            f"{python_type.__name__} can not be used as a STRUCT argument or "
+            f"result, structs are passed to python udfs as dicts, use a TypedDict"
+        )
+    if struct_fields:
+        fields = []
+        for field_name, field_type in struct_fields.items():
+            field_sql_type = python_type_to_sql_type(field_type)
+            if field_sql_type is None:
+                return None
+            fields.append(f"{field_name}: {field_sql_type}")
+        return f"STRUCT<{', '.join(fields)}>"
+    return None
+
+
+def to_sql_literal(value, sql_type: str = None) -> str:
+    # nested values get their declared types as well, e.g. dicts in an array
+    # of structs
+    nested_types = get_nested_sql_types(sql_type)
+    if value is None:
+        return "NULL" if sql_type is None else f"CAST(NULL AS {sql_type})"
+    if isinstance(value, bool):
+        literal = "TRUE" if value else "FALSE"
+    elif isinstance(value, float) and math.isfinite(value) is False:
+        literal = f"CAST('{value}' AS DOUBLE)"
+    elif isinstance(value, (int, float)):
+        literal = repr(value)
+    elif isinstance(value, str):
+        escaped = value.replace("\\", "\\\\").replace("'", "\\'")
+        literal = f"'{escaped}'"
+    elif isinstance(value, bytes):
+        literal = f"X'{value.hex()}'"
+    elif isinstance(value, Decimal):
+        literal = f"{value}BD"
+    elif isinstance(value, datetime.datetime):
+        literal = f"TIMESTAMP'{value.isoformat(sep=' ')}'"
+    elif isinstance(value, datetime.date):
+        literal = f"DATE'{value.isoformat()}'"
+    elif isinstance(value, tuple) and hasattr(value, "_fields"):
+        entries = [
+            f"'{name}', {to_sql_literal(getattr(value, name), nested_types.get(name))}"
+            for name in value._fields
+        ]
+        literal = f"named_struct({', '.join(entries)})"
+    elif isinstance(value, (list, tuple)):
+        element_type = nested_types.get("element")
+        literal = (
+            f"array({', '.join([to_sql_literal(v, element_type) for v in value])})"
+        )
+    elif (
+        isinstance(value, dict)
+        and sql_type is not None
+        and sql_type.startswith("STRUCT")
+    ):
+        # dicts used as structs (TypedDicts), spark can not cast a map to a struct
+        entries = [
+            f"{to_sql_literal(str(k))}, {to_sql_literal(v, nested_types.get(k))}"
+            for k, v in value.items()
+        ]
+        literal = f"named_struct({', '.join(entries)})"
+    elif isinstance(value, dict):
+        entries = [
+            f"{to_sql_literal(k, nested_types.get('key'))}, "
+            f"{to_sql_literal(v, nested_types.get('value'))}"
+            for k, v in value.items()
+        ]
+        literal = f"map({', '.join(entries)})"
+    elif dataclasses.is_dataclass(value):
+        entries = [
+            f"'{f.name}', "
+            f"{to_sql_literal(getattr(value, f.name), nested_types.get(f.name))}"
+            for f in dataclasses.fields(value)
+        ]
+        literal = f"named_struct({', '.join(entries)})"
+    else:
+        raise ValueError(f"Unable to convert {type(value)} to a SQL literal")
+    # complex literals need the declared type, e.g. empty arrays
+    if sql_type is not None and is_complex_sql_type(sql_type):
+        return f"CAST({literal} AS {sql_type})"
+    return literal
+
+
+def to_json_compatible(value):
+    # the representation from_json parses back into the declared sql type
+    if isinstance(value, tuple) and hasattr(value, "_fields"):
+        return {
+            name: to_json_compatible(getattr(value, name)) for name in value._fields
+        }
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {
+            f.name: to_json_compatible(getattr(value, f.name))
+            for f in dataclasses.fields(value)
+        }
+    if isinstance(value, dict):
+        return {k: to_json_compatible(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_compatible(v) for v in value]
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("utf-8")
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def is_complex_sql_type(sql_type: str) -> bool:
+    return sql_type.startswith(("ARRAY", "MAP", "STRUCT"))
+
+
+def split_top_level(text: str) -> list[str]:
+    # splits on commas outside of brackets and quotes, e.g. MAP<STRING, INT>
+    parts, depth, quote, current = [], 0, None, ""
+    for char in text:
+        if quote is not None:
+            quote = None if char == quote else quote
+        elif char in "'\"`":
+            quote = char
+        elif char in "<([":
+            depth += 1
+        elif char in ">)]":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+            continue
+        current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def get_nested_sql_types(sql_type: Optional[str]) -> dict:
+    # the types inside a complex type: "element" of an ARRAY, "key" and "value"
+    # of a MAP and the field names of a STRUCT
+    if sql_type is None:
+        return {}
+    if sql_type.startswith("ARRAY<"):
+        return {"element": sql_type[len("ARRAY<") : -1].strip()}
+    if sql_type.startswith("MAP<"):
+        key_type, value_type = split_top_level(sql_type[len("MAP<") : -1])
+        return {"key": key_type, "value": value_type}
+    if sql_type.startswith("STRUCT<"):
+        fields = {}
+        for field_def in split_top_level(sql_type[len("STRUCT<") : -1]):
+            name, field_type = field_def.split(":", 1)
+            fields[name.strip().strip("`")] = field_type.strip()
+        return fields
+    return {}
+
+
+def to_statement_parameter(
+    name: str, value, sql_type: str
+) -> StatementParameterListItem:
+    # statement parameters only have scalar types, complex and binary values are
+    # sent as strings and converted back by get_parameter_expression
+    if is_complex_sql_type(sql_type):
+        return StatementParameterListItem(
+            name=name,
+            type="STRING",
+            value=None if value is None else json.dumps(to_json_compatible(value)),
+        )
+    if sql_type == "BINARY":
+        return StatementParameterListItem(
+            name=name,
+            type="STRING",
+            value=None if value is None else to_json_compatible(value),
+        )
+    if value is None:
+        parameter_value = None
+    elif isinstance(value, bool):
+        parameter_value = "true" if value else "false"
+    elif isinstance(value, datetime.datetime):
+        parameter_value = value.isoformat(sep=" ")
+    else:
+        parameter_value = str(value)
+    return StatementParameterListItem(name=name, type=sql_type, value=parameter_value)
+
+
+def get_parameter_expression(name: str, sql_type: str) -> str:
+    if is_complex_sql_type(sql_type):
+        return f"from_json(:{name}, '{sql_type}')"
+    if sql_type == "BINARY":
+        return f"unbase64(:{name})"
+    return f":{name}"
+
 
 def get_response_sql_type(func: Callable) -> str:
     signature = inspect.signature(func)
     return_type = signature.return_annotation
-    sql_type = python_to_sql_type_mapping.get(return_type, "UNKNOWN")
-    if sql_type == "UNKNOWN":
+    sql_type = python_type_to_sql_type(return_type)
+    if sql_type is None:
         raise ValueError(
             f"Unknown SQL type for Python return type: {return_type}, "
-            f"only the following types are supported: {python_to_sql_type_mapping}"
+            f"{SUPPORTED_TYPES_MESSAGE}"
         )
     return sql_type
 
 
+def is_table_function(func: Callable) -> bool:
+    # generator functions and classes with an eval method are python udtfs
+    if inspect.isclass(func):
+        return hasattr(func, "eval")
+    return inspect.isgeneratorfunction(func)
+
+
+def load_original(func: Callable) -> Callable:
+    # the registered function with the calling convention of
+    # FunctionSerialized.load_inlined, table functions return a list of rows
+    if inspect.isclass(func):
+        return lambda *args, **kwargs: list(func().eval(*args, **kwargs))
+    if is_table_function(func):
+        return lambda *args, **kwargs: list(func(*args, **kwargs))
+    return func
+
+
+def get_table_sql_columns(func: Callable) -> Dict[str, str]:
+    target = func.eval if inspect.isclass(func) else func
+    return_type = inspect.signature(target).return_annotation
+    row_types = typing.get_args(return_type)
+    if (
+        typing.get_origin(return_type)
+        not in (
+            collections.abc.Iterator,
+            collections.abc.Iterable,
+            collections.abc.Generator,
+        )
+        or len(row_types) == 0
+    ):
+        raise ValueError(
+            f"Table functions must be annotated to return Iterator[Row], got: {return_type}"
+        )
+    row_fields = get_struct_fields(row_types[0])
+    if not row_fields:
+        raise ValueError(
+            f"Unknown row type for table function: {row_types[0]}, "
+            f"rows must be dataclasses, TypedDicts or NamedTuples"
+        )
+    columns = {}
+    for column_name, column_type in row_fields.items():
+        sql_type = python_type_to_sql_type(column_type)
+        if sql_type is None:
+            raise ValueError(
+                f"Unknown SQL type for Python type: {column_type}, "
+                f"{SUPPORTED_TYPES_MESSAGE}"
+            )
+        columns[column_name] = sql_type
+    return columns
+
+
 @dataclass
 class FunctionArg:
     name: str
@@ -42,6 +370,9 @@ class FunctionArg:
     def to_arg_string(self):
         return f"{self.name} {self.type}"
 
+    def is_struct(self):
+        return self.type.startswith("STRUCT")
+
     def to_call_string(self):
         return self.name
 
@@ -51,16 +382,19 @@ class FunctionArg:
 
 
 def get_sql_type_mapping(func: Callable) -> Dict[str, FunctionArg]:
-    signature = inspect.signature(func)
+    parameters = list(inspect.signature(func).parameters.items())
+    if inspect.isclass(func):
+        # udtf handler classes take their arguments in eval, skip self
+        parameters = list(inspect.signature(func.eval).parameters.items())[1:]
     sql_type_mapping = {}
 
-    for name, param in signature.parameters.items():
+    for name, param in parameters:
         param_type = param.annotation
-        sql_type = python_to_sql_type_mapping.get(param_type, "UNKNOWN")
-        if sql_type == "UNKNOWN":
+        sql_type = python_type_to_sql_type(param_type)
+        if sql_type is None:
             raise ValueError(
                 f"Unknown SQL type for Python type: {param_type}, "
-                f"only the following types are supported: {python_to_sql_type_mapping}"
+                f"{SUPPORTED_TYPES_MESSAGE}"
             )
         default_param = (
             param.default if param.default != inspect.Parameter.empty else None
@@ -78,6 +412,26 @@ def get_sql_type_mapping(func: Callable) -> Dict[str, FunctionArg]:
     return sql_type_mapping
 
 
+CONTENT_HASH_COMMENT_PREFIX = "uc-functions:sha256="
+
+# imports that make a function depend on more than its arguments, reported as
+# impure in the bundle manifest
+IMPURE_MODULES = {
+    "http",
+    "os",
+    "random",
+    "requests",
+    "secrets",
+    "shutil",
+    "socket",
+    "subprocess",
+    "tempfile",
+    "time",
+    "urllib",
+    "uuid",
+}
+
+
 @dataclass
 class FunctionSerialized:
     args: dict[str, FunctionArg]
@@ -87,6 +441,16 @@ class FunctionSerialized:
     function_name: str = None
     catalog: str = None
     schema: str = None
+    table_columns: dict[str, str] = None
+    handler_class: str = None
+    # names the inliner copied in from dependencies
+    helper_names: list[str] = None
+    # set by package_shared_helpers, the deployed body and its dependencies
+    function_packaged: str = None
+    environment_dependencies: list[str] = None
+
+    def is_table_function(self):
+        return self.table_columns is not None
 
     def contains_secrets(self):
         return any(
@@ -98,9 +462,39 @@ class FunctionSerialized:
             yield f"DROP FUNCTION IF EXISTS {self.catalog}.{self.schema}._{self.function_name};"
         yield f"DROP FUNCTION IF EXISTS {self.catalog}.{self.schema}.{self.function_name};"
 
-    def generate_create_statements(self):
+    def content_hash(self) -> str:
+        # hash of the deployed ddl, embedded as a comment to detect changes
+        stmts = "\n".join(self.generate_create_statements())
+        return hashlib.sha256(stmts.encode("utf-8")).hexdigest()
+
+    def get_content_comment(self) -> str:
+        return f"{CONTENT_HASH_COMMENT_PREFIX}{self.content_hash()}"
+
+    def get_deployed_code(self) -> str:
+        return self.function_packaged or self.function_inlined
+
+    def size_breakdown(self) -> Dict[str, int]:
+        # bytes of the deployed body per inlined helper, largest first
+        return size_breakdown(
+            self.get_deployed_code(), self.helper_names or [], self.function_name
+        )
+
+    def get_environment_clause(self) -> str:
+        if not self.environment_dependencies:
+            return ""
+        dependencies = to_sql_literal(json.dumps(self.environment_dependencies))
+        return (
+            f"\nENVIRONMENT (dependencies = {dependencies}, "
+            f"environment_version = 'None')"
+        )
+
+    def generate_create_statements(self, comment: str = None):
         args = ", ".join([v.to_arg_string() for v in self.args.values()])
         args_for_invoke = ", ".join([k for k in self.args.keys()])
+        comment_clause = (
+            "" if comment is None else f"\nCOMMENT {to_sql_literal(comment)}"
+        )
+        environment_clause = self.get_environment_clause()
         if self.contains_secrets():
             f_name = (
                 "_" + self.function_name
@@ -124,14 +518,26 @@ return func({args_for_invoke})
 $$;
                     """
             )
-        if self.function_inlined is not None:
+        if self.function_inlined is not None and self.is_table_function():
             yield textwrap.dedent(
                 f"""
 CREATE OR REPLACE FUNCTION {self.catalog}.{self.schema}.{f_name}({args})
 RETURNS {self.response_type}
 LANGUAGE PYTHON
+HANDLER '{self.get_handler_name()}'{environment_clause}{comment_clause}
 AS $$
-{self.function_inlined}
+{self.generate_udtf_handler_code(self.get_deployed_code())}
+$$;
+"""
+            )
+        elif self.function_inlined is not None:
+            yield textwrap.dedent(
+                f"""
+CREATE OR REPLACE FUNCTION {self.catalog}.{self.schema}.{f_name}({args})
+RETURNS {self.response_type}
+LANGUAGE PYTHON{environment_clause}{comment_clause}
+AS $$
+{self.get_deployed_code()}
 $$;
 """
             )
@@ -158,35 +564,470 @@ CREATE OR REPLACE FUNCTION {self.catalog}.{self.schema}.{f_name}({args})
 RETURNS {self.response_type}
 LANGUAGE SQL 
 NOT DETERMINISTIC 
-CONTAINS SQL
-RETURN SELECT {self.catalog}.{self.schema}._{f_name}({calls});
+CONTAINS SQL{comment_clause}
+RETURN SELECT {"* FROM " if self.is_table_function() else ""}{self.catalog}.{self.schema}._{f_name}({calls});
 """
             )
 
+    def get_handler_name(self):
+        return f"_{self.function_name}_handler"
 
-def run_sql(
-    ws_client: WorkspaceClient, warehouse_id: str, stmt: str, wait_timeout="10s"
-):
-    print("Executing statement: ", stmt)
-    resp = ws_client.statement_execution.execute_statement(
-        stmt, warehouse_id=warehouse_id, wait_timeout=wait_timeout
-    )
-    while resp.status.state not in [
-        StatementState.CANCELED,
-        StatementState.FAILED,
-        StatementState.CLOSED,
-        StatementState.SUCCEEDED,
-    ]:
-        resp = ws_client.statement_execution.get_statement(resp.statement_id)
-        time.sleep(1)
+    def get_imported_modules(self) -> list[str]:
+        # top level modules imported by the inlined code
+        modules = set()
+        for node in ast.walk(ast.parse(self.function_inlined)):
+            if isinstance(node, ast.Import):
+                modules.update(alias.name.split(".")[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                modules.add(node.module.split(".")[0])
+        return sorted(modules)
+
+    def get_signature(self) -> str:
+        args = ", ".join([v.to_arg_string() for v in self.args.values()])
+        return f"{self.function_name}({args}) RETURNS {self.response_type}"
 
+    def load_inlined(self) -> Callable:
+        # the generated body as a local callable taking every argument including
+        # secrets, table functions return their rows as a list of tuples like
+        # the deployed handler yields them
+        namespace = {}
+        filename = f"<{self.function_name}>"
+        if self.is_table_function():
+            code = self.generate_udtf_handler_code()
+            exec(compile(code, filename, "exec"), namespace)
+            handler = namespace[self.get_handler_name()]
+            return lambda *args, **kwargs: list(handler().eval(*args, **kwargs))
+        body = textwrap.indent(self.function_inlined.strip(), "    ")
+        code = f"def {self.function_name}({', '.join(self.args.keys())}):\n{body}\n"
+        exec(compile(code, filename, "exec"), namespace)
+        return namespace[self.function_name]
+
+    def generate_udtf_handler_code(self, code: str = None):
+        code = code or self.function_inlined
+        args = ", ".join(self.args.keys())
+        columns = tuple(self.table_columns.keys())
+        if self.handler_class is None:
+            # generator functions are kept as a function producing the rows
+            body = textwrap.indent(code.strip(), "    ")
+            rows_code = f"def _{self.function_name}_rows({args}):\n{body}\n\n\n"
+            handler_base = ""
+            rows_call = f"_{self.function_name}_rows({args})"
+        else:
+            rows_code = f"{code.strip()}\n\n\n"
+            handler_base = f"({self.handler_class})"
+            rows_call = f"super().eval({args})"
+        # udtfs must yield tuples so dataclass and dict rows are converted
+        return (
+            rows_code
+            + textwrap.dedent(
+                f"""
+class {self.get_handler_name()}{handler_base}:
+    def eval({", ".join(["self", *self.args.keys()])}):
+        for row in {rows_call}:
+            if isinstance(row, dict):
+                row = tuple(row[column] for column in {columns})
+            elif hasattr(row, "__dataclass_fields__"):
+                row = tuple(getattr(row, column) for column in {columns})
+            yield row
+"""
+            ).strip()
+        )
+
+    def has_column_args(self) -> bool:
+        return any(v.default is None for v in self.args.values())
+
+    def generate_pandas_udf_code(self):
+        # a pandas udf is called with at least one column to size its result
+        if not self.has_column_args():
+            raise ValueError(
+                f"{self.function_name} has no column arguments, "
+                "pandas udfs need at least one"
+            )
+        series_args = [v for v in self.args.values() if v.default is None]
+        secret_args = [v for v in self.args.values() if v.default is not None]
+        args = ", ".join(self.args.keys())
+        # struct columns are passed to and returned from pandas udfs as data frames
+        udf_args = ", ".join(
+            [
+                f"{v.name}: {'pd.DataFrame' if v.is_struct() else 'pd.Series'}"
+                for v in series_args
+            ]
+        )
+        row_args = ", ".join(
+            [f"_{v.name}" if v.default is None else v.name for v in self.args.values()]
+        )
+        columns = [
+            f'{v.name}.to_dict("records")' if v.is_struct() else v.name
+            for v in series_args
+        ]
+        if len(series_args) == 1:
+            row_loop = f"_{series_args[0].name} in {columns[0]}"
+        else:
+            row_loop = (
+                f"{', '.join([f'_{v.name}' for v in series_args])} "
+                f"in zip({', '.join(columns)})"
+            )
+        result_type = (
+            "pd.DataFrame" if self.response_type.startswith("STRUCT") else "pd.Series"
+        )
+        # the row level function is the same inlined body that is deployed to uc
+        body = textwrap.indent(self.function_inlined.strip(), "    ")
+        yield f"def _{self.function_name}({args}):\n{body}\n"
+
+        udf = textwrap.dedent(
+            f"""
+@pandas_udf("{self.response_type}")
+def {self.function_name}({udf_args}) -> {result_type}:
+    return {result_type}([_{self.function_name}({row_args}) for {row_loop}])
+"""
+        ).strip()
+        if self.contains_secrets() is False:
+            yield udf + "\n"
+            return
+
+        # secrets are resolved on the driver when the udf is built so that the
+        # module stays importable on executors which do not have dbutils
+        resolve = "\n".join(
+            [
+                f"    if {v.name} is None:\n"
+                f'        {v.name} = _secret("{v.default.scope}", "{v.default.key}")'
+                for v in secret_args
+            ]
+        )
+        builder_args = ", ".join([f"{v.name}=None" for v in secret_args])
+        yield (
+            f"def {self.function_name}({builder_args}):\n"
+            f"{resolve}\n\n"
+            f"{textwrap.indent(udf, '    ')}\n\n"
+            f"    return {self.function_name}\n"
+        )
+
+
+FINISHED_STATEMENT_STATES = [
+    StatementState.CANCELED,
+    StatementState.FAILED,
+    StatementState.CLOSED,
+    StatementState.SUCCEEDED,
+]
+
+# the statement execution api waits at most 50s server side before returning
+MAX_SERVER_WAIT_SECONDS = 50
+
+# large results are streamed as arrow ipc chunks behind presigned urls instead of
+# inline json, see uc_functions.results
+ARROW_RESULT_OPTIONS = dict(
+    result_format=Format.ARROW_STREAM, disposition=Disposition.EXTERNAL_LINKS
+)
+
+
+@dataclass
+class PollingPolicy:
+    initial_interval: float = 0.05
+    max_interval: float = 2.0
+    multiplier: float = 2.0
+
+    def intervals(self) -> Iterator[float]:
+        interval = self.initial_interval
+        while True:
+            yield interval
+            interval = min(interval * self.multiplier, self.max_interval)
+
+
+@dataclass
+class StatementStats:
+    statement: str
+    statement_id: str = None
+    state: str = None
+    elapsed: float = 0.0
+    polls: int = 0
+
+
+def get_server_wait_timeout(timeout: Optional[float]) -> str:
+    # wait on the server as long as possible, the api accepts 0 or 5 to 50 seconds
+    if timeout is None or timeout >= MAX_SERVER_WAIT_SECONDS:
+        return f"{MAX_SERVER_WAIT_SECONDS}s"
+    if timeout < 5:
+        return "0s"
+    return f"{int(timeout)}s"
+
+
+def fetch_result_rows(ws_client: WorkspaceClient, resp) -> list[list]:
+    # inline json results larger than a chunk are split, follow every chunk
+    if resp.result is None:
+        return []
+    rows = list(resp.result.data_array or [])
+    next_chunk_index = resp.result.next_chunk_index
+    while next_chunk_index is not None:
+        chunk = ws_client.statement_execution.get_statement_result_chunk_n(
+            resp.statement_id, next_chunk_index
+        )
+        rows.extend(chunk.data_array or [])
+        next_chunk_index = chunk.next_chunk_index
+    return rows
+
+
+def _check_statement_response(stmt: str, resp, stats: StatementStats):
+    stats.statement_id = resp.statement_id
+    stats.state = resp.status.state.value
     if resp.status.state.value != "SUCCEEDED":
-        print("Statement failed to execute. Statement: ", stmt)
-        print("Result was: ", resp)
+        logger.error("Statement failed to execute. Statement: %s", stmt)
+        logger.error("Result was: %s", resp)
         raise ValueError("Statement failed to execute", resp)
     return resp
 
 
+def run_sql(
+    ws_client: WorkspaceClient,
+    warehouse_id: str,
+    stmt: str,
+    wait_timeout: str = None,
+    timeout: float = None,
+    polling: PollingPolicy = None,
+    stats: collections.abc.MutableSequence[StatementStats] = None,
+    parameters: list[StatementParameterListItem] = None,
+    result_format: Format = None,
+    disposition: Disposition = None,
+    cancel: threading.Event = None,
+):
+    # timeout is the caller deadline in seconds, statements exceeding it are
+    # cancelled. Polls start fast and back off exponentially. Parameters are
+    # bound to the :name markers in stmt. result_format and disposition select
+    # the result format, defaults to inline json. Setting cancel stops waiting
+    # and cancels the statement, e.g. when a streaming consumer stops early.
+    logger.debug("Executing statement: %s", stmt)
+    statement_stats = StatementStats(statement=stmt)
+    if stats is not None:
+        stats.append(statement_stats)
+    start = time.monotonic()
+    deadline = None if timeout is None else start + timeout
+    with span("submit") as attributes:
+        resp = ws_client.statement_execution.execute_statement(
+            stmt,
+            warehouse_id=warehouse_id,
+            wait_timeout=wait_timeout or get_server_wait_timeout(timeout),
+            parameters=parameters,
+            format=result_format,
+            disposition=disposition,
+        )
+        attributes["statement_id"] = resp.statement_id
+        attributes["state"] = resp.status.state.value
+    intervals = (polling or PollingPolicy()).intervals()
+    try:
+        while resp.status.state not in FINISHED_STATEMENT_STATES:
+            if cancel is not None and cancel.is_set():
+                logger.info("Cancelling statement: %s", resp.statement_id)
+                ws_client.statement_execution.cancel_execution(resp.statement_id)
+                raise ValueError(f"Statement {resp.statement_id} was cancelled")
+            interval = next(intervals)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.info("Cancelling statement: %s", resp.statement_id)
+                    ws_client.statement_execution.cancel_execution(resp.statement_id)
+                    raise TimeoutError(
+                        f"Statement {resp.statement_id} exceeded timeout of {timeout}s"
+                    )
+                interval = min(interval, remaining)
+            if cancel is None:
+                time.sleep(interval)
+            elif cancel.wait(interval):
+                continue
+            with span("poll", resp.statement_id) as attributes:
+                resp = ws_client.statement_execution.get_statement(resp.statement_id)
+                attributes["state"] = resp.status.state.value
+            statement_stats.polls += 1
+    finally:
+        statement_stats.elapsed = time.monotonic() - start
+        statement_stats.statement_id = resp.statement_id
+    return _check_statement_response(stmt, resp, statement_stats)
+
+
+async def arun_sql(
+    ws_client: WorkspaceClient,
+    warehouse_id: str,
+    stmt: str,
+    wait_timeout: str = None,
+    timeout: float = None,
+    polling: PollingPolicy = None,
+    stats: collections.abc.MutableSequence[StatementStats] = None,
+    parameters: list[StatementParameterListItem] = None,
+    result_format: Format = None,
+    disposition: Disposition = None,
+):
+    # the sdk is synchronous so each request runs in a worker thread, waiting
+    # between polls only costs a coroutine. Statements are submitted without a
+    # server side wait (unless wait_timeout is passed) since a waiting submit
+    # holds one of the few default executor threads for up to 50s.
+    statement_stats = StatementStats(statement=stmt)
+    if stats is not None:
+        stats.append(statement_stats)
+    start = time.monotonic()
+
+    async def execute():
+        logger.debug("Executing statement: %s", stmt)
+        submit = asyncio.ensure_future(
+            asyncio.to_thread(
+                ws_client.statement_execution.execute_statement,
+                stmt,
+                warehouse_id=warehouse_id,
+                wait_timeout=wait_timeout or "0s",
+                parameters=parameters,
+                format=result_format,
+                disposition=disposition,
+            )
+        )
+        intervals = (polling or PollingPolicy()).intervals()
+        with span("submit") as attributes:
+            try:
+                # the submit can not be interrupted, when cancelled while it is in
+                # flight wait for the statement id so the statement can be cancelled
+                resp = await asyncio.shield(submit)
+            except asyncio.CancelledError:
+                resp = await submit
+                logger.info("Cancelling statement: %s", resp.statement_id)
+                await asyncio.to_thread(
+                    ws_client.statement_execution.cancel_execution, resp.statement_id
+                )
+                raise
+            attributes["statement_id"] = resp.statement_id
+            attributes["state"] = resp.status.state.value
+        statement_stats.statement_id = resp.statement_id
+        try:
+            while resp.status.state not in FINISHED_STATEMENT_STATES:
+                await asyncio.sleep(next(intervals))
+                with span("poll", resp.statement_id) as attributes:
+                    resp = await asyncio.to_thread(
+                        ws_client.statement_execution.get_statement, resp.statement_id
+                    )
+                    attributes["state"] = resp.status.state.value
+                statement_stats.polls += 1
+        except asyncio.CancelledError:
+            # do not leave the statement running on the warehouse
+            logger.info("Cancelling statement: %s", resp.statement_id)
+            await asyncio.to_thread(
+                ws_client.statement_execution.cancel_execution, resp.statement_id
+            )
+            raise
+        return resp
+
+    try:
+        resp = await asyncio.wait_for(execute(), timeout=timeout)
+    finally:
+        statement_stats.elapsed = time.monotonic() - start
+    return _check_statement_response(stmt, resp, statement_stats)
+
+
+def _row_index(row) -> int:
+    # inline json results return every column as a string
+    return int(row[0])
+
+
+@dataclass
+class TableEvaluation:
+    # aggregates of one function evaluated over a table, top_values are the most
+    # frequent outputs as (value, count) with values rendered as strings
+    row_count: int
+    null_count: int
+    distinct_count: int
+    top_values: list[tuple[Optional[str], int]] = field(default_factory=list)
+    reference_diff_count: Optional[int] = None
+    compare_diff_count: Optional[int] = None
+
+
+def _quote_identifier(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+# function names given by callers, up to catalog.schema.function
+FUNCTION_NAME_PATTERN = re.compile(
+    r"[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*){0,2}"
+)
+
+
+def _quote_function_name(name: str) -> str:
+    if not FUNCTION_NAME_PATTERN.fullmatch(name):
+        raise ValueError(f"Invalid function name: {name!r}")
+    return ".".join(_quote_identifier(part) for part in name.split("."))
+
+
+def _optional_int(value) -> Optional[int]:
+    return None if value is None else int(value)
+
+
+@dataclass
+class DeploymentPlan:
+    statements: dict[str, list[str]] = field(default_factory=dict)
+    created: list[str] = field(default_factory=list)
+    replaced: list[str] = field(default_factory=list)
+    unchanged: list[str] = field(default_factory=list)
+    # private functions left behind by wrappers that no longer use secrets
+    dropped: list[str] = field(default_factory=list)
+
+    def is_empty(self):
+        return len(self.statements) == 0
+
+
+class DeploymentError(ValueError):
+
+    def __init__(self, errors: Dict[str, BaseException]):
+        super().__init__(
+            f"Failed to deploy {len(errors)} function(s): {', '.join(errors.keys())}"
+        )
+        self.errors = errors
+
+
+@dataclass
+class Target:
+    # a catalog and schema to deploy to, in the deployment's workspace unless a
+    # client is given
+    name: str
+    catalog: str
+    schema: str
+    workspace_client: WorkspaceClient = None
+    warehouse_id: str = None
+
+
+@dataclass
+class TargetResult:
+    target: Target
+    seconds: float = 0.0
+    deployed: list[str] = field(default_factory=list)
+    # per function errors, the remaining functions were deployed
+    errors: Dict[str, BaseException] = field(default_factory=dict)
+    # set when the target failed as a whole, e.g. no warehouse was found
+    error: Optional[BaseException] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None and not self.errors
+
+
+class SizeBudgetError(ValueError):
+
+    def __init__(self, name: str, size: int, budget: int, breakdown: Dict[str, int]):
+        parts = ", ".join(f"{owner} {size}" for owner, size in breakdown.items())
+        super().__init__(
+            f"{name} is {size} bytes, over the size budget of {budget} bytes: {parts}"
+        )
+        self.name = name
+        self.size = size
+        self.budget = budget
+        self.breakdown = breakdown
+
+
+# inline_function keeps the generated code on the function object, which every
+# deployment registering the function shares
+_inline_locks: "weakref.WeakKeyDictionary[Callable, threading.Lock]" = (
+    weakref.WeakKeyDictionary()
+)
+_inline_locks_lock = threading.Lock()
+
+
+def _get_inline_lock(function: Callable) -> threading.Lock:
+    with _inline_locks_lock:
+        return _inline_locks.setdefault(function, threading.Lock())
+
+
 class FunctionDeployment:
 
     def __init__(
@@ -196,6 +1037,14 @@ class FunctionDeployment:
         root_dir: str,
         compile_sql_dir: str = "./compile",
         globals_dict=None,
+        warehouse_id: str = None,
+        warehouse_cache_ttl: float = 300,
+        workspace_client: WorkspaceClient = None,
+        remote_cache: RemoteResultCache = None,
+        minify: bool = False,
+        strip_asserts: bool = False,
+        size_budget: int = None,
+        statement_stats_limit: Optional[int] = 1000,
     ):
         self.compile_sql_dir = compile_sql_dir
         self.root_dir = root_dir
@@ -204,6 +1053,36 @@ class FunctionDeployment:
         self.globals_dict = globals_dict or {}
         self._raw_functions: dict[str, Callable] = {}
         self._serialized_functions: dict[str, FunctionSerialized] = {}
+        # guards the dicts above, they are only replaced entry by entry with
+        # finished objects so reads need no lock. Registering and serializing
+        # one function is serialized by its own lock, other functions proceed.
+        self._lock = threading.Lock()
+        self._function_locks: dict[str, threading.Lock] = {}
+        # one client shared by deploy, remote and warehouse lookups
+        self.session = WorkspaceSession(workspace_client)
+        # pins the warehouse when given, otherwise the warmest serverless
+        # warehouse is looked up and cached for warehouse_cache_ttl seconds
+        self.warehouse_resolver = WarehouseResolver(
+            warehouse_id=warehouse_id, ttl=warehouse_cache_ttl
+        )
+        # timings and poll counts of the last statement_stats_limit statements
+        # issued by deploy and remote, None keeps every statement
+        self.statement_stats: collections.deque[StatementStats] = collections.deque(
+            maxlen=statement_stats_limit
+        )
+        # opt in cache of remote results keyed on the compiled function and args
+        self.remote_cache = remote_cache
+        # minify strips docstrings, annotations, dead branches and unused imports
+        # from the generated bodies, strip_asserts removes asserts as well
+        if strip_asserts and not minify:
+            raise ValueError("strip_asserts requires minify")
+        self.minify = minify
+        self.strip_asserts = strip_asserts
+        # bytes a generated body may have, compile fails with SizeBudgetError
+        self.size_budget = size_budget
+
+    def clear_statement_stats(self):
+        self.statement_stats.clear()
 
     def _add_function_remote_args(self, function: Callable, orig: Callable):
         function.remote_args = get_sql_type_mapping(orig)
@@ -211,54 +1090,454 @@ class FunctionDeployment:
     def _add_function_remote_name(self, function: Callable, function_name: str):
         function.remote_name = f"{self.catalog}.{self.schema}.{function_name}"
 
+    def _build_remote_statement(
+        self, function: Callable, function_name: str, args
+    ) -> tuple[str, list[StatementParameterListItem]]:
+        # the statement text only depends on the function, values are bound as
+        # parameters so quoting is never an issue and the plan can be reused
+        call_args = [v for v in function.remote_args.values() if v.default is None]
+        if len(args) != len(call_args):
+            raise ValueError(
+                f"Expected {len(call_args)} arguments for remote call, got {len(args)}"
+            )
+        parameters = [
+            to_statement_parameter(call_arg.name, arg, call_arg.type)
+            for arg, call_arg in zip(args, call_args)
+        ]
+        call_string = ", ".join(
+            [get_parameter_expression(arg.name, arg.type) for arg in call_args]
+        )
+        call = f"{self.catalog}.{self.schema}.{function_name}({call_string})"
+        if is_table_function(self._raw_functions[function_name]):
+            return f"SELECT * FROM {call}", parameters
+        return f"SELECT {call}", parameters
+
+    def _build_remote_map_statement(
+        self, function: Callable, function_name: str, rows: list[tuple]
+    ) -> tuple[str, list[StatementParameterListItem]]:
+        # a whole chunk is one json array of structs exploded with inline, _idx
+        # keeps the input order
+        call_args = [v for v in function.remote_args.values() if v.default is None]
+        json_rows = []
+        for idx, row in enumerate(rows):
+            if isinstance(row, tuple) is False or len(row) != len(call_args):
+                raise ValueError(
+                    f"Expected rows of {len(call_args)} argument tuples for remote_map, "
+                    f"got: {row!r}"
+                )
+            json_row = {"_idx": idx}
+            for arg, call_arg in zip(row, call_args):
+                json_row[call_arg.name] = to_json_compatible(arg)
+            json_rows.append(json_row)
+        fields = ", ".join(
+            ["`_idx`: INT", *[f"`{arg.name}`: {arg.type}" for arg in call_args]]
+        )
+        call_string = ", ".join([f"`{arg.name}`" for arg in call_args])
+        stmt = (
+            f"SELECT _idx, {self.catalog}.{self.schema}.{function_name}({call_string}) "
+            f"FROM (SELECT inline(from_json(:rows, 'ARRAY<STRUCT<{fields}>>'))) "
+            f"ORDER BY _idx"
+        )
+        parameters = [
+            StatementParameterListItem(
+                name="rows", type="STRING", value=json.dumps(json_rows)
+            )
+        ]
+        return stmt, parameters
+
+    def _get_remote_target(self, kwargs) -> tuple[WorkspaceClient, str]:
+        # the shared client is created lazily because WorkspaceClient
+        # construction validates auth and will fail tests
+        ws_client: WorkspaceClient = self.session.get_client(
+            kwargs.pop("workspace_client", None)
+        )
+        warehouse_id: Optional[str] = kwargs.pop("warehouse_id", None)
+        if warehouse_id is None:
+            warehouse_id = self.warehouse_resolver.resolve(ws_client)
+        if kwargs:
+            raise ValueError("Keyword arguments are not supported in remote calls")
+        assert (
+            ws_client is not None
+        ), "Workspace client must be provided, foo.remote(workspace_client=...)"
+        assert (
+            warehouse_id is not None
+        ), "Warehouse id must be provided, foo.remote(warehouse_id)=...)"
+        return ws_client, warehouse_id
+
+    def _build_remote_over_table_statement(
+        self,
+        function: Callable,
+        function_name: str,
+        table: str,
+        columns: list[str],
+        sample: Optional[float] = None,
+        reference_column: Optional[str] = None,
+        compare_to: Optional[str] = None,
+        top_k: int = 10,
+    ) -> tuple[str, list[StatementParameterListItem]]:
+        # evaluates the function inside the warehouse and only returns aggregates.
+        # Outputs are grouped once and every aggregate is computed from the groups
+        # so the table is scanned and the function evaluated a single time.
+        call_args = [v for v in function.remote_args.values() if v.default is None]
+        if len(columns) != len(call_args):
+            raise ValueError(
+                f"Expected {len(call_args)} columns for remote_over_table, "
+                f"got {len(columns)}"
+            )
+        if top_k < 0:
+            raise ValueError("top_k must be at least 0")
+        call_string = ", ".join(
+            [
+                f"CAST({_quote_identifier(column)} AS {arg.type})"
+                for column, arg in zip(columns, call_args)
+            ]
+        )
+        if compare_to is not None:
+            compare_to = _quote_function_name(compare_to)
+            if "." not in compare_to:
+                compare_to = f"{self.catalog}.{self.schema}.{compare_to}"
+        response_type = get_response_sql_type(self._raw_functions[function_name])
+
+        def comparable(expression):
+            # maps can not be grouped or compared, compare their json instead
+            if is_complex_sql_type(response_type):
+                return f"to_json({expression})"
+            return expression
+
+        call = f"{self.catalog}.{self.schema}.{function_name}({call_string})"
+        outputs = [f"{comparable(call)} AS output"]
+        evaluated = ["output"]
+        grouped = ["output", "count(*) AS n"]
+        aggregates = [
+            "coalesce(sum(n), 0) AS row_count",
+            "coalesce(sum(n) FILTER (WHERE output IS NULL), 0) AS null_count",
+            "count(output) AS distinct_count",
+            f"to_json(slice(sort_array(collect_list(named_struct("
+            f"'count', n, 'value', CAST(output AS STRING))), false), 1, {top_k})) "
+            f"AS top_values",
+        ]
+        for alias, expression in [
+            ("reference", reference_column and _quote_identifier(reference_column)),
+            ("compare", compare_to and f"{compare_to}({call_string})"),
+        ]:
+            if expression is None:
+                aggregates.append(f"NULL AS {alias}_diff_count")
+                continue
+            outputs.append(f"{comparable(expression)} AS {alias}")
+            evaluated.append(
+                f"CASE WHEN output <=> {alias} THEN 0 ELSE 1 END AS {alias}_diff"
+            )
+            grouped.append(f"sum({alias}_diff) AS {alias}_diff")
+            aggregates.append(f"coalesce(sum({alias}_diff), 0) AS {alias}_diff_count")
+
+        source = "IDENTIFIER(:table)"
+        if isinstance(sample, float):
+            if not 0 < sample <= 1:
+                raise ValueError("A fractional sample must be between 0 and 1")
+            source += f" TABLESAMPLE ({sample * 100} PERCENT)"
+        elif isinstance(sample, int):
+            source += f" TABLESAMPLE ({sample} ROWS)"
+        stmt = (
+            f"WITH evaluated AS (SELECT {', '.join(evaluated)} FROM "
+            f"(SELECT {', '.join(outputs)} FROM {source})), "
+            f"grouped AS (SELECT {', '.join(grouped)} FROM evaluated GROUP BY output) "
+            f"SELECT {', '.join(aggregates)} FROM grouped"
+        )
+        return stmt, [
+            StatementParameterListItem(name="table", type="STRING", value=table)
+        ]
+
+    def _stream_remote_map(
+        self,
+        ws_client: WorkspaceClient,
+        function_name: str,
+        chunks: list[list[tuple]],
+        execute_chunk: Callable,
+        stmts: list,
+        concurrency: int,
+        prefetch: int,
+    ) -> Iterator:
+        # statements run concurrently, results are read one statement at a time
+        # in order and rows are already ordered by _idx. When the consumer stops
+        # early, or a chunk fails, statements that did not start are dropped and
+        # running ones are cancelled without waiting for them.
+        cancel = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            futures = [
+                pool.submit(execute_chunk, stmt, cancel=cancel) for stmt in stmts
+            ]
+            for chunk, future in zip(chunks, futures):
+                count = 0
+                for row in iter_arrow_rows(ws_client, future.result(), prefetch):
+                    count += 1
+                    yield row[1]
+                if count != len(chunk):
+                    raise ValueError(
+                        f"Expected {len(chunk)} results from {function_name}, "
+                        f"got {count}"
+                    )
+        finally:
+            cancel.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _get_remote_cache_key(
+        self,
+        function_name: str,
+        args,
+        ws_client: WorkspaceClient,
+        warehouse_id: str,
+    ) -> Optional[str]:
+        if self.remote_cache is None:
+            return None
+        self.serialize_fn(function_name)
+        content_hash = self._serialized_functions[function_name].content_hash()
+        host = getattr(getattr(ws_client, "config", None), "host", None)
+        return RemoteResultCache.make_key(
+            function_name,
+            content_hash,
+            to_json_compatible(list(args)),
+            host=host if isinstance(host, str) else None,
+            warehouse_id=warehouse_id,
+        )
+
+    def _parse_remote_result(self, resp, function_name: str):
+        data = resp.result.as_dict().get("data_array", [])
+        if is_table_function(self._raw_functions[function_name]):
+            # table functions return every row, possibly none
+            return data
+        if len(data) == 0:
+            raise ValueError("No data returned from function: " + str(data))
+        if len(data[0]) == 0:
+            raise ValueError("No data returned from function")
+        return data[0][0]
+
     def _add_function_remote_call(self, function: Callable, function_name: str):
-        def remote(*args, _wait_timeout="10s", **kwargs):
-            provided_ws_client: Optional[WorkspaceClient] = kwargs.pop(
-                "workspace_client", None
-            )
-            if provided_ws_client is None:
-                # this cant be above because WorkspaceClient construction validates auth and will fail tests
-                provided_ws_client = WorkspaceClient()
-            provided_warehouse_id: Optional[str] = kwargs.pop(
-                "warehouse_id",
-                self._get_first_warehouse_id(ws_client=provided_ws_client),
-            )
-            if kwargs:
-                raise ValueError("Keyword arguments are not supported in remote calls")
-            assert (
-                provided_ws_client is not None
-            ), "Workspace client must be provided, foo.remote(workspace_client=...)"
-            assert (
-                provided_warehouse_id is not None
-            ), "Warehouse id must be provided, foo.remote(warehouse_id)=...)"
-            # wrap string args in quotes
-            args = [f"'{arg}'" if isinstance(arg, str) else str(arg) for arg in args]
+        def remote(*args, _wait_timeout=None, _timeout=None, _stream=False, **kwargs):
+            # _stream returns the rows of a table function as an iterator of typed
+            # tuples downloaded in arrow chunks instead of one inline json result
+            if _stream and not is_table_function(self._raw_functions[function_name]):
+                raise ValueError("_stream is only supported for table functions")
+            provided_ws_client, provided_warehouse_id = self._get_remote_target(kwargs)
+            cache_key = (
+                None
+                if _stream
+                else self._get_remote_cache_key(
+                    function_name, args, provided_ws_client, provided_warehouse_id
+                )
+            )
+            if cache_key is not None:
+                hit, value = self.remote_cache.get(cache_key)
+                if hit:
+                    return value
+            stmt, parameters = self._build_remote_statement(
+                function, function_name, args
+            )
+            resp = run_sql(
+                provided_ws_client,
+                provided_warehouse_id,
+                stmt,
+                wait_timeout=_wait_timeout,
+                timeout=_timeout,
+                stats=self.statement_stats,
+                parameters=parameters,
+                **(ARROW_RESULT_OPTIONS if _stream else {}),
+            )
+            if _stream:
+                return iter_arrow_rows(provided_ws_client, resp)
+            value = self._parse_remote_result(resp, function_name)
+            if cache_key is not None:
+                self.remote_cache.set(cache_key, value, function_name)
+            return value
+
+        async def aremote(*args, _wait_timeout=None, _timeout=None, **kwargs):
+            # resolving the warehouse may list warehouses, keep it off the loop
+            provided_ws_client, provided_warehouse_id = await asyncio.to_thread(
+                self._get_remote_target, kwargs
+            )
+            cache_key = self._get_remote_cache_key(
+                function_name, args, provided_ws_client, provided_warehouse_id
+            )
+            if cache_key is not None:
+                hit, value = self.remote_cache.get(cache_key)
+                if hit:
+                    return value
+            stmt, parameters = self._build_remote_statement(
+                function, function_name, args
+            )
+            resp = await arun_sql(
+                provided_ws_client,
+                provided_warehouse_id,
+                stmt,
+                wait_timeout=_wait_timeout,
+                timeout=_timeout,
+                stats=self.statement_stats,
+                parameters=parameters,
+            )
+            value = self._parse_remote_result(resp, function_name)
+            if cache_key is not None:
+                self.remote_cache.set(cache_key, value, function_name)
+            return value
+
+        def remote_map(
+            rows,
+            chunk_size: int = 1000,
+            concurrency: int = 1,
+            stream: bool = False,
+            prefetch: int = 4,
+            _wait_timeout=None,
+            _timeout=None,
+            **kwargs,
+        ):
+            # evaluates many argument tuples with one statement per chunk of
+            # chunk_size rows, results are returned in the order of rows. stream
+            # returns an iterator of typed values read from arrow chunks, at most
+            # prefetch chunks per statement are downloaded ahead of the consumer
+            if is_table_function(self._raw_functions[function_name]):
+                raise ValueError("remote_map is not supported for table functions")
+            if chunk_size < 1 or concurrency < 1:
+                raise ValueError("chunk_size and concurrency must be at least 1")
+            rows = list(rows)
+            chunks = [
+                rows[start : start + chunk_size]
+                for start in range(0, len(rows), chunk_size)
+            ]
+            # build every statement first so bad rows fail before anything runs
+            stmts = [
+                self._build_remote_map_statement(function, function_name, chunk)
+                for chunk in chunks
+            ]
+            if len(stmts) == 0:
+                return iter([]) if stream else []
+            provided_ws_client, provided_warehouse_id = self._get_remote_target(kwargs)
+
+            def execute_chunk(statement, **result_options):
+                stmt, parameters = statement
+                return run_sql(
+                    provided_ws_client,
+                    provided_warehouse_id,
+                    stmt,
+                    wait_timeout=_wait_timeout,
+                    timeout=_timeout,
+                    stats=self.statement_stats,
+                    parameters=parameters,
+                    **result_options,
+                )
+
+            if stream:
+                return self._stream_remote_map(
+                    provided_ws_client,
+                    function_name,
+                    chunks,
+                    functools.partial(execute_chunk, **ARROW_RESULT_OPTIONS),
+                    stmts,
+                    concurrency,
+                    prefetch,
+                )
+
+            def run_chunk(statement):
+                return fetch_result_rows(provided_ws_client, execute_chunk(statement))
+
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = list(pool.map(run_chunk, stmts))
+            values = []
+            for chunk, chunk_rows in zip(chunks, results):
+                if len(chunk_rows) != len(chunk):
+                    raise ValueError(
+                        f"Expected {len(chunk)} results from {function_name}, "
+                        f"got {len(chunk_rows)}"
+                    )
+                values.extend([row[1] for row in sorted(chunk_rows, key=_row_index)])
+            return values
+
+        def remote_over_table(
+            table: str,
+            columns: list[str],
+            sample: Optional[float] = None,
+            reference_column: str = None,
+            compare_to: str = None,
+            top_k: int = 10,
+            _wait_timeout=None,
+            _timeout=None,
+            **kwargs,
+        ) -> TableEvaluation:
+            # columns are passed to the function in argument order. sample is a
+            # fraction of the table or a number of rows, reference_column and
+            # compare_to (another function, e.g. the previous version) count the
+            # rows whose output differs
+            if is_table_function(self._raw_functions[function_name]):
+                raise ValueError(
+                    "remote_over_table is not supported for table functions"
+                )
+            stmt, parameters = self._build_remote_over_table_statement(
+                function,
+                function_name,
+                table,
+                columns,
+                sample=sample,
+                reference_column=reference_column,
+                compare_to=compare_to,
+                top_k=top_k,
+            )
+            provided_ws_client, provided_warehouse_id = self._get_remote_target(kwargs)
             resp = run_sql(
                 provided_ws_client,
                 provided_warehouse_id,
-                f"SELECT {self.catalog}.{self.schema}.{function_name}({', '.join(args)})",
+                stmt,
                 wait_timeout=_wait_timeout,
+                timeout=_timeout,
+                stats=self.statement_stats,
+                parameters=parameters,
+            )
+            row = fetch_result_rows(provided_ws_client, resp)[0]
+            return TableEvaluation(
+                row_count=int(row[0]),
+                null_count=int(row[1]),
+                distinct_count=int(row[2]),
+                top_values=[
+                    (value.get("value"), value["count"])
+                    for value in json.loads(row[3] or "[]")
+                ],
+                reference_diff_count=_optional_int(row[4]),
+                compare_diff_count=_optional_int(row[5]),
             )
-            # resp
-            data = resp.result.as_dict().get("data_array", [])
-            if len(data) == 0:
-                raise ValueError("No data returned from function: " + str(data))
-            if len(data[0]) == 0:
-                raise ValueError("No data returned from function")
-            return data[0][0]
 
         function.remote = remote
+        function.aremote = aremote
+        function.remote_map = remote_map
+        function.remote_over_table = remote_over_table
 
-    def _add_function(self, function: Callable):
+    def _serialize_inlined(self, function: Callable) -> FunctionSerialized:
         assert hasattr(function, "_inlined"), "Function must be inlined"
         assert hasattr(function, "_inlined_code"), "Function must be inlined"
-        self._serialized_functions[function.__name__] = FunctionSerialized(
-            function_inlined=getattr(function, "_inlined_code"),
+        # the function object may be shared with other deployments, its
+        # attributes are only read
+        code = function._inlined_code
+        if self.minify:
+            code = minify(code, strip_asserts=self.strip_asserts)
+        helper_names = sorted(getattr(function, "_inlined_helper_names", []))
+        if is_table_function(function):
+            table_columns = get_table_sql_columns(function)
+            columns = ", ".join([f"{k} {v}" for k, v in table_columns.items()])
+            return FunctionSerialized(
+                function_inlined=code,
+                args=get_sql_type_mapping(function),
+                response_type=f"TABLE ({columns})",
+                function_name=function.__name__,
+                catalog=self.catalog,
+                schema=self.schema,
+                table_columns=table_columns,
+                handler_class=function.__name__ if inspect.isclass(function) else None,
+                helper_names=helper_names,
+            )
+        return FunctionSerialized(
+            function_inlined=code,
             args=get_sql_type_mapping(function),
             response_type=get_response_sql_type(function),
             function_name=function.__name__,
             catalog=self.catalog,
             schema=self.schema,
+            helper_names=helper_names,
         )
         # For future reference: we do not want to cloudpickle as it is not good for long term storage.
         # if not hasattr(function, "_inlined"):
@@ -284,34 +1563,55 @@ class FunctionDeployment:
         #     )
 
     def generate_deployment_sql(self, name) -> Iterator[str]:
-        function: FunctionSerialized = self._serialized_functions[name]
+        function = self.serialize_fn(name)
         yield from function.generate_drop_statements()
         yield from function.generate_create_statements()
 
-    def ensure_and_get_compile_path(self, name) -> Path:
+    def ensure_and_get_compile_dir(self) -> Path:
         if os.path.isabs(self.compile_sql_dir) is False:
             compile_dir = Path(os.path.join(self.root_dir, self.compile_sql_dir))
         else:
             compile_dir = Path(self.compile_sql_dir)
         compile_dir.mkdir(exist_ok=True)
+        return compile_dir
+
+    def ensure_and_get_compile_path(self, name, compile_dir: Path = None) -> Path:
+        compile_dir = compile_dir or self.ensure_and_get_compile_dir()
         function: FunctionSerialized = self._serialized_functions[name]
         # TODO: probably should refactor this into the class
         return compile_dir / f"{function.catalog}.{function.schema}.{name}.sql"
 
-    def _deploy_by_name(
-        self, name, workspace_client: WorkspaceClient, warehouse_id: str
-    ):
-        print(f"Deploying function: {name}")
-        stmts = self._compile_by_name(name)
-        for stmt in stmts:
-            run_sql(workspace_client, warehouse_id, stmt)
-
-    @staticmethod
-    def _get_first_warehouse_id(ws_client: WorkspaceClient):
-        for warehouse in ws_client.warehouses.list():
-            if warehouse.enable_serverless_compute is False:
-                continue
-            return warehouse.id
+    def _warm_warehouse(
+        self, workspace_client: WorkspaceClient, warehouse_id: Optional[str]
+    ) -> Future:
+        # resolving and starting the warehouse overlaps with compilation
+        if warehouse_id is not None:
+            future = Future()
+            future.set_result(warehouse_id)
+            return future
+        return self.warehouse_resolver.warm(workspace_client)
+
+    def get_dependencies(self, name, stmts: list[str] = None) -> set[str]:
+        # a function depends on every other registered function its ddl calls,
+        # the private _fn of a secret wrapper is part of the same function
+        stmts = stmts or list(self.generate_deployment_sql(name))
+        return {
+            other
+            for other in self.function_names()
+            if other != name
+            and any(f"{self.catalog}.{self.schema}.{other}(" in s for s in stmts)
+        }
+
+    def _get_deployment_names(self, name=None) -> list[str]:
+        return [name] if name else self.function_names()
+
+    def _compile_for_deployment(self, name=None) -> dict[str, list[str]]:
+        # compile everything up front, only the statements run concurrently
+        compile_dir = self.ensure_and_get_compile_dir()
+        return {
+            function_name: self._compile_by_name(function_name, compile_dir)
+            for function_name in self._get_deployment_names(name)
+        }
 
     # require kwargs
     def deploy(
@@ -320,49 +1620,590 @@ class FunctionDeployment:
         workspace_client: WorkspaceClient = None,
         warehouse_id: str = None,
         name=None,
+        concurrency: int = 1,
+        timeout: float = None,
+        incremental: bool = False,
     ):
-        if workspace_client is None:
-            workspace_client = WorkspaceClient()
-        if warehouse_id is None:
-            warehouse_id = self._get_first_warehouse_id(workspace_client)
+        # timeout applies to each statement, incremental only deploys functions
+        # that changed compared to the catalog, see plan and apply
+        workspace_client = self.session.get_client(workspace_client)
+        warehouse = self._warm_warehouse(workspace_client, warehouse_id)
 
-        if name:
-            self._deploy_by_name(name, workspace_client, warehouse_id)
+        if incremental:
+            for function_name in self._get_deployment_names(name):
+                self.serialize_fn(function_name)
+            warehouse_id = warehouse.result()
+            plan = self.plan(
+                workspace_client=workspace_client, warehouse_id=warehouse_id, name=name
+            )
+            self.apply(
+                plan,
+                workspace_client=workspace_client,
+                warehouse_id=warehouse_id,
+                concurrency=concurrency,
+                timeout=timeout,
+            )
+            return plan
+
+        compiled = self._compile_for_deployment(name)
+        self._run_deployment(
+            compiled, workspace_client, warehouse.result(), concurrency, timeout
+        )
+
+    def _run_deployment(
+        self,
+        compiled: dict[str, list[str]],
+        workspace_client: WorkspaceClient,
+        warehouse_id: str,
+        concurrency: int,
+        timeout: Optional[float],
+        dependencies: dict[str, set[str]] = None,
+    ):
+        # dependencies are passed when the statements target another schema
+        if dependencies is None:
+            dependencies = self._get_compiled_dependencies(compiled)
+
+        def deploy_statements(name):
+            self._start_function_deployment(name)
+            with span("deploy", name):
+                for stmt in compiled[name]:
+                    run_sql(
+                        workspace_client,
+                        warehouse_id,
+                        stmt,
+                        timeout=timeout,
+                        stats=self.statement_stats,
+                    )
+
+        errors = run_dag(dependencies, deploy_statements, concurrency=concurrency)
+        if errors:
+            raise DeploymentError(errors)
+
+    async def _arun_deployment(
+        self,
+        compiled: dict[str, list[str]],
+        workspace_client: WorkspaceClient,
+        warehouse_id: str,
+        concurrency: int,
+        timeout: Optional[float],
+    ):
+        dependencies = self._get_compiled_dependencies(compiled)
+
+        async def deploy_statements(name):
+            self._start_function_deployment(name)
+            with span("deploy", name):
+                for stmt in compiled[name]:
+                    await arun_sql(
+                        workspace_client,
+                        warehouse_id,
+                        stmt,
+                        timeout=timeout,
+                        stats=self.statement_stats,
+                    )
+
+        errors = await arun_dag(
+            dependencies, deploy_statements, concurrency=concurrency
+        )
+        if errors:
+            raise DeploymentError(errors)
+
+    def _get_compiled_dependencies(
+        self, compiled: dict[str, list[str]]
+    ) -> dict[str, set[str]]:
+        return {
+            name: self.get_dependencies(name, stmts) for name, stmts in compiled.items()
+        }
+
+    def _start_function_deployment(self, name):
+        logger.info("Deploying function: %s", name)
+        self._invalidate_remote_cache(name)
+
+    def generate_target_sql(self, name, catalog: str, schema: str) -> list[str]:
+        # the ddl of the serialized function with another catalog and schema,
+        # regenerated rather than rewritten so secret wrappers and content
+        # hashes refer to the target
+        function = dataclasses.replace(
+            self._serialized_functions[name], catalog=catalog, schema=schema
+        )
+        return [
+            *function.generate_drop_statements(),
+            *function.generate_create_statements(),
+        ]
+
+    def deploy_targets(
+        self,
+        targets: list[Target],
+        *,
+        name=None,
+        concurrency: int = 1,
+        target_concurrency: int = None,
+        timeout: float = None,
+    ) -> dict[str, TargetResult]:
+        # compiles once and deploys the functions to every target, up to
+        # target_concurrency targets at once (all by default) with concurrency
+        # functions at once per target. A failing target does not stop the
+        # others, the results are keyed on the target name in target order.
+        names = [t.name for t in targets]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Target names must be unique: {names}")
+        target_concurrency = target_concurrency or len(targets) or 1
+        if target_concurrency < 1:
+            raise ValueError("Target concurrency must be at least 1")
+
+        function_names = [name] if name else self.function_names()
+        compile_dir = self.ensure_and_get_compile_dir()
+        compiled = {n: self._compile_by_name(n, compile_dir) for n in function_names}
+        # the call graph is the same in every target
+        dependencies = {n: self.get_dependencies(n, s) for n, s in compiled.items()}
+
+        def deploy_target(target: Target) -> TargetResult:
+            result = TargetResult(target)
+            start = time.perf_counter()
+            try:
+                with span("target", target.name):
+                    workspace_client = self.session.get_client(target.workspace_client)
+                    warehouse_id = target.warehouse_id
+                    if warehouse_id is None:
+                        # warehouses are per workspace, the resolver is not shared
+                        resolver = (
+                            self.warehouse_resolver
+                            if target.workspace_client is None
+                            else WarehouseResolver(ttl=self.warehouse_resolver.ttl)
+                        )
+                        warehouse_id = resolver.resolve(workspace_client)
+                    logger.info(
+                        "Deploying to target %s: %s.%s",
+                        target.name,
+                        target.catalog,
+                        target.schema,
+                    )
+                    self._run_deployment(
+                        {
+                            n: self.generate_target_sql(
+                                n, target.catalog, target.schema
+                            )
+                            for n in function_names
+                        },
+                        workspace_client,
+                        warehouse_id,
+                        concurrency,
+                        timeout,
+                        dependencies=dependencies,
+                    )
+            except DeploymentError as e:
+                result.errors = e.errors
+            except Exception as e:
+                logger.error("Failed to deploy to target %s: %s", target.name, e)
+                result.error = e
+            result.seconds = time.perf_counter() - start
+            if result.error is None:
+                result.deployed = [n for n in function_names if n not in result.errors]
+            return result
+
+        with ThreadPoolExecutor(max_workers=target_concurrency) as pool:
+            results = list(pool.map(deploy_target, targets))
+        return {result.target.name: result for result in results}
+
+    def get_deployed_comments(
+        self, workspace_client: WorkspaceClient, warehouse_id: str
+    ) -> dict[str, str]:
+        # one bulk query for every routine in the schema, names are lower case in uc
+        resp = run_sql(
+            workspace_client,
+            warehouse_id,
+            f"SELECT routine_name, comment FROM {self.catalog}.information_schema.routines "
+            f"WHERE routine_schema = {to_sql_literal(self.schema)}",
+            stats=self.statement_stats,
+        )
+        rows = fetch_result_rows(workspace_client, resp)
+        return {row[0].lower(): row[1] for row in rows}
+
+    def plan(
+        self,
+        *,
+        workspace_client: WorkspaceClient = None,
+        warehouse_id: str = None,
+        name=None,
+    ) -> DeploymentPlan:
+        # name limits the plan to one function, the others are left as they are
+        workspace_client = self.session.get_client(workspace_client)
+        warehouse = self._warm_warehouse(workspace_client, warehouse_id)
+        names = self._get_deployment_names(name)
+        for function_name in names:
+            self.serialize_fn(function_name)
+
+        deployed = self.get_deployed_comments(workspace_client, warehouse.result())
+        plan = DeploymentPlan()
+        for function_name in names:
+            function = self._serialized_functions[function_name]
+            comment = function.get_content_comment()
+            private_name = f"_{function_name}"
+            deployed_names = [function_name.lower()]
+            if function.contains_secrets():
+                deployed_names.append(private_name.lower())
+            statements = []
+            if all(deployed.get(n) == comment for n in deployed_names):
+                plan.unchanged.append(function_name)
+            else:
+                if function_name.lower() in deployed:
+                    plan.replaced.append(function_name)
+                else:
+                    plan.created.append(function_name)
+                # create or replace is atomic, there is no window without the
+                # function
+                statements.extend(function.generate_create_statements(comment=comment))
+            if (
+                not function.contains_secrets()
+                and private_name.lower() in deployed
+                and private_name not in self._raw_functions
+            ):
+                # dropped after the wrapper is replaced so it is never called
+                plan.dropped.append(private_name)
+                statements.append(
+                    f"DROP FUNCTION IF EXISTS "
+                    f"{self.catalog}.{self.schema}.{private_name};"
+                )
+            if statements:
+                plan.statements[function_name] = statements
+        logger.info(
+            "Deployment plan: %s to create, %s to replace, %s unchanged, %s to drop",
+            len(plan.created),
+            len(plan.replaced),
+            len(plan.unchanged),
+            len(plan.dropped),
+        )
+        return plan
+
+    def apply(
+        self,
+        plan: DeploymentPlan,
+        *,
+        workspace_client: WorkspaceClient = None,
+        warehouse_id: str = None,
+        concurrency: int = 1,
+        timeout: float = None,
+    ):
+        if plan.is_empty():
             return
-        for name in self._raw_functions.keys():
-            self._deploy_by_name(name, workspace_client, warehouse_id)
+        workspace_client = self.session.get_client(workspace_client)
+        if warehouse_id is None:
+            warehouse_id = self.warehouse_resolver.resolve(workspace_client)
+        self._run_deployment(
+            plan.statements, workspace_client, warehouse_id, concurrency, timeout
+        )
+
+    async def adeploy(
+        self,
+        *,
+        workspace_client: WorkspaceClient = None,
+        warehouse_id: str = None,
+        name=None,
+        concurrency: int = 1,
+        timeout: float = None,
+        incremental: bool = False,
+    ):
+        # timeout applies to each statement, cancelling adeploy cancels every
+        # in flight statement on the warehouse
+        workspace_client = self.session.get_client(workspace_client)
+        warehouse = self._warm_warehouse(workspace_client, warehouse_id)
+
+        if incremental:
+            for function_name in self._get_deployment_names(name):
+                self.serialize_fn(function_name)
+            warehouse_id = await asyncio.wrap_future(warehouse)
+            # the catalog is read with a single statement, only the deployment
+            # statements run on the event loop
+            plan = await asyncio.to_thread(
+                self.plan,
+                workspace_client=workspace_client,
+                warehouse_id=warehouse_id,
+                name=name,
+            )
+            if not plan.is_empty():
+                await self._arun_deployment(
+                    plan.statements,
+                    workspace_client,
+                    warehouse_id,
+                    concurrency,
+                    timeout,
+                )
+            return plan
+
+        compiled = self._compile_for_deployment(name)
+        await self._arun_deployment(
+            compiled,
+            workspace_client,
+            await asyncio.wrap_future(warehouse),
+            concurrency,
+            timeout,
+        )
 
-    def _compile_by_name(self, name):
+    def _invalidate_remote_cache(self, name):
+        # cached results of the previously deployed version are stale
+        if self.remote_cache is not None:
+            self.remote_cache.invalidate(name)
+
+    def _compile_by_name(self, name, compile_dir: Path = None):
         # should serialize function if it has not already been done
-        print(f"Compiling: {name}")
-        self.serialize_fn(name)
-        stmts_generated = []
-        for stmt in self.generate_deployment_sql(name):
-            stmts_generated.append(stmt)
-        self.ensure_and_get_compile_path(name).write_text("\n".join(stmts_generated))
+        logger.info("Compiling: %s", name)
+        with span("compile", name):
+            self.serialize_fn(name)
+            stmts_generated = []
+            for stmt in self.generate_deployment_sql(name):
+                stmts_generated.append(stmt)
+            path = self.ensure_and_get_compile_path(name, compile_dir)
+            with span("write", str(path)):
+                path.write_text("\n".join(stmts_generated))
         return stmts_generated
 
-    def compile(self, name=None):
+    def compile(self, name=None, bundle: bool = False):
+        # bundle writes one ordered script and a manifest instead of a file per
+        # function, see compile_bundle
+        if bundle:
+            if name:
+                raise ValueError(
+                    "bundle compiles every function, name is not supported"
+                )
+            self.compile_bundle()
+            return
+        compile_dir = self.ensure_and_get_compile_dir()
         if name:
-            self._compile_by_name(name)
+            self._compile_by_name(name, compile_dir)
             return
-        for name in self._raw_functions.keys():
-            self._compile_by_name(name)
+        for name in self.function_names():
+            self._compile_by_name(name, compile_dir)
+
+    def get_deployment_order(self) -> list[str]:
+        # functions come after the functions their ddl calls
+        for name in self.function_names():
+            self.serialize_fn(name)
+        return topological_order(
+            {name: self.get_dependencies(name) for name in self.function_names()}
+        )
+
+    def build_manifest(self, order: list[str] = None) -> dict:
+        order = order or self.get_deployment_order()
+        functions = []
+        for name in order:
+            function = self._serialized_functions[name]
+            stmts = list(self.generate_deployment_sql(name))
+            impure_imports = sorted(
+                set(function.get_imported_modules()) & IMPURE_MODULES
+            )
+            functions.append(
+                {
+                    "name": name,
+                    "full_name": f"{self.catalog}.{self.schema}.{name}",
+                    "signature": function.get_signature(),
+                    "args": [
+                        {
+                            "name": arg.name,
+                            "type": arg.type,
+                            "secret": isinstance(arg.default, DatabricksSecret),
+                        }
+                        for arg in function.args.values()
+                    ],
+                    "returns": function.response_type,
+                    "table_function": function.is_table_function(),
+                    "content_hash": function.content_hash(),
+                    "dependencies": sorted(self.get_dependencies(name, stmts)),
+                    "statements": len(stmts),
+                    "size_bytes": len("\n".join(stmts).encode("utf-8")),
+                    "inlined_size_bytes": len(
+                        function.function_inlined.encode("utf-8")
+                    ),
+                    "imports": function.get_imported_modules(),
+                    "secrets": function.contains_secrets(),
+                    "pure": not function.contains_secrets() and not impure_imports,
+                    "impure_imports": impure_imports,
+                }
+            )
+        return {
+            "catalog": self.catalog,
+            "schema": self.schema,
+            "functions": functions,
+        }
+
+    def compile_bundle(self) -> tuple[Path, Path]:
+        # one script with every function in dependency order, secret wrappers
+        # after their private function, and a json manifest describing it
+        compile_dir = self.ensure_and_get_compile_dir()
+        order = self.get_deployment_order()
+        blocks = [
+            f"-- Generated by uc-functions for {self.catalog}.{self.schema}, "
+            f"apply in order"
+        ]
+        for name in order:
+            logger.info("Compiling: %s", name)
+            with span("compile", name):
+                stmts = list(self.generate_deployment_sql(name))
+            blocks.append(f"-- function: {name}\n" + "\n".join(stmts))
+        prefix = f"{self.catalog}.{self.schema}"
+        sql_path = compile_dir / f"{prefix}.bundle.sql"
+        manifest_path = compile_dir / f"{prefix}.manifest.json"
+        with span("write", str(sql_path)):
+            sql_path.write_text("\n\n".join(blocks) + "\n")
+        with span("write", str(manifest_path)):
+            manifest_path.write_text(
+                json.dumps(self.build_manifest(order), indent=2) + "\n"
+            )
+        return sql_path, manifest_path
+
+    def generate_pandas_udf_module(self) -> str:
+        header = textwrap.dedent(
+            f"""
+{GENERATED_CODE_MARKER} from {self.catalog}.{self.schema}, do not edit.
+# Functions without secrets are pandas udfs, functions with secrets are
+# builders that resolve the secrets on the driver and return the pandas udf.
+import pandas as pd
+from pyspark.sql.functions import pandas_udf
+
+
+def _secret(scope, key):
+    from databricks.sdk.runtime import dbutils
+
+    return dbutils.secrets.get(scope=scope, key=key)
+"""
+        ).strip()
+        blocks = [header]
+        for name in self.function_names():
+            function = self.serialize_fn(name)
+            if function.is_table_function():
+                # udtfs have no pandas_udf equivalent
+                continue
+            if not function.has_column_args():
+                logger.info("Skipping pandas udf without column arguments: %s", name)
+                continue
+            blocks.extend(function.generate_pandas_udf_code())
+        return RecursiveResolver.format("\n\n".join(blocks))
+
+    def compile_pandas_udfs(self, module_name: str = None) -> Path:
+        module_name = module_name or f"{self.catalog}_{self.schema}_pandas_udfs"
+        logger.info("Compiling pandas udfs: %s", module_name)
+        module_code = self.generate_pandas_udf_module()
+        path = self.ensure_and_get_compile_dir() / f"{module_name}.py"
+        with span("write", str(path)):
+            path.write_text(module_code)
+        return path
 
     def get_function(self, name: str) -> FunctionSerialized:
         return self._serialized_functions[name]
 
-    def serialize_fn(self, name):
-        if name not in self._serialized_functions:
+    def package_shared_helpers(
+        self, volume_path: str, min_functions: int = 2, pin_requirements: bool = True
+    ) -> Optional[SharedHelpers]:
+        # helpers inlined into at least min_functions functions are written once
+        # to a wheel in volume_path (e.g. /Volumes/catalog/schema/volume), the
+        # functions import them and depend on the wheel and, with
+        # pin_requirements, on their third party imports at the installed
+        # version. Call it again after registering more functions.
+        names = self.function_names()
+        for name in names:
+            self.serialize_fn(name)
+        functions = {name: self._serialized_functions[name] for name in names}
+        shared = package_shared_helpers(
+            {name: f.function_inlined for name, f in functions.items()},
+            {name: set(f.helper_names or []) for name, f in functions.items()},
+            volume_path,
+            get_package_name(self.catalog, self.schema),
+            min_functions=min_functions,
+        )
+        packaged = {}
+        for name, function in functions.items():
+            function_packaged = None
+            dependencies = []
+            if shared is not None and name in shared.functions:
+                helpers = {
+                    helper: shared.helpers[helper] for helper in shared.functions[name]
+                }
+                function_packaged = strip_shared_helpers(
+                    function.function_inlined, helpers, shared.package
+                )
+                if self.minify:
+                    function_packaged = minify(
+                        function_packaged, strip_asserts=self.strip_asserts
+                    )
+                dependencies.append(str(shared.wheel_path))
+            if pin_requirements:
+                dependencies.extend(
+                    get_third_party_requirements(function.function_inlined)
+                )
+            packaged[name] = dataclasses.replace(
+                function,
+                function_packaged=function_packaged,
+                environment_dependencies=dependencies or None,
+            )
+        # new objects rather than changing the ones concurrent deploys read,
+        # functions registered again meanwhile keep their new registration
+        with self._lock:
+            for name, function in packaged.items():
+                if self._serialized_functions.get(name) is functions[name]:
+                    self._serialized_functions[name] = function
+        return shared
+
+    def get_original_function(self, name: str) -> Callable:
+        return self._raw_functions[name]
+
+    def function_names(self) -> list[str]:
+        # a snapshot, safe to iterate while other threads register
+        with self._lock:
+            return list(self._raw_functions.keys())
+
+    def _get_function_lock(self, name) -> threading.Lock:
+        with self._lock:
+            return self._function_locks.setdefault(name, threading.Lock())
+
+    def serialize_fn(self, name) -> FunctionSerialized:
+        serialized = self._serialized_functions.get(name)
+        if serialized is not None:
+            return serialized
+        with self._get_function_lock(name):
+            # another thread may have serialized it while this one waited
+            serialized = self._serialized_functions.get(name)
+            if serialized is not None:
+                return serialized
             function = self._raw_functions[name]
-            inlined_func = inline_function(
-                function, self.root_dir, globals_dict={**globals(), **self.globals_dict}
+            with _get_inline_lock(function):
+                inlined_func = inline_function(
+                    function,
+                    self.root_dir,
+                    globals_dict={**globals(), **self.globals_dict},
+                )
+                serialized = self._serialize_inlined(inlined_func)
+            # not kept when over the budget so that compiling again checks again
+            self._check_size_budget(serialized)
+            with self._lock:
+                self._serialized_functions[name] = serialized
+            return serialized
+
+    def _check_size_budget(self, function: FunctionSerialized):
+        if self.size_budget is None:
+            return
+        size = len(function.get_deployed_code().encode("utf-8"))
+        if size > self.size_budget:
+            raise SizeBudgetError(
+                function.function_name,
+                size,
+                self.size_budget,
+                function.size_breakdown(),
             )
-            self._add_function(inlined_func)
 
     def register(self, function: Callable):
-        self._raw_functions[function.__name__] = function
+        with self._get_function_lock(function.__name__), self._lock:
+            self._raw_functions[function.__name__] = function
+            # a re-registered function is serialized again, which changes its hash
+            self._serialized_functions.pop(function.__name__, None)
         f_args = get_sql_type_mapping(function)
+        if is_table_function(function):
+            # validate the row type eagerly like the argument types
+            get_table_sql_columns(function)
+        if inspect.isclass(function):
+            # udtf handler classes are instantiated by the caller so they are
+            # returned as is with the remote attributes attached
+            self._add_function_remote_args(function, function)
+            self._add_function_remote_name(function, function.__name__)
+            self._add_function_remote_call(function, function.__name__)
+            return function
 
         @functools.wraps(function)
         def wrapper(*args, **kwargs):
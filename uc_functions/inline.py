@@ -1,7 +1,9 @@
 import ast
 import functools
 import inspect
+import logging
 import os
+import textwrap
 import types
 from io import StringIO
 from typing import Callable
@@ -9,6 +11,7 @@ from typing import Callable
 import astor
 import black
 
+from uc_functions.instrumentation import span
 from uc_functions.special_kwargs import DatabricksSecret
 from uc_functions.visitors import (
     ASTNameNodeMappingExtractor,
@@ -17,14 +20,17 @@ from uc_functions.visitors import (
     ImportVisitor,
     ReplaceDotsTransformer,
     UnresolvedNamesFinder,
+    get_defined_names,
 )
 
+logger = logging.getLogger(__name__)
+
 
 def get_obj_source(obj):
     try:
         return inspect.getsource(obj)
     except Exception as e:
-        print(f"Error getting source for {obj}: {e}")
+        logger.debug("Error getting source for %s: %s", obj, e)
         return None
 
 
@@ -65,9 +71,12 @@ def find_undefined_names(source_code, skip_these_names: list[str] = None):
 #     return None, None
 
 
+GENERATED_CODE_MARKER = "# Generated by uc-functions"
+
+
 @functools.lru_cache(maxsize=32)
 def generate_ast_dict(directory):
-    print(f"Generating AST dictionary for {directory}")
+    logger.info("Generating AST dictionary for %s", directory)
     name_dict = {}
 
     # TODO: support gitignore refspec
@@ -79,29 +88,44 @@ def generate_ast_dict(directory):
                 continue
             if filename.endswith(".py"):
                 file_path = os.path.join(root, filename)
-                print("Indexing: ", file_path)
-                with open(file_path, "r", encoding="utf-8") as file:
+                logger.debug("Indexing: %s", file_path)
+                with span("index", file_path), open(
+                    file_path, "r", encoding="utf-8"
+                ) as file:
                     source_code = file.read()
+                    if source_code.startswith(GENERATED_CODE_MARKER):
+                        # emitted modules (e.g. pandas udfs) must not shadow the sources
+                        continue
                     node = ast.parse(source_code, filename=file_path)
                     extractor = ASTNameNodeMappingExtractor()
                     extractor.visit(node)
                     name_dict.update(extractor.name_dict)
 
-    return name_dict
+    # every caller shares the cached index, a read only view keeps one
+    # inlining from changing what concurrent ones resolve
+    return types.MappingProxyType(name_dict)
 
 
 class RecursiveResolver:
 
     def __init__(
-        self, skip_classes=None, name_ast_dict=None, args_names_predefined=None
+        self,
+        skip_classes=None,
+        name_ast_dict=None,
+        args_names_predefined=None,
+        keep_root_definition=False,
     ):
         self.name_ast_dict = name_ast_dict
         self.root_function_code = None
+        self.root_function_name = ""
         self.functions_code = []
         self.already_visited_functions = set()
         self.imports = set()
         self.skip_classes = skip_classes or []
         self.arg_names_predefined = args_names_predefined or []
+        # classes (e.g. udtf handlers) are kept as a definition instead of
+        # unwrapping the body of the root function
+        self.keep_root_definition = keep_root_definition
 
     def get_imports_from_func_file(self, obj):
         file = get_obj_file_source(obj)
@@ -123,6 +147,7 @@ class RecursiveResolver:
             self.imports.add(import_stmt)
         if is_root_function:
             self.root_function_code = src
+            self.root_function_name = getattr(obj, "__name__", "")
         else:
             self.functions_code.append(src)
         tree = ast.parse(src)
@@ -149,7 +174,8 @@ class RecursiveResolver:
 
     @staticmethod
     def format(code: str):
-        return black.format_str(code, mode=black.FileMode(line_length=80))
+        with span("format"):
+            return black.format_str(code, mode=black.FileMode(line_length=80))
 
     @staticmethod
     def lint_code_for_undefined_names(code: str):
@@ -171,6 +197,42 @@ class RecursiveResolver:
 
         return undefined_names
 
+    def _inline_once(self, root: ast.Module, globals_dict):
+        # sorted so the generated code, and its content hash, does not depend on
+        # set iteration order which changes between processes
+        imports_code = "\n".join(
+            sorted(self.imports, key=lambda i: (not i.startswith("from __future__"), i))
+        )
+        imports_tree = ast.parse(imports_code)
+        dep_code = "\n\n".join(reversed(self.functions_code))
+        dep_tree = ast.parse(dep_code)
+        new_tree = self.stitch_code(
+            imports_tree.body,
+            dep_tree.body,
+            root.body if self.keep_root_definition else root.body[0].body,
+        )
+        replace_dot_call = ReplaceDotsTransformer(globals_dict)
+        new_tree = replace_dot_call.visit(new_tree)
+        io = ImportOptimizer()
+        io.optimize_imports(new_tree)
+        final_code = self.format(astor.to_source(new_tree))
+        undefined_names = find_undefined_names(
+            final_code, skip_these_names=self.arg_names_predefined
+        )
+        return final_code, undefined_names
+
+    def get_helper_names(self) -> set:
+        # names defined by the inlined dependencies rather than the root function
+        names = set()
+        for code in self.functions_code:
+            try:
+                tree = ast.parse(textwrap.dedent(code))
+            except SyntaxError:
+                continue
+            for node in tree.body:
+                names.update(get_defined_names(node))
+        return names
+
     def get_inline(self, globals_dict, recursion_limit=100):
         root = ast.parse(self.root_function_code)
         retries = 1
@@ -183,26 +245,12 @@ class RecursiveResolver:
         # means. If previous undefined names are the same as current undefined
         # that means there is a field that is unable to be resolved.
         while retries <= recursion_limit:
-            print(f"Attempting to inline {retries} times")
-            imports_code = "\n".join(self.imports)
-            imports_tree = ast.parse(imports_code)
-            dep_code = "\n\n".join(reversed(self.functions_code))
-            dep_tree = ast.parse(dep_code)
-            new_tree = self.stitch_code(
-                imports_tree.body, dep_tree.body, root.body[0].body
-            )
-            replace_dot_call = ReplaceDotsTransformer(globals_dict)
-            new_tree = replace_dot_call.visit(new_tree)
-            io = ImportOptimizer()
-            io.optimize_imports(new_tree)
-            final_code = astor.to_source(new_tree)
-            final_code = self.format(final_code)
-            undefined_names = find_undefined_names(
-                final_code, skip_these_names=self.arg_names_predefined
-            )
+            logger.debug("Attempting to inline %s times", retries)
+            with span("inline", self.root_function_name, iteration=retries):
+                final_code, undefined_names = self._inline_once(root, globals_dict)
             if len(undefined_names) == 0:
                 return final_code
-            for name in undefined_names:
+            for name in sorted(undefined_names):
                 if name in self.name_ast_dict:
                     self.functions_code.append(
                         astor.to_source(self.name_ast_dict[name])
@@ -247,13 +295,19 @@ class RecursiveResolver:
 
 
 def inline_function(function: Callable, code_root: str, globals_dict=None):
-    arg_spec = inspect.getfullargspec(function)
-    arg_names = arg_spec.args + arg_spec.kwonlyargs
+    is_class = inspect.isclass(function)
+    if is_class:
+        # class definitions are kept whole so their own args are already defined
+        arg_names = []
+    else:
+        arg_spec = inspect.getfullargspec(function)
+        arg_names = arg_spec.args + arg_spec.kwonlyargs
     name_to_ast_node = generate_ast_dict(code_root)
     r = RecursiveResolver(
         skip_classes=[DatabricksSecret],
         name_ast_dict=name_to_ast_node,
         args_names_predefined=arg_names,
+        keep_root_definition=is_class,
     )
     # TODO: explore doing this without a recursion error when executing the module
     # for super edge cases like importlib, etc.
@@ -261,10 +315,11 @@ def inline_function(function: Callable, code_root: str, globals_dict=None):
     # only hard things to do with ast is things like importlib, etc. which then you need to exec the module
     # functions_dict = load_functions_and_classes_from_directory(code_root)
     # _globals_dict = {**functions_dict, **(globals_dict or globals())}
-    # print(_globals_dict)
     _globals_dict = {**(globals_dict or globals())}
-    r.resolve(function, _globals_dict, is_root_function=True)
+    with span("resolve", function.__name__):
+        r.resolve(function, _globals_dict, is_root_function=True)
     code = r.get_inline(_globals_dict)
     function._inlined = True
     function._inlined_code = code
+    function._inlined_helper_names = r.get_helper_names()
     return function
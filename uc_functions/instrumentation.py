@@ -0,0 +1,170 @@
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Phases recorded by the compile and deploy pipeline:
+#   index    one indexed source file
+#   resolve  resolving the dependencies of one function
+#   inline   one inline iteration of one function
+#   format   formatting generated code
+#   compile  compiling one function including the phases above
+#   write    writing one compiled file
+#   target   deploying to one target of deploy_targets
+#   deploy   running the statements of one function
+#   submit   submitting one statement
+#   poll     polling one statement once
+# Spans nest, e.g. format runs inside inline, so phase totals overlap.
+
+
+@dataclass
+class Span:
+    phase: str
+    name: str
+    # seconds since the instrumentation was created
+    start: float
+    duration: float
+    thread_id: int
+    attributes: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+class Instrumentation:
+
+    def __init__(self, hooks: List[Callable[[Span], None]] = None):
+        # hooks are called with every finished span from the thread that ran it
+        self.hooks = list(hooks or [])
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._started = datetime.datetime.now(datetime.timezone.utc)
+
+    def add_hook(self, hook: Callable[[Span], None]):
+        self.hooks.append(hook)
+
+    @contextmanager
+    def span(self, phase: str, name: str = "", **attributes):
+        # yields the attributes so the caller can add to them, e.g. the
+        # statement id once it is known
+        start = time.perf_counter()
+        error = None
+        try:
+            yield attributes
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span = Span(
+                phase=phase,
+                name=name,
+                start=start - self._origin,
+                duration=time.perf_counter() - start,
+                thread_id=threading.get_ident(),
+                attributes=attributes,
+                error=error,
+            )
+            with self._lock:
+                self.spans.append(span)
+            logger.debug("%s %s took %.4fs", phase, name, span.duration)
+            for hook in self.hooks:
+                hook(span)
+
+    def summary(self) -> Dict[str, dict]:
+        with self._lock:
+            spans = list(self.spans)
+        phases: Dict[str, dict] = {}
+        for span in spans:
+            phase = phases.setdefault(
+                span.phase,
+                {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0, "errors": 0},
+            )
+            phase["count"] += 1
+            phase["total_seconds"] += span.duration
+            phase["max_seconds"] = max(phase["max_seconds"], span.duration)
+            phase["errors"] += span.error is not None
+        return phases
+
+    def report(self) -> dict:
+        with self._lock:
+            spans = [asdict(span) for span in self.spans]
+        return {
+            "started": self._started.isoformat(),
+            "wall_seconds": time.perf_counter() - self._origin,
+            "phases": self.summary(),
+            "spans": spans,
+        }
+
+    def chrome_trace(self) -> dict:
+        # complete events in microseconds, open in chrome://tracing or perfetto
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "traceEvents": [
+                {
+                    "name": f"{span.phase} {span.name}".strip(),
+                    "cat": span.phase,
+                    "ph": "X",
+                    "ts": span.start * 1e6,
+                    "dur": span.duration * 1e6,
+                    "pid": os.getpid(),
+                    "tid": span.thread_id,
+                    "args": {
+                        **{k: str(v) for k, v in span.attributes.items()},
+                        **({"error": span.error} if span.error else {}),
+                    },
+                }
+                for span in spans
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write_report(self, path: str):
+        Path(path).write_text(json.dumps(self.report(), indent=2, default=str))
+
+    def write_chrome_trace(self, path: str):
+        Path(path).write_text(json.dumps(self.chrome_trace()))
+
+
+# process wide rather than per context so spans of worker threads are recorded
+_active: Optional[Instrumentation] = None
+
+
+def get_instrumentation() -> Optional[Instrumentation]:
+    return _active
+
+
+@contextmanager
+def instrument(
+    instrumentation: Instrumentation = None,
+    report_path: str = None,
+    trace_path: str = None,
+):
+    # records every span while active, the report and the trace are written on
+    # exit when their paths are set
+    global _active
+    instrumentation = instrumentation or Instrumentation()
+    previous = _active
+    _active = instrumentation
+    try:
+        yield instrumentation
+    finally:
+        _active = previous
+        if report_path is not None:
+            instrumentation.write_report(report_path)
+        if trace_path is not None:
+            instrumentation.write_chrome_trace(trace_path)
+
+
+def span(phase: str, name: str = "", **attributes):
+    # a no op unless instrumentation is active, cheap enough for hot paths
+    if _active is None:
+        return nullcontext(attributes)
+    return _active.span(phase, name, **attributes)
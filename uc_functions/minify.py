@@ -0,0 +1,177 @@
+import ast
+from typing import Dict, Iterable
+
+from uc_functions.visitors import get_defined_names
+
+# Shrinks generated bodies before they are deployed. Docstrings and other bare
+# strings, annotations, branches on constant conditions and unused imports are
+# removed and the code is unparsed without comments, blank lines or wrapping.
+# Annotations are kept where they have a runtime meaning: class bodies
+# (dataclass, NamedTuple and TypedDict fields) and decorated functions
+# (singledispatch, validators).
+
+IMPORTS = "<imports>"
+
+
+def _is_string_statement(node: ast.stmt) -> bool:
+    return (
+        isinstance(node, ast.Expr)
+        and isinstance(node.value, ast.Constant)
+        and isinstance(node.value.value, str)
+    )
+
+
+def _is_type_checking(test: ast.expr) -> bool:
+    return (isinstance(test, ast.Name) and test.id == "TYPE_CHECKING") or (
+        isinstance(test, ast.Attribute) and test.attr == "TYPE_CHECKING"
+    )
+
+
+class _Minifier(ast.NodeTransformer):
+
+    def __init__(self, strip_asserts: bool = False):
+        self.strip_asserts = strip_asserts
+        self._class_depth = 0
+
+    def _body(self, statements: list) -> list:
+        body = []
+        for statement in statements:
+            if _is_string_statement(statement):
+                continue
+            result = self.visit(statement)
+            if result is None:
+                continue
+            body.extend(result if isinstance(result, list) else [result])
+        return body
+
+    def generic_visit(self, node):
+        for name in ("body", "orelse", "finalbody"):
+            statements = getattr(node, name, None)
+            if isinstance(statements, list) and statements:
+                body = self._body(statements)
+                # blocks that must not be empty get a pass
+                if not body and (name == "body" or name == "finalbody"):
+                    body = [ast.Pass()]
+                setattr(node, name, body)
+        for block in [*getattr(node, "handlers", []), *getattr(node, "cases", [])]:
+            block.body = self._body(block.body) or [ast.Pass()]
+        return node
+
+    def visit_Module(self, node):
+        node.body = self._body(node.body)
+        return node
+
+    def _visit_function(self, node):
+        if not node.decorator_list:
+            node.returns = None
+            for arg in [
+                *node.args.posonlyargs,
+                *node.args.args,
+                *node.args.kwonlyargs,
+                node.args.vararg,
+                node.args.kwarg,
+            ]:
+                if arg is not None:
+                    arg.annotation = None
+        # nested class bodies are only the direct children of a class
+        depth, self._class_depth = self._class_depth, 0
+        self.generic_visit(node)
+        self._class_depth = depth
+        return node
+
+    visit_FunctionDef = _visit_function
+    visit_AsyncFunctionDef = _visit_function
+
+    def visit_ClassDef(self, node):
+        self._class_depth += 1
+        self.generic_visit(node)
+        self._class_depth -= 1
+        return node
+
+    def visit_AnnAssign(self, node):
+        if self._class_depth:
+            return node
+        if node.value is None:
+            # a bare annotation only declares the name
+            return None
+        return ast.copy_location(
+            ast.Assign(targets=[node.target], value=node.value), node
+        )
+
+    def visit_Assert(self, node):
+        return None if self.strip_asserts else node
+
+    def visit_If(self, node):
+        self.generic_visit(node)
+        if _is_type_checking(node.test):
+            return node.orelse or None
+        if isinstance(node.test, ast.Constant):
+            return (node.body if node.test.value else node.orelse) or None
+        return node
+
+
+def _referenced_names(tree: ast.AST) -> set:
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            # string annotations and __all__ may reference imported names
+            names.update(node.value.replace(".", " ").replace("[", " ").split())
+    return names
+
+
+def _remove_unused_imports(tree: ast.Module):
+    # only top level imports, an alias is dropped when nothing references it
+    referenced = _referenced_names(tree)
+    body = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)) and not (
+            isinstance(node, ast.ImportFrom) and node.module == "__future__"
+        ):
+            node.names = [
+                alias
+                for alias in node.names
+                if alias.name == "*"
+                or (alias.asname or alias.name.split(".")[0]) in referenced
+            ]
+            if not node.names:
+                continue
+        body.append(node)
+    tree.body = body
+
+
+def minify(code: str, strip_asserts: bool = False) -> str:
+    tree = _Minifier(strip_asserts=strip_asserts).visit(ast.parse(code))
+    _remove_unused_imports(tree)
+    ast.fix_missing_locations(tree)
+    # unparse writes string literals on one line once docstrings are gone, so
+    # every blank line is one it put between definitions
+    lines = ast.unparse(tree).splitlines()
+    return "\n".join(line for line in lines if line.strip()) + "\n"
+
+
+def _statement_lines(node: ast.stmt) -> tuple:
+    first = min([node.lineno, *[d.lineno for d in getattr(node, "decorator_list", [])]])
+    return first, node.end_lineno
+
+
+def size_breakdown(
+    code: str, helper_names: Iterable[str], own_name: str
+) -> Dict[str, int]:
+    # bytes of every top level statement attributed to the helper it defines,
+    # to IMPORTS or to own_name for the function's own statements, largest
+    # first. Blank lines between statements are not attributed.
+    helper_names = set(helper_names)
+    lines = code.splitlines(keepends=True)
+    sizes: Dict[str, int] = {}
+    for node in ast.parse(code).body:
+        first, last = _statement_lines(node)
+        size = len("".join(lines[first - 1 : last]).encode("utf-8"))
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            owner = IMPORTS
+        else:
+            defined = sorted(get_defined_names(node) & helper_names)
+            owner = defined[0] if defined else own_name
+        sizes[owner] = sizes.get(owner, 0) + size
+    return dict(sorted(sizes.items(), key=lambda item: item[1], reverse=True))
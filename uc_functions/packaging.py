@@ -0,0 +1,234 @@
+import ast
+import base64
+import hashlib
+import importlib.metadata
+import logging
+import re
+import sys
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import astor
+
+from uc_functions.inline import RecursiveResolver
+from uc_functions.visitors import ImportVisitor, get_defined_names
+
+logger = logging.getLogger(__name__)
+
+# Helpers that the inliner copies into several functions are written once to a
+# wheel, the functions import them from it and declare the wheel and their
+# pinned third party imports in an ENVIRONMENT clause.
+
+
+@dataclass
+class SharedHelpers:
+    package: str
+    version: str
+    wheel_path: Path
+    module_code: str
+    # helper name to source in definition order
+    helpers: Dict[str, str] = field(default_factory=dict)
+    # helper names each function imports from the package
+    functions: Dict[str, List[str]] = field(default_factory=dict)
+
+
+def _top_level_definitions(code: str, helper_names: set) -> Dict[str, str]:
+    # helper name to the source of the statement defining it
+    definitions = {}
+    for node in ast.parse(code).body:
+        names = get_defined_names(node)
+        if len(names) == 1 and names <= helper_names:
+            definitions[names.pop()] = astor.to_source(node)
+    return definitions
+
+
+def _import_sources(code: str) -> Dict[str, str]:
+    # names bound by the top level imports to the import statement
+    imports = {}
+    for node in ast.parse(code).body:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                bound = alias.asname or alias.name.split(".")[0]
+                imports[bound] = astor.to_source(ast.Import(names=[alias])).strip()
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            for alias in node.names:
+                imports[alias.asname or alias.name] = astor.to_source(
+                    ast.ImportFrom(module=node.module, names=[alias], level=0)
+                ).strip()
+    return imports
+
+
+def _referenced_names(source: str) -> set:
+    return {
+        node.id for node in ast.walk(ast.parse(source)) if isinstance(node, ast.Name)
+    }
+
+
+def find_shared_helpers(
+    codes: Dict[str, str], helper_names: Dict[str, set], min_functions: int = 2
+) -> Dict[str, str]:
+    # helpers defined with the same source by at least min_functions functions.
+    # A helper is only shared when every helper it references is shared as well
+    # so that the package is self contained. Ordered by first definition.
+    definitions = {
+        name: _top_level_definitions(code, helper_names.get(name, set()))
+        for name, code in codes.items()
+    }
+    users: Dict[tuple, List[str]] = {}
+    for function_name, function_definitions in definitions.items():
+        for helper, source in function_definitions.items():
+            users.setdefault((helper, source), []).append(function_name)
+    candidates = {
+        key for key, functions in users.items() if len(functions) >= min_functions
+    }
+    # the same name with different sources can not live in one module
+    variants: Dict[str, int] = {}
+    for helper, _ in candidates:
+        variants[helper] = variants.get(helper, 0) + 1
+    shared = {key for key in candidates if variants[key[0]] == 1}
+    all_helpers = set().union(*helper_names.values()) if helper_names else set()
+    changed = True
+    while changed:
+        shared_names = {helper for helper, _ in shared}
+        unresolved = {
+            (helper, source)
+            for helper, source in shared
+            if (_referenced_names(source) & all_helpers) - shared_names - {helper}
+        }
+        shared -= unresolved
+        changed = bool(unresolved)
+    return {helper: source for helper, source in users if (helper, source) in shared}
+
+
+def get_third_party_requirements(code: str) -> List[str]:
+    # pinned to the installed version, modules without a distribution (local
+    # code) are skipped
+    visitor = ImportVisitor()
+    visitor.visit(ast.parse(code))
+    modules = {
+        (obj.module_path or obj.obj_name).split(".")[0] for obj in visitor.import_objs
+    }
+    distributions = importlib.metadata.packages_distributions()
+    requirements = set()
+    for module in modules:
+        if module in sys.stdlib_module_names or module == "__future__":
+            continue
+        for distribution in distributions.get(module, []):
+            version = importlib.metadata.version(distribution)
+            requirements.add(f"{distribution}=={version}")
+        if module not in distributions:
+            logger.warning("No installed distribution provides %s", module)
+    return sorted(requirements)
+
+
+def _record_hash(data: bytes) -> str:
+    digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest())
+    return f"sha256={digest.rstrip(b'=').decode('ascii')}"
+
+
+def build_wheel(directory: str, package: str, version: str, module_code: str) -> Path:
+    # a pure python wheel with the module as the package __init__
+    dist_info = f"{package}-{version}.dist-info"
+    files = {
+        f"{package}/__init__.py": module_code.encode("utf-8"),
+        f"{dist_info}/METADATA": (
+            f"Metadata-Version: 2.1\nName: {package}\nVersion: {version}\n"
+        ).encode("utf-8"),
+        f"{dist_info}/WHEEL": (
+            "Wheel-Version: 1.0\nGenerator: uc-functions\n"
+            "Root-Is-Purelib: true\nTag: py3-none-any\n"
+        ).encode("utf-8"),
+    }
+    record = [
+        f"{path},{_record_hash(data)},{len(data)}" for path, data in files.items()
+    ]
+    record.append(f"{dist_info}/RECORD,,")
+    files[f"{dist_info}/RECORD"] = ("\n".join(record) + "\n").encode("utf-8")
+
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    wheel_path = Path(directory) / f"{package}-{version}-py3-none-any.whl"
+    with zipfile.ZipFile(wheel_path, "w", zipfile.ZIP_DEFLATED) as wheel:
+        for path, data in files.items():
+            # fixed timestamps so the same helpers produce the same wheel
+            info = zipfile.ZipInfo(path, date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            wheel.writestr(info, data)
+    return wheel_path
+
+
+def build_module(helpers: Dict[str, str], codes: List[str]) -> str:
+    # the helpers with the imports they reference
+    import_sources = {}
+    for code in codes:
+        import_sources.update(_import_sources(code))
+    referenced = set().union(*[_referenced_names(s) for s in helpers.values()])
+    imports = sorted(
+        {source for name, source in import_sources.items() if name in referenced}
+    )
+    return RecursiveResolver.format(
+        "\n".join(imports) + "\n\n\n" + "\n\n".join(helpers.values())
+    )
+
+
+def strip_shared_helpers(code: str, helpers: Dict[str, str], package: str) -> str:
+    # replaces the inlined copies of the helpers with an import from the package
+    tree = ast.parse(code)
+    imported = []
+    body = []
+    for node in tree.body:
+        names = get_defined_names(node)
+        if len(names) == 1:
+            name = next(iter(names))
+            if helpers.get(name) == astor.to_source(node):
+                imported.append(name)
+                continue
+        body.append(node)
+    if not imported:
+        return code
+    tree.body = body
+    return RecursiveResolver.format(
+        f"from {package} import {', '.join(sorted(imported))}\n" + astor.to_source(tree)
+    )
+
+
+def get_package_name(catalog: str, schema: str) -> str:
+    return re.sub(r"\W", "_", f"uc_helpers_{catalog}_{schema}").lower()
+
+
+def package_shared_helpers(
+    codes: Dict[str, str],
+    helper_names: Dict[str, set],
+    volume_path: str,
+    package: str,
+    min_functions: int = 2,
+) -> Optional[SharedHelpers]:
+    # returns None when no helper is shared by enough functions
+    helpers = find_shared_helpers(codes, helper_names, min_functions=min_functions)
+    if not helpers:
+        return None
+    module_code = build_module(helpers, list(codes.values()))
+    # the version changes with the helpers so that the ddl, and the content
+    # hash of every function using them, changes as well
+    digest = hashlib.sha256(module_code.encode("utf-8")).hexdigest()
+    version = f"0.0.{int(digest[:12], 16)}"
+    wheel_path = build_wheel(volume_path, package, version, module_code)
+    shared = SharedHelpers(
+        package=package,
+        version=version,
+        wheel_path=wheel_path,
+        module_code=module_code,
+        helpers=helpers,
+    )
+    for name, code in codes.items():
+        used = sorted(
+            helper
+            for helper, source in _top_level_definitions(
+                code, helper_names.get(name, set())
+            ).items()
+            if helpers.get(helper) == source
+        )
+        if used:
+            shared.functions[name] = used
+    return shared
@@ -0,0 +1,91 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+import requests
+from databricks.sdk import WorkspaceClient
+from databricks.sdk.service.sql import ExternalLink
+
+# seconds to wait for a single result chunk download
+DOWNLOAD_TIMEOUT = 60
+
+
+def _import_pyarrow():
+    # pyarrow is only needed for arrow results, install uc-functions[arrow]
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError as e:
+        raise ImportError(
+            "pyarrow is required for arrow results, pip install uc-functions[arrow]"
+        ) from e
+    return pyarrow
+
+
+def iter_external_links(ws_client: WorkspaceClient, resp) -> Iterator[ExternalLink]:
+    # the links of the first chunk come with the statement response, the links of
+    # every following chunk are requested only when the previous ones are consumed
+    if resp.result is None:
+        return
+    links = list(resp.result.external_links or [])
+    while links:
+        next_chunk_index = None
+        for link in links:
+            yield link
+            next_chunk_index = link.next_chunk_index
+        if next_chunk_index is None:
+            return
+        chunk = ws_client.statement_execution.get_statement_result_chunk_n(
+            resp.statement_id, next_chunk_index
+        )
+        links = list(chunk.external_links or [])
+
+
+def download_link(link: ExternalLink, session: requests.Session) -> bytes:
+    # external links are presigned, sending the workspace auth headers would fail
+    resp = session.get(
+        link.external_link, headers=link.http_headers or {}, timeout=DOWNLOAD_TIMEOUT
+    )
+    resp.raise_for_status()
+    return resp.content
+
+
+def iter_arrow_batches(ws_client: WorkspaceClient, resp, prefetch: int = 4):
+    # chunks are downloaded concurrently, at most prefetch chunks are held ahead of
+    # the consumer and record batches are yielded in chunk order
+    pa = _import_pyarrow()
+    if prefetch < 1:
+        raise ValueError("Prefetch must be at least 1")
+    links = iter_external_links(ws_client, resp)
+    pending = deque()
+    with requests.Session() as session, ThreadPoolExecutor(
+        max_workers=prefetch
+    ) as pool:
+
+        def fill():
+            while len(pending) < prefetch:
+                link = next(links, None)
+                if link is None:
+                    return
+                pending.append(pool.submit(download_link, link, session))
+
+        try:
+            fill()
+            while pending:
+                data = pending.popleft().result()
+                fill()
+                with pa.ipc.open_stream(data) as reader:
+                    yield from reader
+        finally:
+            # the consumer stopped early, do not download the remaining chunks
+            for future in pending:
+                future.cancel()
+
+
+def iter_arrow_rows(
+    ws_client: WorkspaceClient, resp, prefetch: int = 4
+) -> Iterator[tuple]:
+    # typed python values, one tuple per row
+    for batch in iter_arrow_batches(ws_client, resp, prefetch=prefetch):
+        columns = [column.to_pylist() for column in batch.columns]
+        yield from zip(*columns)
@@ -0,0 +1,111 @@
+import asyncio
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, List, Set
+
+
+def topological_order(dependencies: Dict[str, Set[str]]) -> List[str]:
+    # Kahn's algorithm, ties are broken by insertion order so that the order is
+    # stable and matches registration order when there are no dependencies
+    remaining = {
+        name: set(deps) & dependencies.keys() for name, deps in dependencies.items()
+    }
+    order = []
+    ready = deque([name for name, deps in remaining.items() if not deps])
+    while ready:
+        name = ready.popleft()
+        order.append(name)
+        for other, deps in remaining.items():
+            if name in deps:
+                deps.remove(name)
+                if not deps:
+                    ready.append(other)
+    if len(order) != len(remaining):
+        cycle = [name for name in remaining if name not in order]
+        raise ValueError("Cyclic dependencies between functions:", cycle)
+    return order
+
+
+def run_dag(
+    dependencies: Dict[str, Set[str]],
+    task: Callable[[str], Any],
+    concurrency: int = 1,
+) -> Dict[str, BaseException]:
+    # runs task(name) for every node once all of its dependencies succeeded with at
+    # most `concurrency` tasks in flight. Nodes depending on a failed node are not
+    # run and are reported as failed as well.
+    if concurrency < 1:
+        raise ValueError("Concurrency must be at least 1")
+    order = topological_order(dependencies)
+    remaining = {
+        name: set(deps) & dependencies.keys() for name, deps in dependencies.items()
+    }
+    dependents: Dict[str, List[str]] = {name: [] for name in order}
+    for name in order:
+        for dep in remaining[name]:
+            dependents[dep].append(name)
+
+    errors: Dict[str, BaseException] = {}
+    ready = deque([name for name in order if not remaining[name]])
+
+    def skip_dependents(failed: str):
+        for dependent in dependents[failed]:
+            if dependent not in errors:
+                errors[dependent] = ValueError(
+                    f"Skipped {dependent} because its dependency {failed} failed"
+                )
+                skip_dependents(dependent)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        running = {}
+        while ready or running:
+            while ready and len(running) < concurrency:
+                name = ready.popleft()
+                running[pool.submit(task, name)] = name
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    errors[name] = future.exception()
+                    skip_dependents(name)
+                    continue
+                for dependent in dependents[name]:
+                    remaining[dependent].discard(name)
+                    if not remaining[dependent] and dependent not in errors:
+                        ready.append(dependent)
+    return errors
+
+
+async def arun_dag(
+    dependencies: Dict[str, Set[str]],
+    task: Callable[[str], Awaitable[Any]],
+    concurrency: int = 1,
+) -> Dict[str, BaseException]:
+    # asyncio counterpart of run_dag, every node is a coroutine waiting on its
+    # dependencies and a semaphore bounds how many tasks run at once
+    if concurrency < 1:
+        raise ValueError("Concurrency must be at least 1")
+    order = topological_order(dependencies)
+    semaphore = asyncio.Semaphore(concurrency)
+    errors: Dict[str, BaseException] = {}
+    nodes: Dict[str, asyncio.Task] = {}
+
+    async def run(name) -> bool:
+        for dep in sorted(set(dependencies[name]) & nodes.keys()):
+            if await nodes[dep] is False:
+                errors[name] = ValueError(
+                    f"Skipped {name} because its dependency {dep} failed"
+                )
+                return False
+        async with semaphore:
+            try:
+                await task(name)
+            except Exception as e:
+                errors[name] = e
+                return False
+        return True
+
+    for name in order:
+        nodes[name] = asyncio.ensure_future(run(name))
+    await asyncio.gather(*nodes.values())
+    return errors
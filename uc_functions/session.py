@@ -0,0 +1,43 @@
+import threading
+from typing import Optional
+
+from databricks.sdk import WorkspaceClient
+from databricks.sdk.config import Config
+
+
+class WorkspaceSession:
+
+    def __init__(
+        self,
+        workspace_client: WorkspaceClient = None,
+        max_connections: int = 32,
+        **config_kwargs,
+    ):
+        # the client is created on first use because constructing it resolves
+        # auth, afterwards every call shares its pooled http connections
+        self._client: Optional[WorkspaceClient] = workspace_client
+        self._lock = threading.Lock()
+        self.max_connections = max_connections
+        self.config_kwargs = config_kwargs
+
+    def _create_client(self) -> WorkspaceClient:
+        config = Config(
+            max_connection_pools=self.max_connections,
+            max_connections_per_pool=self.max_connections,
+            **self.config_kwargs,
+        )
+        return WorkspaceClient(config=config)
+
+    @property
+    def client(self) -> WorkspaceClient:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def get_client(self, workspace_client: WorkspaceClient = None) -> WorkspaceClient:
+        # an explicitly passed client always wins over the shared one
+        if workspace_client is not None:
+            return workspace_client
+        return self.client
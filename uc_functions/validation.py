@@ -0,0 +1,264 @@
+import multiprocessing
+import os
+import time
+from dataclasses import dataclass, field
+from multiprocessing.connection import wait as wait_connections
+from typing import Callable, Dict, List, Optional
+
+from uc_functions.functions import (
+    FunctionDeployment,
+    FunctionSerialized,
+    get_nested_sql_types,
+    load_original,
+    to_json_compatible,
+)
+from uc_functions.special_kwargs import DatabricksSecret
+
+# Differential validation of the generated bodies against the registered
+# functions. Every function runs in its own worker process so that a hanging or
+# crashing function only fails itself, at most processes functions run at once
+# and each gets timeout seconds. Results match when both sides return the same
+# value, table function rows are compared as tuples, or raise the same type of
+# exception. Inputs are provided per function or generated with hypothesis from
+# the sql types of remote_args, pip install uc-functions[validation].
+
+
+@dataclass
+class Mismatch:
+    args: tuple
+    original: str
+    inlined: str
+
+
+@dataclass
+class ValidationResult:
+    function: str
+    inputs: int
+    seconds: float = 0.0
+    mismatches: List[Mismatch] = field(default_factory=list)
+    # set when the worker failed to load the function, crashed or timed out
+    error: Optional[str] = None
+    timed_out: bool = False
+
+    @property
+    def passed(self) -> bool:
+        return self.error is None and not self.mismatches
+
+
+def _import_hypothesis():
+    try:
+        import hypothesis
+        import hypothesis.strategies
+    except ImportError as e:
+        raise ImportError(
+            "hypothesis is required to generate inputs, "
+            "pip install uc-functions[validation]"
+        ) from e
+    return hypothesis
+
+
+def strategy_for_sql_type(sql_type: str):
+    # values as the warehouse passes them to python udfs, structs are dicts
+    st = _import_hypothesis().strategies
+    sql_type = sql_type.strip()
+    scalars = {
+        "STRING": st.text(max_size=32),
+        "INTEGER": st.integers(min_value=-(2**31), max_value=2**31 - 1),
+        "FLOAT": st.floats(allow_nan=False, allow_infinity=False),
+        "BOOLEAN": st.booleans(),
+        "BINARY": st.binary(max_size=32),
+        "DECIMAL(38, 18)": st.decimals(
+            min_value=-(10**20), max_value=10**20, places=18
+        ),
+        "DATE": st.dates(),
+        "TIMESTAMP": st.datetimes(),
+    }
+    if sql_type in scalars:
+        return scalars[sql_type]
+    nested_types = get_nested_sql_types(sql_type)
+    if sql_type.startswith("ARRAY<"):
+        return st.lists(strategy_for_sql_type(nested_types["element"]), max_size=5)
+    if sql_type.startswith("MAP<"):
+        return st.dictionaries(
+            strategy_for_sql_type(nested_types["key"]),
+            strategy_for_sql_type(nested_types["value"]),
+            max_size=5,
+        )
+    if sql_type.startswith("STRUCT<"):
+        return st.fixed_dictionaries(
+            {
+                name: strategy_for_sql_type(field_type)
+                for name, field_type in nested_types.items()
+            }
+        )
+    raise ValueError(f"No strategy for SQL type: {sql_type}")
+
+
+def generate_inputs(
+    uc: FunctionDeployment, name: str, examples: int = 50
+) -> List[tuple]:
+    # derandomized so that the same functions always get the same corpus
+    hypothesis = _import_hypothesis()
+    st = hypothesis.strategies
+    uc.serialize_fn(name)
+    call_args = [
+        arg for arg in uc.get_function(name).args.values() if arg.default is None
+    ]
+    strategy = st.tuples(*[strategy_for_sql_type(arg.type) for arg in call_args])
+    generated = []
+
+    @hypothesis.settings(
+        max_examples=examples,
+        database=None,
+        derandomize=True,
+        suppress_health_check=list(hypothesis.HealthCheck),
+    )
+    @hypothesis.given(strategy)
+    def collect(args):
+        generated.append(args)
+
+    collect()
+    return generated
+
+
+def _normalize(value, table_columns: Optional[dict]):
+    # rows of the original table function are dataclasses, named tuples or
+    # dicts while the generated handler yields tuples
+    if table_columns is not None and isinstance(value, list):
+        rows = []
+        for row in value:
+            if isinstance(row, dict):
+                row = tuple(row[column] for column in table_columns)
+            elif hasattr(row, "__dataclass_fields__"):
+                row = tuple(getattr(row, column) for column in table_columns)
+            rows.append(to_json_compatible(tuple(row)))
+        return rows
+    return to_json_compatible(value)
+
+
+def _outcome(fn: Callable, args: tuple, kwargs: dict, table_columns):
+    try:
+        return "returned", _normalize(fn(*args, **kwargs), table_columns)
+    except Exception as e:
+        return "raised", f"{type(e).__name__}"
+
+
+def _describe(outcome) -> str:
+    kind, value = outcome
+    return f"{kind} {value!r}" if kind == "returned" else f"{kind} {value}"
+
+
+def validate_function(
+    original: Callable, serialized: FunctionSerialized, inputs: List[tuple]
+) -> List[Mismatch]:
+    # secrets are resolved by the warehouse, locally both sides get the default
+    kwargs = {
+        name: arg.default.default_value
+        for name, arg in serialized.args.items()
+        if isinstance(arg.default, DatabricksSecret)
+    }
+    original_fn = load_original(original)
+    inlined_fn = serialized.load_inlined()
+    mismatches = []
+    for args in inputs:
+        args = tuple(args)
+        expected = _outcome(original_fn, args, kwargs, serialized.table_columns)
+        actual = _outcome(inlined_fn, args, kwargs, serialized.table_columns)
+        if expected != actual:
+            mismatches.append(Mismatch(args, _describe(expected), _describe(actual)))
+    return mismatches
+
+
+def _worker(connection, original, serialized, inputs):
+    # module level so that it can be the target of a worker process
+    try:
+        connection.send(("ok", validate_function(original, serialized, inputs)))
+    except Exception as e:
+        connection.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        connection.close()
+
+
+def _process_context():
+    # fork keeps the registered functions importable in the worker, other start
+    # methods need them to be picklable by reference
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def validate(
+    uc: FunctionDeployment,
+    inputs: Dict[str, List[tuple]] = None,
+    names: List[str] = None,
+    examples: int = 50,
+    processes: int = None,
+    timeout: float = 60.0,
+) -> List[ValidationResult]:
+    # functions without provided inputs get examples generated ones, results
+    # are returned in registration order
+    inputs = inputs or {}
+    names = names or uc.function_names()
+    processes = processes or os.cpu_count() or 1
+    if processes < 1:
+        raise ValueError("processes must be at least 1")
+    pending = []
+    for name in names:
+        uc.serialize_fn(name)
+        function_inputs = inputs.get(name)
+        if function_inputs is None:
+            function_inputs = generate_inputs(uc, name, examples=examples)
+        pending.append((name, [tuple(args) for args in function_inputs]))
+
+    context = _process_context()
+    results = {name: ValidationResult(name, len(args)) for name, args in pending}
+    running = {}
+    while pending or running:
+        while pending and len(running) < processes:
+            name, function_inputs = pending.pop(0)
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_worker,
+                args=(
+                    sender,
+                    uc.get_original_function(name),
+                    uc.get_function(name),
+                    function_inputs,
+                ),
+                daemon=True,
+            )
+            process.start()
+            sender.close()
+            running[receiver] = (name, process, time.monotonic())
+
+        now = time.monotonic()
+        next_deadline = min(start + timeout for _, _, start in running.values())
+        for receiver in wait_connections(
+            list(running), timeout=max(0.0, next_deadline - now)
+        ):
+            name, process, start = running.pop(receiver)
+            result = results[name]
+            result.seconds = time.monotonic() - start
+            try:
+                status, value = receiver.recv()
+            except EOFError:
+                status, value = "error", f"Worker exited with {process.exitcode}"
+            if status == "ok":
+                result.mismatches = value
+            else:
+                result.error = value
+            receiver.close()
+            process.join()
+
+        now = time.monotonic()
+        for receiver, (name, process, start) in list(running.items()):
+            if now - start >= timeout:
+                process.terminate()
+                process.join()
+                receiver.close()
+                del running[receiver]
+                result = results[name]
+                result.seconds = now - start
+                result.timed_out = True
+                result.error = f"Timed out after {timeout}s"
+    return [results[name] for name in names]
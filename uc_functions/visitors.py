@@ -2,9 +2,12 @@ import ast
 import builtins
 import importlib
 import inspect
+import logging
 from dataclasses import dataclass
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 
 def is_library_module(module_name: str):
     if module_name == "builtins":
@@ -19,14 +22,16 @@ def is_library_module(module_name: str):
             # Attempt to get the file of the module
             module_file = inspect.getfile(module)
             if module_file is None:
-                print(f"{module_name} is probably local code.")
+                logger.debug("%s is probably local code.", module_name)
                 return False
             return is_library_path(module_file)
         except TypeError:
             if hasattr(module, "__file__"):
                 return is_library_path(module.__file__)
             else:
-                print(f"{module_name} is a built-in module or a namespace package.")
+                logger.debug(
+                    "%s is a built-in module or a namespace package.", module_name
+                )
                 return False
     except (ImportError, TypeError):
         return False
@@ -102,6 +107,17 @@ class ASTNameNodeMappingExtractor(ast.NodeVisitor):
         self.generic_visit(node)
 
 
+def get_defined_names(node: ast.AST) -> set:
+    # names bound by a top level statement, the same statements as above
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return {node.name}
+    if isinstance(node, ast.Assign):
+        return {t.id for t in node.targets if isinstance(t, ast.Name)}
+    if isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+        return {node.target.id}
+    return set()
+
+
 def is_from_libraries(name, globals_dict):
     probably_libs = ["site-packages", "lib-dynload", "dist-packages", "lib/python"]
     potential_paths = []
@@ -109,13 +125,13 @@ def is_from_libraries(name, globals_dict):
         potential_paths.append(globals_dict[name].__file__)
     invalid_names = ["DatabricksSecret"]
     if name in invalid_names:
-        print(f"{name} is a built in library class that should be ignored")
+        logger.debug("%s is a built in library class that should be ignored", name)
         return True
     potential_paths.append(inspect.getfile(globals_dict[name]))
     for path in potential_paths:
         for lib in probably_libs:
             if lib in path:
-                print(f"{name} is probably a library")
+                logger.debug("%s is probably a library", name)
                 return True
     return False
 
@@ -177,8 +193,9 @@ class ImportOptimizer(ast.NodeTransformer):
                 try:
                     tree.body.remove(self.imported_names[name])
                 except ValueError as e:
-                    print(f"Error removing import {name}: {e}; most likely removed")
-                    pass
+                    logger.debug(
+                        "Error removing import %s: %s; most likely removed", name, e
+                    )
 
 
 @dataclass
@@ -207,7 +224,7 @@ class FunctionMetadata:
             else:
                 return is_library_path(inspect.getfile(mod))
         except Exception as e:
-            print(f"Error checking if {self.module} is a library: {e}")
+            logger.debug("Error checking if %s is a library: %s", self.module, e)
             return False
 
 
@@ -279,7 +296,6 @@ class UnresolvedNamesFinder(ast.NodeVisitor):
                 if hasattr(arg, "arg") and arg.arg is not None:
                     self.defined_names.add(arg.arg)
         # todo add args as defined names
-        # print([arg.arg for arg in node.args.args])
         # self.defined_names.add(node.args)
         self.generic_visit(node)
 
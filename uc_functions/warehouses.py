@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Optional
+
+from databricks.sdk import WorkspaceClient
+from databricks.sdk.service.sql import State
+
+logger = logging.getLogger(__name__)
+
+# running warehouses answer immediately, starting ones are already warming up
+WAREHOUSE_STATE_PREFERENCE = {State.RUNNING: 0, State.STARTING: 1}
+
+
+class WarehouseResolver:
+
+    def __init__(self, warehouse_id: str = None, ttl: float = 300):
+        # a pinned warehouse id is always used as is and never looked up
+        self.warehouse_id = warehouse_id
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # warehouses belong to a workspace, so the looked up id and the time it
+        # was looked up are cached per client
+        self._cache: "weakref.WeakKeyDictionary[WorkspaceClient, tuple]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+
+    @staticmethod
+    def _pick(warehouses) -> Optional[object]:
+        candidates = [
+            warehouse
+            for warehouse in warehouses
+            if warehouse.enable_serverless_compute is not False
+        ]
+        if len(candidates) == 0:
+            return None
+        # sorted is stable so the first warehouse wins among equally warm ones
+        return sorted(
+            candidates,
+            key=lambda w: WAREHOUSE_STATE_PREFERENCE.get(w.state, 2),
+        )[0]
+
+    def _lookup(self, ws_client: WorkspaceClient):
+        warehouse = self._pick(ws_client.warehouses.list())
+        with self._lock:
+            if warehouse is None:
+                self._cache.pop(ws_client, None)
+            else:
+                self._cache[ws_client] = (warehouse.id, time.monotonic())
+        return warehouse
+
+    def _get_cached(self, ws_client: WorkspaceClient) -> Optional[str]:
+        with self._lock:
+            cached_id, cached_at = self._cache.get(ws_client, (None, 0.0))
+        if cached_id is None or time.monotonic() - cached_at > self.ttl:
+            return None
+        return cached_id
+
+    def resolve(self, ws_client: WorkspaceClient) -> Optional[str]:
+        if self.warehouse_id is not None:
+            return self.warehouse_id
+        cached = self._get_cached(ws_client)
+        if cached is not None:
+            return cached
+        warehouse = self._lookup(ws_client)
+        return None if warehouse is None else warehouse.id
+
+    @staticmethod
+    def _start_if_stopped(
+        ws_client: WorkspaceClient, warehouse_id: str, warehouse=None
+    ):
+        # warming is best effort, a warehouse that can not be inspected or
+        # started here is still started by the first statement sent to it
+        try:
+            if warehouse is None:
+                warehouse = ws_client.warehouses.get(warehouse_id)
+            if warehouse.state not in WAREHOUSE_STATE_PREFERENCE:
+                logger.info("Starting warehouse: %s", warehouse_id)
+                ws_client.warehouses.start(warehouse_id)
+        except Exception as e:
+            logger.warning("Unable to warm warehouse %s: %s", warehouse_id, e)
+
+    def warm(self, ws_client: WorkspaceClient) -> Future:
+        # resolves the warehouse in the background and starts it when it is
+        # stopped, so that it warms up while functions are being compiled. A
+        # freshly cached warehouse is used without listing the warehouses again.
+        # Only failing to look up an unpinned warehouse fails the future.
+        future = Future()
+
+        def run():
+            try:
+                if self.warehouse_id is not None:
+                    self._start_if_stopped(ws_client, self.warehouse_id)
+                    future.set_result(self.warehouse_id)
+                    return
+                cached = self._get_cached(ws_client)
+                if cached is not None:
+                    future.set_result(cached)
+                    return
+                warehouse = self._lookup(ws_client)
+                if warehouse is None:
+                    future.set_result(None)
+                    return
+                self._start_if_stopped(ws_client, warehouse.id, warehouse)
+                future.set_result(warehouse.id)
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future